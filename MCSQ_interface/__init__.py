@@ -17,7 +17,6 @@ def create_app():
 	app = Flask(__name__, instance_relative_config=False)
 	app.config.from_object('config.Config')
 	
-	app.config['JWT_SECRET_KEY'] = ''
 	jwt = JWTManager(app)
 
 	db.init_app(app)
@@ -32,6 +31,24 @@ def create_app():
 
 	app.app_context().push()
 	db.create_all()
+	from .metadata import metadata_cache
+	metadata_cache.start(app)
+	from .compression import init_compression
+	init_compression(app)
+	from . import routes
+	from . import api
+	from . import commands
+	return app
+
+def create_worker_app():
+	"""Construct the application of the background job workers: configuration and database only."""
+	app = Flask(__name__, instance_relative_config=False)
+	app.config.from_object('config.Config')
+
+	db.init_app(app)
+
+	app.app_context().push()
+	# The job functions use the search helpers of the modules that register the routes
 	from . import routes
 	return app
 
@@ -0,0 +1,503 @@
+import datetime
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from flask import request, jsonify, g
+from flask import current_app as app
+from flask_jwt_extended import create_access_token, decode_token
+from .models import db, User
+from .cache import normalize_parameter
+from .searches import *
+from .utils import *
+from .ngrams import search_collocations, get_collocations_dataframe
+
+# Versioned JSON API (/api/v1) for programmatic access to the searches.
+# A client gets a bearer token from /api/v1/token with the email and password of an activated account, and sends it
+# in the Authorization header of the other requests. The parameters have the same names as the fields of the search
+# forms, and can be sent as a JSON body or as query arguments. The endpoints call the same search functions as the
+# forms (so the result cache is shared), and return the results column by column:
+# {"columns": [...], "data": [[values of the first column], ...], "page": {...}}, where page has the total number of
+# results and the cursors of the previous and next pages (keyset pagination, see queries.py).
+
+API_VERSION = 'v1'
+
+API_TOKEN_SCOPE = 'api'
+
+SEARCH_TABLES = {'request': 'requestid', 'instruction': 'instructionid', 'introduction': 'introductionid',
+'response': 'responseid', 'survey_item': ''}
+
+ITEM_TYPE_OPTIONS = ['No filter', 'INTRODUCTION', 'INSTRUCTION', 'REQUEST', 'RESPONSE']
+
+MAX_COLLOCATIONS = 100
+
+
+def api_error(message, status=400):
+	"""
+	Builds the JSON response of an API error.
+	"""
+	return jsonify({'error': message}), status
+
+
+def get_api_user(token):
+	"""
+	Gets the user of an API token. The password reset tokens are also signed by JWTManager, but their identity is the
+	email only, so they are not accepted as API tokens.
+
+	Args:
+		param1 token (string): the bearer token.
+
+	Returns:
+		The activated user (User), or None if the token is invalid, expired or was not issued for the API.
+	"""
+	try:
+		identity = decode_token(token)['identity']
+	except Exception:
+		return None
+	if not isinstance(identity, dict) or identity.get('scope') != API_TOKEN_SCOPE:
+		return None
+
+	user = User.query.filter_by(email=identity.get('email')).first()
+	active = user is not None and user.is_active is True
+
+	db.session.close()
+	db.session.remove()
+
+	if not active:
+		return None
+	return user
+
+
+def api_token_required(function):
+	"""
+	Decorator of the API endpoints that require a valid bearer token (see get_api_user()).
+	"""
+	@functools.wraps(function)
+	def wrapper(*args, **kwargs):
+		authorization = request.headers.get('Authorization', '')
+		if not authorization.startswith('Bearer '):
+			return api_error('Missing bearer token.', 401)
+		if get_api_user(authorization[len('Bearer '):].strip()) is None:
+			return api_error('Invalid or expired token.', 401)
+		return function(*args, **kwargs)
+	return wrapper
+
+
+def get_api_parameters():
+	"""
+	Gets the parameters of an API request, from its JSON body or from its query arguments.
+	"""
+	parameters = request.get_json(silent=True)
+	if isinstance(parameters, dict):
+		return parameters
+	return request.values.to_dict()
+
+
+def get_flag(parameters, name):
+	"""
+	Gets a boolean parameter. JSON booleans are accepted, as well as 'true', '1', 'yes' and 'on' in query arguments.
+	"""
+	value = parameters.get(name)
+	if isinstance(value, str):
+		return value.strip().lower() in ['true', '1', 'yes', 'on']
+	return bool(value)
+
+
+def get_text(parameters, name):
+	"""
+	Gets a text parameter (e.g. the searched word). Missing parameters are empty strings.
+	"""
+	value = parameters.get(name)
+	if value is None:
+		return ''
+	return str(value)
+
+
+def get_filter(parameters, name):
+	"""
+	Gets a metadata filter (language/country, study, year or item type). Missing filters are 'No filter'.
+	"""
+	value = parameters.get(name)
+	if value is None or value == '':
+		return 'No filter'
+	return str(value)
+
+
+def dataframe_to_columns(df):
+	"""
+	Converts a dataframe of results to the column oriented JSON object of the API, with its pagination information (if any).
+	Missing values are sent as null.
+
+	Args:
+		param1 df (dataframe): a pandas dataframe containing the results of a search.
+
+	Returns:
+		The JSON object (dictionary).
+	"""
+	data = []
+	for i in range(len(df.columns)):
+		column = df.iloc[:, i].astype(object)
+		data.append(column.where(column.notna(), None).tolist())
+
+	results = {'columns': [str(column) for column in df.columns], 'data': data, 'rows': len(df.index)}
+	page = df.attrs.get('page')
+	if page:
+		results['page'] = page
+
+	return results
+
+
+def search_results_response(search, parameters):
+	"""
+	Runs a search of the API, and builds its JSON response (see dataframe_to_columns()).
+	The total number of results of paginated searches is also sent in the X-Total-Count header.
+
+	Args:
+		param1 search (function): the search, one of the values of API_SEARCHES.
+		param2 parameters (dict): the parameters of the request.
+
+	Returns:
+		The JSON response.
+	"""
+	df, error_message = search(parameters)
+	if error_message != '':
+		return api_error(error_message)
+
+	resp = jsonify(dataframe_to_columns(df))
+	page = df.attrs.get('page')
+	if page:
+		resp.headers["X-Total-Count"] = str(page['total'])
+
+	return resp
+
+
+@app.route('/api/'+API_VERSION+'/token', methods=['POST'])
+def api_token():
+	"""
+	Issues an API token for the email and password of an activated account.
+	The token expires after API_TOKEN_EXPIRES_HOURS hours.
+	"""
+	parameters = get_api_parameters()
+	email = parameters.get('email')
+	password = parameters.get('password')
+	if not email or not password:
+		return api_error('Enter a valid email and password.')
+
+	user = User.query.filter_by(email=email).first()
+	if user is None or not verify_password(user.password, password) or user.is_active is not True:
+		db.session.close()
+		db.session.remove()
+		return api_error('Wrong email or password, or account not confirmed.', 401)
+
+	expires = datetime.timedelta(hours=app.config['API_TOKEN_EXPIRES_HOURS'])
+	token = create_access_token({'email': user.email, 'scope': API_TOKEN_SCOPE}, expires_delta=expires)
+	db.session.close()
+	db.session.remove()
+
+	return jsonify({'access_token': token, 'token_type': 'Bearer', 'expires_in': int(expires.total_seconds())})
+
+
+def api_word_search(parameters):
+	"""
+	Word search in the Request, Instruction, Introduction or Response tables, or in all survey items (collection
+	'survey_item'). Same parameters as the word search form (word, langcountry, study, year, displaytagged, multiplew,
+	partial, casesensitive, regex), plus the cursor, direction and page_size of the page of results.
+
+	Returns:
+		A tuple with the dataframe of results and an error message (empty if the search is valid).
+	"""
+	collection = get_text(parameters, 'collection') or 'survey_item'
+	if collection not in SEARCH_TABLES:
+		return None, 'Unknown collection, use one of: '+', '.join(SEARCH_TABLES)+'.'
+
+	word = get_text(parameters, 'word')
+	if not word:
+		return None, 'Type at least one word to search for!'
+
+	multiple_words = get_flag(parameters, 'multiplew')
+	partial = get_flag(parameters, 'partial')
+	case_sensitive = get_flag(parameters, 'casesensitive')
+	regex_search = get_flag(parameters, 'regex')
+	error_message = check_search_restrictions(word, multiple_words, partial, case_sensitive, regex_search)
+	if error_message != '':
+		return None, error_message
+
+	df = call_appropriated_word_search_method(SEARCH_TABLES[collection], word, case_sensitive, partial, get_filter(parameters, 'langcountry'),
+		get_filter(parameters, 'year'), get_filter(parameters, 'study'), multiple_words, get_flag(parameters, 'displaytagged'), regex_search,
+		page=get_page(parameters))
+
+	return df, ''
+
+
+def api_alignment_search(parameters):
+	"""
+	Word search in the Alignment table. Same parameters as the alignment search form (source_word, target_word,
+	langcountrytarget, study, year, displaytagged, multiplew, partial, casesensitive, regex), plus the page of results.
+
+	Returns:
+		A tuple with the dataframe of results and an error message (empty if the search is valid).
+	"""
+	source_word = get_text(parameters, 'source_word')
+	target_word = get_text(parameters, 'target_word')
+	if not source_word and not target_word:
+		return None, 'Type at least a word in source or target text to search for.'
+
+	multiple_words = get_flag(parameters, 'multiplew')
+	partial = get_flag(parameters, 'partial')
+	case_sensitive = get_flag(parameters, 'casesensitive')
+	regex_search = get_flag(parameters, 'regex')
+	for word in [source_word, target_word]:
+		if word:
+			error_message = check_search_restrictions(word, multiple_words, partial, case_sensitive, regex_search)
+			if error_message != '':
+				return None, error_message
+
+	df = call_appropriated_word_search_method('alignment', [source_word, target_word], case_sensitive, partial, get_filter(parameters, 'langcountrytarget'),
+		get_filter(parameters, 'year'), get_filter(parameters, 'study'), multiple_words, get_flag(parameters, 'displaytagged'), regex_search,
+		page=get_page(parameters))
+
+	return df, ''
+
+
+def api_word_frequency(parameters):
+	"""
+	Word frequency. Same parameters as the word frequency form (word, langcountry, study, year, item_type, multiplew,
+	combined, facets).
+
+	Returns:
+		A tuple with the dataframe of results and an error message (empty if the search is valid).
+	"""
+	word = get_text(parameters, 'word')
+	if not word:
+		return None, 'Type at least one word to search for!'
+
+	multiple_words = get_flag(parameters, 'multiplew')
+	combined_frequency = get_flag(parameters, 'combined')
+	error_message = check_frequency_search_restrictions(word, multiple_words, combined_frequency)
+	if error_message != '':
+		return None, error_message
+
+	item_type = get_filter(parameters, 'item_type')
+	if item_type not in ITEM_TYPE_OPTIONS:
+		return None, 'Unknown item type, use one of: '+', '.join(ITEM_TYPE_OPTIONS)+'.'
+
+	if get_flag(parameters, 'facets'):
+		df = compute_word_frequency_by_facets(word, get_filter(parameters, 'langcountry'), get_filter(parameters, 'year'), get_filter(parameters, 'study'),
+			multiple_words, combined_frequency, item_type)
+	else:
+		df = compute_word_frequency(word, get_filter(parameters, 'langcountry'), get_filter(parameters, 'year'), get_filter(parameters, 'study'),
+			multiple_words, combined_frequency, item_type)
+
+	return df, ''
+
+
+def api_collocation(parameters):
+	"""
+	Collocations of a word, ranked by frequency. Same parameters as the collocation form (word, n_collocations,
+	langcountry, study, year, item_type, trigram).
+
+	Returns:
+		A tuple with the dataframe of results and an error message (empty if the search is valid).
+	"""
+	word = get_text(parameters, 'word')
+	if not word:
+		return None, 'Type at least one word to search for!'
+	error_message = check_collocation_search_restrictions(word)
+	if error_message != '':
+		return None, error_message
+
+	try:
+		n_collocations = int(parameters.get('n_collocations') or 10)
+	except (ValueError, TypeError):
+		n_collocations = 0
+	if n_collocations < 1 or n_collocations > MAX_COLLOCATIONS:
+		return None, 'The number of collocations must be between 1 and '+str(MAX_COLLOCATIONS)+'.'
+
+	item_type = get_filter(parameters, 'item_type')
+	if item_type not in ITEM_TYPE_OPTIONS:
+		return None, 'Unknown item type, use one of: '+', '.join(ITEM_TYPE_OPTIONS)+'.'
+
+	measure = 'trigram' if get_flag(parameters, 'trigram') else 'bigram'
+	collocations = search_collocations(word, get_filter(parameters, 'langcountry'), get_filter(parameters, 'year'),
+		get_filter(parameters, 'study'), item_type, measure, n_collocations)
+	if collocations is None:
+		return pd.DataFrame(), ''
+
+	return get_collocations_dataframe(collocations, measure), ''
+
+
+def api_pos_tag_search(parameters):
+	"""
+	Part-of-Speech tag sequence search. The tags are a JSON list, or a semicolon separated string (e.g. DET;NOUN).
+	Same filters as the POS tag sequence form (langcountry, study, year, item_type, partial), plus the page of results.
+
+	Returns:
+		A tuple with the dataframe of results and an error message (empty if the search is valid).
+	"""
+	tags = parameters.get('tags') or []
+	if isinstance(tags, str):
+		tags = tags.split(';')
+	tag_filters = [tag for tag in tags if tag and tag != 'No filter']
+	if len(tag_filters) < 1:
+		return None, 'Select at least one Part-of-Speech tag!'
+	unknown_tags = [tag for tag in tag_filters if tag not in get_pos_tag_options()]
+	if unknown_tags:
+		return None, 'Unknown Part-of-Speech tags: '+', '.join(str(tag) for tag in unknown_tags)+'.'
+
+	country_language = get_filter(parameters, 'langcountry')
+	study = get_filter(parameters, 'study')
+	year = get_filter(parameters, 'year')
+	if study == 'No filter' and country_language == 'No filter' and year == 'No filter':
+		return None, 'Select at least one of the Study, Year or Language/country filters!'
+
+	item_type = get_filter(parameters, 'item_type')
+	if item_type not in ITEM_TYPE_OPTIONS:
+		return None, 'Unknown item type, use one of: '+', '.join(ITEM_TYPE_OPTIONS)+'.'
+
+	df = search_by_pos_tag_sequence(tag_filters, country_language, year, study, item_type, get_flag(parameters, 'partial'), page=get_page(parameters))
+
+	return df, ''
+
+
+def api_questionnaire(parameters):
+	"""
+	Retrieves a questionnaire (or set of questionnaires). Same parameters as the display questionnaire form
+	(langcountry, study, year, displaytagged), plus the page of results.
+
+	Returns:
+		A tuple with the dataframe of results and an error message (empty if the search is valid).
+	"""
+	country_language = get_filter(parameters, 'langcountry')
+	study = get_filter(parameters, 'study')
+	year = get_filter(parameters, 'year')
+	error_message = check_questionnaire_filters(country_language, year, study)
+	if error_message != '':
+		return None, error_message
+
+	df = get_questionnaire(country_language, year, study, get_flag(parameters, 'displaytagged'), page=get_page(parameters))
+
+	return df, ''
+
+
+API_SEARCHES = {'search': api_word_search, 'alignment': api_alignment_search, 'frequency': api_word_frequency,
+'collocation': api_collocation, 'postag': api_pos_tag_search, 'questionnaire': api_questionnaire}
+
+
+@app.route('/api/'+API_VERSION+'/search/<collection>', methods=['GET', 'POST'])
+@api_token_required
+def api_word_search_endpoint(collection):
+	"""
+	Word search endpoint (see api_word_search()).
+	"""
+	parameters = get_api_parameters()
+	parameters['collection'] = collection
+	return search_results_response(api_word_search, parameters)
+
+
+@app.route('/api/'+API_VERSION+'/<search>', methods=['GET', 'POST'])
+@api_token_required
+def api_search_endpoint(search):
+	"""
+	Alignment search, word frequency, collocation, POS tag sequence search and questionnaire endpoints (see API_SEARCHES).
+	"""
+	if search not in API_SEARCHES or search == 'search':
+		return api_error('Unknown endpoint.', 404)
+	return search_results_response(API_SEARCHES[search], get_api_parameters())
+
+
+def get_search_key(search, parameters):
+	"""
+	Builds the key of a search of a batch, with its normalized parameters (see cache.normalize_parameter()),
+	so identical searches are run once.
+	"""
+	normalized = {name: normalize_parameter(value) for name, value in parameters.items() if name != 'type'}
+	return search+'|'+json.dumps(normalized, sort_keys=True, default=str)
+
+
+def is_statement_timeout(error):
+	"""
+	Checks if a database error was raised because the query exceeded the statement timeout (SQLSTATE 57014).
+	"""
+	return getattr(getattr(error, 'orig', None), 'pgcode', None) == '57014'
+
+
+def run_batch_search(flask_app, search, parameters, timeout):
+	"""
+	Runs a search of a batch in a worker thread, with a time limit for each of its queries. The limit is the
+	statement_timeout of every transaction of the worker's application context (see queries.apply_statement_timeout()).
+
+	Args:
+		param1 flask_app (Flask): the application, whose context is used by the worker thread.
+		param2 search (function): the search, one of the values of API_SEARCHES.
+		param3 parameters (dict): the parameters of the search.
+		param4 timeout (int): the time limit of each query of the search, in seconds.
+
+	Returns:
+		The JSON object of the results (see dataframe_to_columns()), or of the error.
+	"""
+	with flask_app.app_context():
+		try:
+			g.statement_timeout = int(timeout*1000)
+			df, error_message = search(parameters)
+			if error_message != '':
+				return {'error': error_message}
+			return dataframe_to_columns(df)
+		except Exception as e:
+			if is_statement_timeout(e):
+				return {'error': 'The search exceeded the time limit of '+str(timeout)+' seconds.'}
+			flask_app.logger.exception('Batch search failed')
+			return {'error': 'The search failed.'}
+		finally:
+			db.session.close()
+			db.session.remove()
+
+
+@app.route('/api/'+API_VERSION+'/batch', methods=['POST'])
+@api_token_required
+def api_batch():
+	"""
+	Runs a list of searches concurrently, on a pool of BATCH_MAX_WORKERS threads. The body is a JSON object with a
+	'searches' list, where each search has a 'type' (a key of API_SEARCHES, 'search' by default) and the parameters of
+	the corresponding endpoint, e.g. {"type": "search", "collection": "survey_item", "word": "health", "langcountry": "SPA_ES"}.
+	Identical searches are run once. The results are streamed as they finish, as JSON lines tagged with the index of
+	the search in the list: {"index": 3, "columns": [...], "data": [...]} or {"index": 3, "error": "..."}.
+	"""
+	parameters = request.get_json(silent=True)
+	searches = parameters.get('searches') if isinstance(parameters, dict) else None
+	if not isinstance(searches, list) or not searches:
+		return api_error('Send a JSON object with a non-empty list of searches.')
+	if len(searches) > app.config['BATCH_MAX_SEARCHES']:
+		return api_error('A batch can have at most '+str(app.config['BATCH_MAX_SEARCHES'])+' searches.')
+
+	indices = {}
+	specs = {}
+	errors = []
+	for index, spec in enumerate(searches):
+		if not isinstance(spec, dict):
+			errors.append({'index': index, 'error': 'Each search must be a JSON object.'})
+			continue
+		search = spec.get('type') or 'search'
+		if search not in API_SEARCHES:
+			errors.append({'index': index, 'error': 'Unknown search type, use one of: '+', '.join(API_SEARCHES)+'.'})
+			continue
+		key = get_search_key(search, spec)
+		indices.setdefault(key, []).append(index)
+		specs[key] = (API_SEARCHES[search], spec)
+
+	flask_app = app._get_current_object()
+	timeout = flask_app.config['BATCH_QUERY_TIMEOUT']
+
+	def generate():
+		for error in errors:
+			yield json.dumps(error)+'\n'
+		executor = ThreadPoolExecutor(max_workers=flask_app.config['BATCH_MAX_WORKERS'])
+		try:
+			futures = {executor.submit(run_batch_search, flask_app, search, spec, timeout): key for key, (search, spec) in specs.items()}
+			for future in as_completed(futures):
+				results = future.result()
+				for index in indices[futures[future]]:
+					yield json.dumps(dict(results, index=index))+'\n'
+		finally:
+			executor.shutdown(wait=False, cancel_futures=True)
+
+	return flask_app.response_class(generate(), mimetype='application/x-ndjson')
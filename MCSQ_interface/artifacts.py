@@ -0,0 +1,208 @@
+import datetime
+import gzip
+import hashlib
+import itertools
+import os
+from flask import current_app, request
+from . import db
+from .cache import get_corpus_version, get_result_cache
+from .compression import get_response_encoding, get_compressor, compress_chunks
+from .metadata import metadata_cache
+from .queries import stream_query
+from .searches import build_questionnaire_query, build_alignment_query, build_alignment_for_tmx_query
+from .tmx import iterTMX
+from .utils import rows_to_tsv
+
+# Precomputed export artifacts.
+# The canonical exports (the questionnaire, alignment and TMX of each study, year and country_language) are rendered by
+# the build-export-artifacts command to gzip compressed files in EXPORT_ARTIFACT_DIR. The name of each file is a hash
+# of the export filters and of the corpus version (see cache.get_corpus_version()), so a corpus change makes the
+# existing files stale: they are not served anymore, and are removed by the next build.
+# The download routes serve the artifacts with an ETag and a Last-Modified header, so conditional GET requests are
+# answered with 304, and fall back to the live export for the combinations that were not built.
+
+ARTIFACT_KINDS = ['questionnaire', 'alignment', 'tmx']
+
+CHUNK_SIZE = 64*1024
+
+
+def get_artifact_key(kind, country_language, year, study, displaytagged=False):
+	"""
+	Builds the key of an export artifact from the filters selected by the user.
+
+	Args:
+		param1 kind (string): the export, 'questionnaire', 'alignment' or 'tmx'.
+		param2 country_language (string): country and language questionnaire metadata.
+		param3 year (string): year metadata. Indicates in which year a given study was released.
+		param4 study (string): study questionnaire metadata.
+		param5 displaytagged (string): indicates if the export includes the Part-of-Speech and Named Entity Recognition annotations.
+
+	Returns:
+
+		The key (string).
+	"""
+	return '|'.join([kind, str(country_language), str(year), str(study), 'tagged' if displaytagged else 'plain'])
+
+
+def get_artifact_path(key, version):
+	"""
+	Gets the path of the file of an export artifact, for a given corpus version.
+	"""
+	name = hashlib.sha1((key+'|'+str(version)).encode('utf-8')).hexdigest()
+	return os.path.join(current_app.config['EXPORT_ARTIFACT_DIR'], name+'.gz')
+
+
+def get_artifact_export(kind, country_language, year, study, displaytagged=False):
+	"""
+	Gets the query and the writer of an export (see utils.stream_export()).
+
+	Returns:
+
+		A tuple with the query (SearchQuery) and the function that writes its batches of rows as the exported file.
+	"""
+	if kind == 'tmx':
+		query, labels = build_alignment_for_tmx_query(country_language, year, study)
+		return query, lambda batches: iterTMX(batches, 'en', labels[2], adminlang='en', segtype='phrase', datatype='PlainText', oEncoding='UTF-8')
+
+	if kind == 'questionnaire':
+		query, labels = build_questionnaire_query(country_language, year, study, displaytagged)
+	else:
+		query, labels = build_alignment_query(country_language, year, study, displaytagged)
+	return query, lambda batches: itertools.chain([rows_to_tsv([labels])], (rows_to_tsv(rows) for rows in batches))
+
+
+def write_artifact(path, query, write):
+	"""
+	Renders an export to a gzip compressed file. The file is written under a temporary name and then renamed,
+	so a partially written artifact is never served.
+
+	Returns:
+
+		True if the artifact was written, False if the export has no results (no file is written).
+	"""
+	batches = stream_query(query, current_app.config['EXPORT_BATCH_SIZE'])
+	first_batch = next(batches, None)
+	if first_batch is None:
+		return False
+
+	temporary_path = path+'.tmp'
+	try:
+		with gzip.open(temporary_path, 'wb', compresslevel=current_app.config['EXPORT_ARTIFACT_COMPRESSION_LEVEL']) as artifact:
+			for chunk in write(itertools.chain([first_batch], batches)):
+				artifact.write(chunk)
+	finally:
+		batches.close()
+	os.replace(temporary_path, path)
+	return True
+
+
+def build_export_artifacts():
+	"""
+	Renders the export artifacts of every study, year and country_language of the corpus that are missing for the
+	current corpus version, and removes the stale ones.
+
+	Returns:
+
+		The number of artifacts built, kept and removed (tuple of integers).
+	"""
+	directory = current_app.config['EXPORT_ARTIFACT_DIR']
+	os.makedirs(directory, exist_ok=True)
+	version = get_corpus_version()
+	metadata_cache.load()
+
+	combinations = set()
+	for survey in metadata_cache.get_surveys():
+		study = 'SHARE' if survey['study'] == 'SHA' else survey['study']
+		combinations.add((survey['country_language'], str(survey['year']), study))
+
+	built = 0
+	kept = 0
+	current = set()
+	for country_language, year, study in sorted(combinations):
+		for kind in ARTIFACT_KINDS:
+			for displaytagged in ([False] if kind == 'tmx' else [False, True]):
+				path = get_artifact_path(get_artifact_key(kind, country_language, year, study, displaytagged), version)
+				current.add(os.path.basename(path))
+				if os.path.exists(path):
+					kept += 1
+				elif write_artifact(path, *get_artifact_export(kind, country_language, year, study, displaytagged)):
+					built += 1
+
+	db.session.close()
+	db.session.remove()
+
+	removed = 0
+	for name in os.listdir(directory):
+		if name not in current:
+			os.remove(os.path.join(directory, name))
+			removed += 1
+
+	return built, kept, removed
+
+
+def read_artifact(path, decompress):
+	"""
+	Reads an artifact file in chunks, decompressing it or not.
+	"""
+	if decompress:
+		artifact = gzip.open(path, 'rb')
+	else:
+		artifact = open(path, 'rb')
+	with artifact:
+		while True:
+			chunk = artifact.read(CHUNK_SIZE)
+			if not chunk:
+				break
+			yield chunk
+
+
+def serve_export_artifact(kind, country_language, year, study, displaytagged, filename, content_type):
+	"""
+	Serves a precomputed export artifact, if it was built for the current corpus version. Clients that accept gzip
+	get the compressed file as it is stored, the others get it decompressed on the fly, and compressed again with the
+	content coding they accept, if any (see compression.get_response_encoding()). The content coding is negotiated here,
+	and not when the response is compressed, so the ETag compared by conditional GET requests (If-None-Match,
+	If-Modified-Since, answered with 304 when the client copy is current) is the one of the representation sent.
+
+	Args:
+		param1 kind (string): the export, 'questionnaire', 'alignment' or 'tmx'.
+		param2 country_language (string): country and language questionnaire metadata.
+		param3 year (string): year metadata. Indicates in which year a given study was released.
+		param4 study (string): study questionnaire metadata.
+		param5 displaytagged (string): indicates if the export includes the Part-of-Speech and Named Entity Recognition annotations.
+		param6 filename (string): the name of the downloaded file.
+		param7 content_type (string): the content type of the file.
+
+	Returns:
+
+		The response, or None if the artifact was not built (the export has to be generated live).
+	"""
+	version = get_result_cache().get_version()
+	path = get_artifact_path(get_artifact_key(kind, country_language, year, study, displaytagged), version)
+	try:
+		modified = os.path.getmtime(path)
+	except OSError:
+		return None
+
+	compressed = 'gzip' in request.accept_encodings
+	etag = os.path.basename(path)[:-len('.gz')]
+	if compressed:
+		encoding = 'gzip'
+		resp = current_app.response_class(read_artifact(path, False))
+		resp.content_length = os.path.getsize(path)
+	else:
+		encoding = get_response_encoding(content_type, current_app.config)
+		chunks = read_artifact(path, True)
+		if encoding is not None:
+			chunks = compress_chunks(chunks, get_compressor(encoding, current_app.config))
+		resp = current_app.response_class(chunks)
+	resp.headers["Content-Disposition"] = "attachment; filename="+filename
+	resp.headers["Content-Type"] = content_type
+	resp.headers["Vary"] = "Accept-Encoding"
+	if encoding is not None:
+		resp.headers["Content-Encoding"] = encoding
+		etag = etag+'-'+encoding
+	resp.set_etag(etag)
+	resp.last_modified = datetime.datetime.fromtimestamp(modified, datetime.timezone.utc)
+
+	return resp.make_conditional(request)
@@ -0,0 +1,214 @@
+import functools
+import pickle
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+from flask import current_app
+from . import db
+from .schema import CORPUS_VERSION_QUERY
+
+# Process-wide cache of search results. Entries are evicted in least recently used order once the cache exceeds its size in bytes,
+# expire after a fixed time to live, and are all dropped when the corpus version changes (see get_corpus_version()) or the
+# token frequencies are refreshed, as the frequency searches then switch between the live and the precomputed counts.
+# The versions are checked at most once every RESULT_CACHE_VERSION_CHECK_INTERVAL seconds, so cache hits do not touch PostgreSQL.
+
+
+def get_corpus_version():
+	"""
+	Returns the corpus version, which is increased whenever the Survey, Survey item or Alignment tables are modified
+	(see schema.get_corpus_version_ddl()).
+
+	Returns:
+
+		The corpus version (integer), 0 if the schema was not upgraded yet.
+	"""
+	version = db.session.execute(CORPUS_VERSION_QUERY).scalar()
+
+	db.session.close()
+	db.session.remove()
+
+	return int(version or 0)
+
+
+def get_cache_versions():
+	"""
+	Returns the versions that invalidate the cached results: the corpus version and the corpus version from which the
+	token frequencies were last refreshed.
+
+	Returns:
+
+		A tuple with both versions (integers, 0 if not available).
+	"""
+	versions = db.session.execute("select ("+CORPUS_VERSION_QUERY+"), (select max(corpus_version) from token_frequency_refresh)").fetchone()
+
+	db.session.close()
+	db.session.remove()
+
+	return int(versions[0] or 0), int(versions[1] or 0)
+
+
+def get_result_size(value):
+	"""
+	Estimates the size in bytes of a search result.
+	"""
+	if isinstance(value, pd.DataFrame):
+		return int(value.memory_usage(index=True, deep=True).sum())
+	if isinstance(value, (tuple, list)):
+		return sum(get_result_size(v) for v in value)
+	return len(pickle.dumps(value))
+
+
+def copy_result(value):
+	"""
+	Copies a search result, so the callers can modify the dataframes they get without changing the cached ones.
+	"""
+	if isinstance(value, pd.DataFrame):
+		return value.copy()
+	if isinstance(value, tuple):
+		return tuple(copy_result(v) for v in value)
+	if isinstance(value, list):
+		return [copy_result(v) for v in value]
+	return value
+
+
+def normalize_parameter(value):
+	"""
+	Normalizes a search parameter for the cache key. Unset form fields may come as None or as empty strings,
+	neither of which changes the results. Text parameters are kept as they are, as whitespace is part of the partial,
+	case sensitive and regex searches.
+	"""
+	if value is None or value is False or value == '':
+		return False
+	if isinstance(value, list):
+		return tuple(normalize_parameter(v) for v in value)
+	return value
+
+
+class ResultCache:
+	"""
+	Byte-size-bounded LRU cache with a time to live and corpus version invalidation.
+	"""
+	def __init__(self, max_bytes, ttl, version_check_interval):
+		self.max_bytes = max_bytes
+		self.ttl = ttl
+		self.version_check_interval = version_check_interval
+		self.entries = OrderedDict()
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+		self.version = None
+		self.frequency_version = None
+		self.version_checked = 0
+		self.lock = threading.Lock()
+
+	def check_version(self):
+		"""
+		Drops all entries if the corpus version or the token frequencies version changed since the last check.
+		"""
+		now = time.monotonic()
+		if self.version is not None and now - self.version_checked < self.version_check_interval:
+			return
+		version, frequency_version = get_cache_versions()
+		with self.lock:
+			if version != self.version or frequency_version != self.frequency_version:
+				self.entries.clear()
+				self.size = 0
+				self.version = version
+				self.frequency_version = frequency_version
+			self.version_checked = now
+
+	def get_version(self):
+		"""
+		Returns the corpus version stamp, checked at most once every version check interval.
+		"""
+		self.check_version()
+		return self.version
+
+	def get(self, key):
+		"""
+		Looks up a key in the cache.
+
+		Returns:
+
+			A tuple with a boolean indicating if the key was found and the cached value (or None).
+		"""
+		self.check_version()
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is not None and entry[2] > time.monotonic():
+				self.entries.move_to_end(key)
+				self.hits += 1
+				return True, entry[0]
+			if entry is not None:
+				del self.entries[key]
+				self.size -= entry[1]
+			self.misses += 1
+			return False, None
+
+	def put(self, key, value):
+		"""
+		Stores a value in the cache, evicting the least recently used entries if the cache gets too big.
+		Values bigger than the cache itself are not stored.
+		"""
+		size = get_result_size(value)
+		if size > self.max_bytes:
+			return
+		with self.lock:
+			if key in self.entries:
+				self.size -= self.entries.pop(key)[1]
+			self.entries[key] = (value, size, time.monotonic()+self.ttl)
+			self.size += size
+			while self.size > self.max_bytes:
+				_, entry = self.entries.popitem(last=False)
+				self.size -= entry[1]
+
+	def clear(self):
+		"""
+		Drops all entries.
+		"""
+		with self.lock:
+			self.entries.clear()
+			self.size = 0
+
+	def get_stats(self):
+		"""
+		Returns the cache counters (dictionary).
+		"""
+		with self.lock:
+			return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries),
+			'bytes': self.size, 'max_bytes': self.max_bytes, 'corpus_version': self.version,
+			'token_frequency_version': self.frequency_version}
+
+
+result_cache = None
+
+
+def get_result_cache():
+	"""
+	Returns the process-wide result cache, creating it with the settings of the application config on first use.
+	"""
+	global result_cache
+	if result_cache is None:
+		result_cache = ResultCache(current_app.config['RESULT_CACHE_MAX_BYTES'], current_app.config['RESULT_CACHE_TTL'],
+			current_app.config['RESULT_CACHE_VERSION_CHECK_INTERVAL'])
+	return result_cache
+
+
+def cached_result(function):
+	"""
+	Decorator that caches the results of a search function, keyed on the function name and its normalized parameters.
+	"""
+	@functools.wraps(function)
+	def wrapper(*args, **kwargs):
+		cache = get_result_cache()
+		key = (function.__name__, tuple(normalize_parameter(arg) for arg in args),
+			tuple(sorted((name, normalize_parameter(value)) for name, value in kwargs.items())))
+		found, value = cache.get(key)
+		if not found:
+			value = function(*args, **kwargs)
+			cache.put(key, copy_result(value))
+			return value
+		return copy_result(value)
+
+	return wrapper
@@ -0,0 +1,172 @@
+try:
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+except ImportError:
+	pa = None
+
+# Columnar export formats (Parquet, Arrow IPC stream and Feather, i.e. Arrow IPC file).
+# The files are built from Arrow record batches: the rows read from the database (or the dataframe of a computed result)
+# are transposed into typed columns, and the metadata columns, which repeat a few distinct values, are dictionary encoded.
+# Streamed exports keep one dictionary per column for the whole file, growing it with the values of each batch, so
+# later batches only add dictionary deltas and the same value always has the same index.
+# pyarrow is an optional dependency: without it, only the TSV format is offered.
+
+EXPORT_FORMATS = {
+	'parquet': ('application/vnd.apache.parquet', '.parquet'),
+	'arrow': ('application/vnd.apache.arrow.stream', '.arrow'),
+	'feather': ('application/vnd.apache.arrow.file', '.feather'),
+}
+
+DICTIONARY_COLUMNS = ['country_language', 'item_name', 'item_type', 'study', 'Surveys']
+
+INTEGER_COLUMNS = ['moduleid', 'year', 'Occurrences']
+
+
+def columnar_formats_available():
+	"""
+	Checks if pyarrow is installed, so the columnar formats can be offered.
+	"""
+	return pa is not None
+
+
+def get_column_type(label):
+	"""
+	Gets the Arrow type of a column of a streamed export, from its label.
+	"""
+	if label in DICTIONARY_COLUMNS:
+		return pa.dictionary(pa.int32(), pa.string())
+	if label in INTEGER_COLUMNS:
+		return pa.int64()
+	return pa.string()
+
+
+class ChunkStream:
+	"""
+	Write-only file that keeps what was written until it is read, so a file can be streamed while it is being written.
+	"""
+	def __init__(self):
+		self.chunks = []
+		self.position = 0
+		self.closed = False
+
+	def write(self, data):
+		data = bytes(data)
+		self.chunks.append(data)
+		self.position += len(data)
+		return len(data)
+
+	def tell(self):
+		return self.position
+
+	def flush(self):
+		pass
+
+	def close(self):
+		self.closed = True
+
+	def read(self):
+		data = b''.join(self.chunks)
+		self.chunks = []
+		return data
+
+
+class ColumnarWriter:
+	"""
+	Writes record batches as a Parquet, Arrow IPC stream or Feather file.
+	"""
+	def __init__(self, schema, export_format):
+		self.stream = ChunkStream()
+		if export_format == 'parquet':
+			self.writer = pq.ParquetWriter(self.stream, schema)
+		elif export_format == 'feather':
+			self.writer = pa.ipc.new_file(self.stream, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+		else:
+			self.writer = pa.ipc.new_stream(self.stream, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+		self.parquet = export_format == 'parquet'
+
+	def write(self, batch):
+		"""
+		Writes a record batch, and returns the bytes of the file written so far.
+		"""
+		if self.parquet:
+			self.writer.write_table(pa.Table.from_batches([batch]))
+		else:
+			self.writer.write_batch(batch)
+		return self.stream.read()
+
+	def close(self):
+		"""
+		Finishes the file, and returns its last bytes.
+		"""
+		self.writer.close()
+		return self.stream.read()
+
+
+def iter_columnar(batches, labels, export_format):
+	"""
+	Writes the batches of rows of a streamed export as a columnar file, one record batch per batch of rows.
+
+	Args:
+		param1 batches (iterable): lists of rows, with one value per label.
+		param2 labels (list): the labels (strings) of the columns.
+		param3 export_format (string): 'parquet', 'arrow' or 'feather'.
+
+	Returns:
+
+		A generator of chunks of the file (bytes).
+	"""
+	schema = pa.schema([(label, get_column_type(label)) for label in labels])
+	dictionaries = {label: {} for label in labels if label in DICTIONARY_COLUMNS}
+	writer = ColumnarWriter(schema, export_format)
+
+	for rows in batches:
+		columns = list(zip(*rows))
+		arrays = []
+		for label, field, column in zip(labels, schema, columns):
+			if label in dictionaries:
+				values = dictionaries[label]
+				indices = pa.array([None if value is None else values.setdefault(value, len(values)) for value in column], pa.int32())
+				arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(list(values), pa.string())))
+			else:
+				arrays.append(pa.array(column, field.type))
+		data = writer.write(pa.RecordBatch.from_arrays(arrays, schema=schema))
+		if data:
+			yield data
+
+	yield writer.close()
+
+
+def dataframe_to_columnar(df, export_format):
+	"""
+	Writes a dataframe (a computed result, e.g. a comparison or a frequency table) as a columnar file.
+	The dataframe is converted to a single record batch, and its metadata string columns are dictionary encoded.
+	Repeated column names (the comparisons put the columns of each questionnaire side by side) are numbered, e.g. Text_2.
+
+	Args:
+		param1 df (dataframe): the pandas dataframe.
+		param2 export_format (string): 'parquet', 'arrow' or 'feather'.
+
+	Returns:
+
+		The file (bytes).
+	"""
+	names = []
+	bases = []
+	counts = {}
+	for name in df.columns:
+		name = str(name)
+		counts[name] = counts.get(name, 0)+1
+		names.append(name if counts[name] == 1 else name+'_'+str(counts[name]))
+		bases.append(name)
+	df = df.set_axis(names, axis=1)
+
+	batch = pa.RecordBatch.from_pandas(df, preserve_index=False)
+	arrays = []
+	for base, array in zip(bases, batch.columns):
+		if base in DICTIONARY_COLUMNS and pa.types.is_string(array.type):
+			array = array.dictionary_encode()
+		arrays.append(array)
+	batch = pa.RecordBatch.from_arrays(arrays, names=batch.schema.names)
+
+	writer = ColumnarWriter(batch.schema, export_format)
+	return writer.write(batch)+writer.close()
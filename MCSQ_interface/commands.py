@@ -0,0 +1,85 @@
+from flask import current_app as app
+from .schema import *
+from .frequencies import refresh_token_frequencies
+from .tokens import refresh_token_store
+from .ngrams import build_ngram_indexes
+from .artifacts import build_export_artifacts
+from .item_matrix import build_item_matrices
+from .jobs import expire_jobs
+
+
+@app.cli.command('upgrade-schema')
+def upgrade_schema_command():
+	"""
+	Applies the schema upgrades (generated metadata columns, indexes and corpus version triggers) to an existing MCSQ database.
+	Usage: flask upgrade-schema
+	"""
+	upgrade_schema()
+	print("MCSQ schema upgraded.")
+
+
+@app.cli.command('refresh-token-frequencies')
+def refresh_token_frequencies_command():
+	"""
+	Recomputes the precomputed token frequencies of the questionnaires added, changed or removed since the last refresh.
+	Should be run after each corpus load (after upgrade-schema): until then, the word frequencies are counted live.
+	Usage: flask refresh-token-frequencies
+	"""
+	refreshed, removed = refresh_token_frequencies()
+	print("Token frequencies refreshed for "+str(refreshed)+" questionnaire(s), removed for "+str(removed)+" questionnaire(s).")
+
+
+@app.cli.command('refresh-token-store')
+def refresh_token_store_command():
+	"""
+	Tokenizes the questionnaires added or changed since the last refresh into the token store used by the collocations,
+	and removes the tokens of the removed ones. Should be run after each corpus load (after upgrade-schema): until then,
+	the collocations tokenize the survey items on the fly.
+	Usage: flask refresh-token-store
+	"""
+	refreshed, removed = refresh_token_store()
+	print("Token store refreshed for "+str(refreshed)+" questionnaire(s), removed for "+str(removed)+" questionnaire(s).")
+
+
+@app.cli.command('build-ngram-indexes')
+def build_ngram_indexes_command():
+	"""
+	Builds the n-gram count indexes used by the collocations, for the questionnaires of the token store that are missing
+	for their current fingerprint, and removes the stale ones. Should be run after refresh-token-store: the indexes are
+	only used for the corpus version the token store was refreshed from.
+	Usage: flask build-ngram-indexes
+	"""
+	built, kept, removed = build_ngram_indexes()
+	print("N-gram indexes built: "+str(built)+", kept: "+str(kept)+", removed: "+str(removed)+".")
+
+
+@app.cli.command('build-export-artifacts')
+def build_export_artifacts_command():
+	"""
+	Renders the questionnaire, alignment and TMX exports of every study, year and country_language that are missing
+	for the current corpus version, and removes the stale ones. Should be run after each corpus load.
+	Usage: flask build-export-artifacts
+	"""
+	built, kept, removed = build_export_artifacts()
+	print("Export artifacts built: "+str(built)+", kept: "+str(kept)+", removed: "+str(removed)+".")
+
+
+@app.cli.command('build-item-matrices')
+def build_item_matrices_command():
+	"""
+	Builds the item matrices used to compare whole questionnaires, for every study and year that are missing for the
+	current corpus version, and removes the stale ones. Should be run after each corpus load.
+	Usage: flask build-item-matrices
+	"""
+	built, kept, removed = build_item_matrices()
+	print("Item matrices built: "+str(built)+", kept: "+str(kept)+", removed: "+str(removed)+".")
+
+
+@app.cli.command('expire-jobs')
+def expire_jobs_command():
+	"""
+	Removes the results of the background jobs whose time to live is over.
+	Usage: flask expire-jobs
+	"""
+	expired = expire_jobs()
+	print("Background jobs expired: "+str(expired)+".")
@@ -0,0 +1,130 @@
+import pandas as pd
+
+# Side by side alignment of the questionnaires being compared (compare by word, compare by item type and compare
+# whole questionnaires). The segments of each questionnaire are matched by item name (case insensitive), keeping only
+# the item names present in all of them, and placed side by side in the order of the items in each questionnaire.
+# The alignment is computed for all the item names at once: the item names are lowercased and the item orders parsed
+# once per questionnaire, and each segment gets a (item name, position within the item) key, so the side by side table
+# is a single outer join of the questionnaires on that key.
+# The same join over all the questionnaires of a study and year, keeping every item name, gives the item matrix of the
+# study and year (see item_matrix.py). Any comparison of its questionnaires is then a selection of its columns.
+
+
+def get_item_order(survey_itemids):
+	"""
+	Parses the order of the items in their questionnaire, which is the last part of their ids (e.g. 12 for ESS_R01_2002_ENG_GB_12).
+
+	Args:
+		param1 survey_itemids (pandas series): the survey_itemid column of a questionnaire.
+
+	Returns:
+
+		A pandas series of integers.
+	"""
+	return survey_itemids.str.rsplit('_', n=1).str[-1].astype(int)
+
+
+def get_item_name_keys(dataframes):
+	"""
+	Lowercases the item names of each questionnaire.
+
+	Returns:
+
+		A list of pandas series, one for each dataframe.
+	"""
+	return [df['item_name'].str.lower() for df in dataframes]
+
+
+def align_by_item_name(df, item_names, item_names_to_keep):
+	"""
+	Selects the segments of a questionnaire whose item name is in item_names_to_keep and indexes them by item name and
+	position within the item, following the item order.
+
+	Args:
+		param1 df (pandas dataframe): the segments of the questionnaire.
+		param2 item_names (pandas series): the lowercased item names of the segments.
+		param3 item_names_to_keep (set): the lowercased item names present in all the questionnaires.
+
+	Returns:
+
+		A pandas dataframe with the selected segments, indexed by (item name, position).
+	"""
+	selected = item_names.isin(item_names_to_keep).values
+	df = df[selected]
+	keys = pd.DataFrame({'item_name': item_names.values[selected], 'item_order': get_item_order(df['survey_itemid']).values})
+	keys = keys.sort_values(['item_name', 'item_order'], kind='mergesort')
+
+	df = df.iloc[keys.index.values]
+	position = keys.groupby('item_name', sort=False).cumcount().values
+	df.index = pd.MultiIndex.from_arrays([keys['item_name'].values, position])
+
+	return df
+
+
+def manipulate_results_dataframe(dataframes):
+	"""
+	Places the segments of the questionnaires being compared side by side, aligned by item name. Only the item names
+	present in all the questionnaires are kept, sorted alphabetically, and the segments of an item follow the item order.
+	When a questionnaire has fewer segments for an item than the others, its columns are left empty in the extra rows.
+
+	Args:
+		param1 dataframes (list): the pandas dataframes of the questionnaires, with the survey_itemid, Text, item_name
+		and item_type columns.
+
+	Returns:
+
+		A pandas dataframe with the columns of each questionnaire side by side, indexed by the position of the segment within its item.
+	"""
+	item_names = get_item_name_keys(dataframes)
+	item_names_to_keep = set.intersection(*[set(x.unique()) for x in item_names])
+
+	aligned = [align_by_item_name(df, x, item_names_to_keep) for df, x in zip(dataframes, item_names)]
+	result = pd.concat(aligned, axis=1).sort_index()
+	result.index = result.index.droplevel(0)
+
+	return result
+
+
+def build_item_matrix(dataframes, country_languages):
+	"""
+	Places all the questionnaires of a study and year side by side, keeping all the item names.
+
+	Args:
+		param1 dataframes (list): the pandas dataframes of the questionnaires, with the survey_itemid, Text, item_name
+		and item_type columns.
+		param2 country_languages (list): the country_language of each questionnaire (strings).
+
+	Returns:
+
+		A pandas dataframe indexed by (lowercased item name, position within the item), whose columns are indexed by
+		(country_language, column of the questionnaire).
+	"""
+	item_names = get_item_name_keys(dataframes)
+	aligned = [align_by_item_name(df, x, set(x.unique())) for df, x in zip(dataframes, item_names)]
+
+	return pd.concat(aligned, axis=1, keys=country_languages).sort_index()
+
+
+def slice_item_matrix(matrix, country_languages):
+	"""
+	Selects the questionnaires being compared from an item matrix (see build_item_matrix()). The result is the same
+	as the one of manipulate_results_dataframe() for these questionnaires: only the item names present in all of them
+	are kept, and the rows where none of them has a segment are dropped.
+
+	Args:
+		param1 matrix (pandas dataframe): the item matrix.
+		param2 country_languages (list): the country_language of the questionnaires being compared, all present in the matrix.
+
+	Returns:
+
+		A pandas dataframe with the columns of each questionnaire side by side, indexed by the position of the segment within its item.
+	"""
+	blocks = [matrix[x] for x in country_languages]
+	present = pd.concat([block['survey_itemid'].notna() for block in blocks], axis=1, ignore_index=True)
+	in_all = present.groupby(level=0).any().all(axis=1)
+
+	selected = in_all.reindex(matrix.index.get_level_values(0)).values & present.any(axis=1).values
+	result = pd.concat(blocks, axis=1)[selected]
+	result.index = result.index.droplevel(0)
+
+	return result
@@ -0,0 +1,140 @@
+import zlib
+from flask import request
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+# Negotiated compression of the responses.
+# The downloads (TSV, TMX, Arrow) and the results pages (display_table.html) are very repetitive text, so they are
+# compressed with zstd or gzip, whichever the client prefers in its Accept-Encoding header (zstd needs the optional
+# zstandard package). Streamed responses are compressed chunk by chunk as they are produced, so the memory used does
+# not depend on the size of the download. Responses that already have a Content-Encoding (e.g. the gzip export
+# artifacts), formats that are already compressed (zip, Parquet) and small responses are sent as they are.
+
+# Streamed types whose chunks are flushed as soon as they are produced.
+FLUSHED_TYPES = ['application/x-ndjson']
+
+COMPRESSIBLE_TYPES = ['text/html', 'text/csv', 'text/xml', 'application/json', 'application/x-ndjson', 'application/vnd.apache.arrow.stream', 'application/vnd.apache.arrow.file']
+
+
+def get_encodings():
+	"""
+	Gets the content codings that can be used, by order of preference.
+	"""
+	if zstandard is not None:
+		return ['zstd', 'gzip']
+	return ['gzip']
+
+
+def get_compressor(encoding, config):
+	"""
+	Creates a compressor object (with compress() and flush() methods) for a content coding.
+
+	Args:
+		param1 encoding (string): 'zstd' or 'gzip'.
+		param2 config (dict): the application configuration, with the compression levels.
+
+	Returns:
+
+		The compressor object.
+	"""
+	if encoding == 'zstd':
+		return zstandard.ZstdCompressor(level=config['RESPONSE_COMPRESSION_ZSTD_LEVEL']).compressobj()
+	return zlib.compressobj(config['RESPONSE_COMPRESSION_GZIP_LEVEL'], zlib.DEFLATED, 16+zlib.MAX_WBITS)
+
+
+def get_response_encoding(mimetype, config):
+	"""
+	Negotiates the content coding of a response with the client.
+
+	Args:
+		param1 mimetype (string): the type of the response.
+		param2 config (dict): the application configuration.
+
+	Returns:
+
+		'zstd' or 'gzip', or None if the response has to be sent as it is.
+	"""
+	if not config['RESPONSE_COMPRESSION'] or mimetype not in COMPRESSIBLE_TYPES:
+		return None
+	return request.accept_encodings.best_match(get_encodings())
+
+
+def flush_compressor(compressor):
+	"""
+	Flushes the data buffered by a compressor, without ending the compressed stream.
+	"""
+	if zstandard is not None and isinstance(compressor, zstandard.ZstdCompressionObj):
+		return compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+	return compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def compress_chunks(chunks, compressor, flush=False):
+	"""
+	Compresses the chunks of a streamed response as they are produced. The compressor buffers its input, so a
+	compressed chunk is sent only when it has output, unless flush is set (e.g. for the JSON lines of the batch
+	searches, which the client reads as they arrive). The original iterable is closed when the response is closed,
+	so e.g. the server-side cursor of a streamed export is released.
+	"""
+	try:
+		for chunk in chunks:
+			if isinstance(chunk, str):
+				chunk = chunk.encode('utf-8')
+			data = compressor.compress(chunk)
+			if flush:
+				data = data+flush_compressor(compressor)
+			if data:
+				yield data
+		yield compressor.flush()
+	finally:
+		if hasattr(chunks, 'close'):
+			chunks.close()
+
+
+def compress_response(response, config):
+	"""
+	Compresses a response with the content coding negotiated with the client, if it is worth it.
+
+	Args:
+		param1 response (Response): the response of a route.
+		param2 config (dict): the application configuration.
+
+	Returns:
+
+		The response, compressed or not.
+	"""
+	if not config['RESPONSE_COMPRESSION'] or response.status_code != 200 or response.mimetype not in COMPRESSIBLE_TYPES:
+		return response
+	if 'Content-Encoding' in response.headers:
+		return response
+
+	response.vary.add('Accept-Encoding')
+	encoding = get_response_encoding(response.mimetype, config)
+	if encoding is None:
+		return response
+
+	if response.is_streamed:
+		response.response = compress_chunks(response.response, get_compressor(encoding, config), response.mimetype in FLUSHED_TYPES)
+		response.headers.pop('Content-Length', None)
+	else:
+		data = response.get_data()
+		if len(data) < config['RESPONSE_COMPRESSION_MIN_SIZE']:
+			return response
+		compressor = get_compressor(encoding, config)
+		response.set_data(compressor.compress(data)+compressor.flush())
+
+	response.headers['Content-Encoding'] = encoding
+	etag, weak = response.get_etag()
+	if etag:
+		response.set_etag(etag+'-'+encoding, weak)
+	return response
+
+
+def init_compression(app):
+	"""
+	Compresses the responses of the application (see compress_response()).
+	"""
+	@app.after_request
+	def compress(response):
+		return compress_response(response, app.config)
@@ -0,0 +1,254 @@
+import datetime
+import pandas as pd
+from . import db
+from .schema import CORPUS_VERSION_QUERY
+from .queries import SearchQuery, execute_query, unescape_apostrophes, get_token_condition
+
+# Precomputed token frequencies.
+# The Token frequency table stores, for each token and subcorpus (country_language, study, year and item_type), the number of
+# segments in which the token occurs and its total number of occurrences. The Subcorpus table stores the number of segments
+# and tokens of each subcorpus, used to normalize the frequencies.
+# Tokens are the lexemes of the stored text_tsv column, so they are normalized exactly as in the full word search.
+# The number of tokens of a subcorpus counts every word of its segments, stopwords included (the positions of the 'simple'
+# text search configuration, which neither stems nor drops words), as the stopwords are left out of text_tsv.
+# The tables are refreshed per questionnaire (study, year and country_language): only the questionnaires whose
+# fingerprint changed since the last refresh are recomputed. The refresh is run with the refresh-token-frequencies command
+# after each corpus load; it records the corpus version it was computed from, and until it is run again the frequencies
+# are counted live.
+
+FINGERPRINT_QUERY = """select study, year, country_language,
+md5(string_agg(survey_itemid||':'||coalesce(item_type, '')||':'||coalesce(text, ''), '|' order by survey_itemid))
+from survey_item where study is not null and year is not null and country_language is not null
+group by study, year, country_language"""
+
+INSERT_TOKEN_FREQUENCIES = """insert into token_frequency (token, country_language, language, study, year, item_type, segments, occurrences)
+select t.lexeme, country_language, language, study, year, coalesce(item_type, ''), count(*), sum(coalesce(array_length(t.positions, 1), 1))
+from survey_item, unnest(text_tsv) t
+where study = :study and year = :year and country_language = :country_language
+group by t.lexeme, country_language, language, study, year, coalesce(item_type, '')"""
+
+INSERT_SUBCORPORA = """insert into subcorpus (country_language, language, study, year, item_type, segments, tokens, fingerprint)
+select country_language, language, study, year, coalesce(item_type, ''), count(*),
+coalesce(sum((select sum(coalesce(array_length(t.positions, 1), 1)) from unnest(to_tsvector('simple', coalesce(text, ''))) t)), 0), :fingerprint
+from survey_item
+where study = :study and year = :year and country_language = :country_language
+group by country_language, language, study, year, coalesce(item_type, '')"""
+
+
+def delete_token_frequencies(study, year, country_language):
+	"""
+	Deletes the precomputed token frequencies of a given questionnaire.
+	"""
+	parameters = {'study': study, 'year': year, 'country_language': country_language}
+	db.session.execute("delete from token_frequency where study = :study and year = :year and country_language = :country_language", parameters)
+	db.session.execute("delete from subcorpus where study = :study and year = :year and country_language = :country_language", parameters)
+
+
+def refresh_token_frequencies():
+	"""
+	Brings the Token frequency and Subcorpus tables up to date with the Survey item table.
+	Questionnaires that were added or changed since the last refresh are recomputed, and the ones that were removed are deleted.
+	The corpus version read before the fingerprints is recorded in the Token frequency refresh table: if the corpus changes
+	during the refresh, the version no longer matches and the tables are not used until the next refresh.
+
+	Returns:
+
+		The number of questionnaires recomputed and deleted (tuple of integers).
+	"""
+	corpus_version = db.session.execute(CORPUS_VERSION_QUERY).scalar()
+
+	current = {}
+	for result in db.session.execute(FINGERPRINT_QUERY):
+		current[(result[0], result[1], result[2])] = result[3]
+
+	stored = {}
+	for result in db.session.execute("select distinct study, year, country_language, fingerprint from subcorpus"):
+		stored[(result[0], result[1], result[2])] = result[3]
+
+	removed = [key for key in stored if key not in current]
+	changed = [key for key, fingerprint in current.items() if stored.get(key) != fingerprint]
+
+	for study, year, country_language in removed:
+		delete_token_frequencies(study, year, country_language)
+
+	for study, year, country_language in changed:
+		delete_token_frequencies(study, year, country_language)
+		parameters = {'study': study, 'year': year, 'country_language': country_language, 'fingerprint': current[(study, year, country_language)]}
+		db.session.execute(INSERT_TOKEN_FREQUENCIES, parameters)
+		db.session.execute(INSERT_SUBCORPORA, parameters)
+		db.session.commit()
+
+	db.session.execute("delete from token_frequency_refresh")
+	if corpus_version is not None:
+		db.session.execute("insert into token_frequency_refresh (corpus_version, refreshed) values (:corpus_version, :refreshed)",
+		{'corpus_version': corpus_version, 'refreshed': datetime.datetime.utcnow()})
+	db.session.commit()
+	db.session.execute("analyze token_frequency")
+	db.session.execute("analyze subcorpus")
+	db.session.commit()
+
+	db.session.close()
+	db.session.remove()
+
+	return len(changed), len(removed)
+
+
+def token_frequencies_available(words, combined):
+	"""
+	Checks if a frequency search can be answered from the precomputed token frequencies.
+	This is the case when the tables were refreshed from the current corpus version, the frequency is not combined (which depends on
+	co-occurrence in the same segment) and every word is a single token (e.g. no apostrophes nor hyphens).
+
+	Args:
+		param1 words (list): the words (strings) that the user wants to search for.
+		param2 combined (string): just for multiple words. Indicates if the frequency to be computed is combined.
+
+	Returns:
+
+		True if the precomputed token frequencies can be used, False otherwise.
+	"""
+	if combined or not words:
+		return False
+	for word in words:
+		if not word.isalnum():
+			return False
+
+	return bool(db.session.execute("select coalesce(("+CORPUS_VERSION_QUERY+") = (select max(corpus_version) from token_frequency_refresh), false)").scalar())
+
+
+def add_token_frequency_sums(query, words, country_language):
+	"""
+	Adds to a query over the Token frequency table the sums of segments and occurrences of each word, and the condition
+	that restricts the query to the tokens of the words.
+
+	Args:
+		param1 query (SearchQuery): the query being built.
+		param2 words (list): the words (strings) that the user wants to search for.
+		param3 country_language (string): country and language questionnaire metadata.
+	"""
+	conditions = [get_token_condition(unescape_apostrophes(word), country_language) for word in words]
+	for condition in conditions:
+		query.select("coalesce(sum(segments) filter (where "+condition[0]+"), 0)", *condition[1:])
+	for condition in conditions:
+		query.select("coalesce(sum(occurrences) filter (where "+condition[0]+"), 0)", *condition[1:])
+
+	parameters = [parameter for condition in conditions for parameter in condition[1:]]
+	query.where("("+" or ".join(condition[0] for condition in conditions)+")", *parameters)
+
+
+def get_frequency_item(word, segments, occurrences=None, tokens=None):
+	"""
+	Builds a row of the frequency results, with the absolute frequency (number of segments), the number of occurrences,
+	the relative frequency and the frequency per million tokens of a word.
+	The frequencies counted live only give the number of segments, so the other columns are left empty (None).
+	"""
+	if occurrences is None:
+		relative_frequency = None
+	elif tokens:
+		relative_frequency = occurrences/tokens
+	else:
+		relative_frequency = 0.0
+
+	return {'Word': word, 'Frequency': segments, 'Occurrences': occurrences, 'Relative frequency': relative_frequency,
+	'Frequency per million': None if relative_frequency is None else relative_frequency*1000000}
+
+
+def get_frequency_dataframe(lst):
+	"""
+	Builds the dataframe of the frequency results (see get_frequency_item()), with the same column types whether the
+	frequencies were precomputed or counted live.
+	"""
+	df = pd.DataFrame.from_dict(lst)
+	if df.empty:
+		return df
+
+	df['Occurrences'] = df['Occurrences'].astype('Int64')
+	df['Relative frequency'] = df['Relative frequency'].astype(float)
+	df['Frequency per million'] = df['Frequency per million'].astype(float)
+	return df
+
+
+def get_token_frequency(words, country_language, year, study, item_type):
+	"""
+	Answers a word frequency search from the precomputed token frequencies. Costs two index lookups, regardless of the size of the subcorpus.
+
+	Args:
+		param1 words (list): the words (strings) that the user wants to search for.
+		param2 country_language (string): country and language questionnaire metadata.
+		param3 year (string): year metadata filter. Indicates in which year a given study was released.
+		param4 study (string): study questionnaire metadata.
+		param5 item_type (string): item type metadata filter. Can be INTRODUCTION, INSTRUCTION, REQUEST or RESPONSE.
+
+	Returns:
+
+		A pandas dataframe containing the frequencies of the words.
+	"""
+	query = SearchQuery('token_frequency', [])
+	add_token_frequency_sums(query, words, country_language)
+	query.filter_metadata(country_language, year, study, item_type)
+	result = execute_query(query).fetchone()
+
+	size = SearchQuery('subcorpus', ['coalesce(sum(tokens), 0)'])
+	size.filter_metadata(country_language, year, study, item_type)
+	tokens = execute_query(size).scalar()
+
+	lst = []
+	for i, word in enumerate(words):
+		lst.append(get_frequency_item(word, result[i], result[len(words)+i], tokens))
+
+	df = get_frequency_dataframe(lst)
+
+	db.session.close()
+	db.session.remove()
+
+	return df
+
+
+def get_token_frequency_by_facets(words, country_language, year, study, item_type):
+	"""
+	Faceted version of get_token_frequency(). The frequencies are broken down by country_language, study, year and item_type,
+	and normalized by the size of each facet combination.
+
+	Args:
+		param1 words (list): the words (strings) that the user wants to search for.
+		param2 country_language (string): country and language questionnaire metadata.
+		param3 year (string): year metadata filter. Indicates in which year a given study was released.
+		param4 study (string): study questionnaire metadata.
+		param5 item_type (string): item type metadata filter. Can be INTRODUCTION, INSTRUCTION, REQUEST or RESPONSE.
+
+	Returns:
+
+		A pandas dataframe containing the frequencies of the words, in long format (one row per facet combination and word).
+	"""
+	facets = ['country_language', 'study', 'year', 'item_type']
+
+	size = SearchQuery('subcorpus', facets+['tokens'])
+	size.filter_metadata(country_language, year, study, item_type)
+	tokens = {}
+	for result in execute_query(size):
+		tokens[tuple(result[:len(facets)])] = result[len(facets)]
+
+	query = SearchQuery('token_frequency', facets)
+	add_token_frequency_sums(query, words, country_language)
+	query.filter_metadata(country_language, year, study, item_type)
+	query.group(*facets)
+	query.order(*facets)
+	results = execute_query(query)
+
+	lst = []
+	for result in results:
+		key = tuple(result[:len(facets)])
+		sums = result[len(facets):]
+		for i, word in enumerate(words):
+			item = {'country_language': result[0], 'study': result[1], 'year': result[2], 'item_type': result[3]}
+			item.update(get_frequency_item(word, sums[i], sums[len(words)+i], tokens.get(key, 0)))
+			lst.append(item)
+
+	df = get_frequency_dataframe(lst)
+	if not df.empty:
+		df['study'] = df['study'].replace('SHA', 'SHARE')
+
+	db.session.close()
+	db.session.remove()
+
+	return df
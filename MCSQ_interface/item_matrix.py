@@ -0,0 +1,142 @@
+import functools
+import hashlib
+import os
+import pandas as pd
+from flask import current_app
+from . import db
+from .cache import get_corpus_version, get_result_cache
+from .comparison import build_item_matrix, slice_item_matrix, manipulate_results_dataframe
+from .metadata import metadata_cache
+from .searches import search_to_compare_item_type_independent
+
+# Precomputed item matrices for the comparison of whole questionnaires.
+# The item matrix of a study and year places all its questionnaires side by side, aligned by item name and following
+# the item order (see comparison.build_item_matrix()). The matrices are built by the build-item-matrices command and
+# stored as gzip compressed pickles in ITEM_MATRIX_DIR, named after a hash of the study, year and corpus version (see
+# cache.get_corpus_version()), so a corpus change makes the existing files stale, as for the export artifacts.
+# Comparing whole questionnaires then selects the columns of the compared questionnaires from the matrix, and falls back
+# to the live search for the studies and years whose matrix was not built.
+
+# Number of matrices kept in memory by each process
+ITEM_MATRIX_CACHE_SIZE = 4
+
+
+def get_item_matrix_path(year, study, version):
+	"""
+	Gets the path of the file of the item matrix of a study and year, for a given corpus version.
+	"""
+	name = hashlib.sha1('|'.join([str(year), str(study), str(version)]).encode('utf-8')).hexdigest()
+	return os.path.join(current_app.config['ITEM_MATRIX_DIR'], name+'.pkl.gz')
+
+
+def write_item_matrix(path, year, study, country_languages):
+	"""
+	Builds the item matrix of a study and year and writes it to a file. The file is written under a temporary name
+	and then renamed, so a partially written matrix is never read.
+
+	Returns:
+
+		True if the matrix was written, False if the study has no questionnaires in that year (no file is written).
+	"""
+	dataframes = search_to_compare_item_type_independent(country_languages, year, study)
+	questionnaires = [(df, country_language) for df, country_language in zip(dataframes, country_languages) if df.empty == False]
+	if not questionnaires:
+		return False
+
+	matrix = build_item_matrix([x[0] for x in questionnaires], [x[1] for x in questionnaires])
+	temporary_path = path+'.tmp'
+	matrix.to_pickle(temporary_path, compression='gzip')
+	os.replace(temporary_path, path)
+	return True
+
+
+def build_item_matrices():
+	"""
+	Builds the item matrices of every study and year of the corpus that are missing for the current corpus version,
+	and removes the stale ones.
+
+	Returns:
+
+		The number of matrices built, kept and removed (tuple of integers).
+	"""
+	directory = current_app.config['ITEM_MATRIX_DIR']
+	os.makedirs(directory, exist_ok=True)
+	version = get_corpus_version()
+	metadata_cache.load()
+
+	country_languages = {}
+	for survey in metadata_cache.get_surveys():
+		study = 'SHARE' if survey['study'] == 'SHA' else survey['study']
+		country_languages.setdefault((str(survey['year']), study), set()).add(survey['country_language'])
+
+	built = 0
+	kept = 0
+	current = set()
+	for (year, study), values in sorted(country_languages.items()):
+		path = get_item_matrix_path(year, study, version)
+		current.add(os.path.basename(path))
+		if os.path.exists(path):
+			kept += 1
+		elif write_item_matrix(path, year, study, sorted(values)):
+			built += 1
+
+	db.session.close()
+	db.session.remove()
+
+	removed = 0
+	for name in os.listdir(directory):
+		if name not in current:
+			os.remove(os.path.join(directory, name))
+			removed += 1
+
+	return built, kept, removed
+
+
+@functools.lru_cache(maxsize=ITEM_MATRIX_CACHE_SIZE)
+def load_item_matrix(path):
+	"""
+	Reads an item matrix file. The file name changes with the corpus version, so cached matrices never go stale.
+	"""
+	return pd.read_pickle(path, compression='gzip')
+
+
+def get_item_matrix(year, study):
+	"""
+	Gets the item matrix of a study and year, if it was built for the current corpus version.
+
+	Returns:
+
+		The item matrix (pandas dataframe), or None if it was not built.
+	"""
+	path = get_item_matrix_path(year, study, get_result_cache().get_version())
+	if not os.path.exists(path):
+		return None
+	return load_item_matrix(path)
+
+
+def compare_whole_questionnaires(country_languages, year, study):
+	"""
+	Compares whole questionnaires, selecting them from the item matrix of the study and year, or with the live search
+	if the matrix was not built (see compare_whole() in routes.py).
+
+	Args:
+		param1 country_languages (list): country and language questionnaire metadata of the compared questionnaires.
+		param2 year (string): year metadata filter. Indicates in which year a given study was released.
+		param3 study (string): study questionnaire metadata. Can be ESS, EVS, SHARE or WIS.
+
+	Returns:
+
+		A pandas dataframe with the questionnaires side by side, or None if fewer than two of them exist.
+	"""
+	matrix = get_item_matrix(year, study)
+	if matrix is not None:
+		available = set(matrix.columns.get_level_values(0))
+		country_languages = [x for x in country_languages if x in available]
+		if len(country_languages) < 2:
+			return None
+		return slice_item_matrix(matrix, country_languages)
+
+	results = [df for df in search_to_compare_item_type_independent(country_languages, year, study) if df.empty == False]
+	if len(results) < 2:
+		return None
+	return manipulate_results_dataframe(results)
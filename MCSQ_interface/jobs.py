@@ -0,0 +1,414 @@
+import datetime
+import functools
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from . import db
+from .models import Job
+from .queries import execute_query, stream_query, build_count_query, open_snapshot_connection
+from .item_matrix import compare_whole_questionnaires
+from .ngrams import search_collocations, get_collocations_dataframe
+from .searches import build_questionnaire_query, build_alignment_query
+
+# Background jobs for the exports and comparisons that take too long to run in the request thread (comparing whole
+# questionnaires, downloading a whole questionnaire or alignment, collocations over a big subcorpus).
+# A job is a row of the job table, created as 'queued' by submit_job(). It is then run by a pool of JOB_MAX_WORKERS
+# worker processes, which update its progress while it runs, write its result to a file in JOB_RESULT_DIR and mark it
+# as 'done' (or 'failed', with the error message). Results are kept for JOB_RESULT_TTL seconds after the job finishes,
+# and then removed by expire_jobs(), which runs on every submission and in the expire-jobs command. Jobs that are still
+# queued or running JOB_STALE_AFTER seconds after they were submitted (e.g. the web process was restarted) are marked as failed.
+# If a worker process dies (e.g. killed for running out of memory), the pool is broken: its jobs are marked as failed
+# and a new pool is created for the next submissions.
+# Each web process has its own pool, so JOB_MAX_WORKERS limits the jobs run at the same time by one web process, not by
+# the whole server.
+# The worker processes are started with spawn, and create a minimal application (see init_worker()), so the search
+# functions run with the same configuration and database as the web process. The modules that register routes
+# (utils, routes) can only be imported once that application exists, so the job functions import them lazily.
+
+PROGRESS_UPDATE_INTERVAL = 1
+
+executor = None
+
+executor_lock = threading.Lock()
+
+
+class JobError(Exception):
+	"""
+	Error of a job that is reported to the user as it is (e.g. a search without results).
+	"""
+	pass
+
+
+def init_worker():
+	"""
+	Initializes a worker process, creating its application (and pushing its context). The worker application only has
+	the configuration and the database: it does not create the tables nor start the metadata cache of the web process.
+	"""
+	from . import create_worker_app
+	create_worker_app()
+
+
+def get_executor():
+	"""
+	Returns the process pool of the jobs, creating it on first use.
+	"""
+	global executor
+	with executor_lock:
+		if executor is None:
+			context = multiprocessing.get_context('spawn')
+			if current_app.config['JOB_PYTHON_EXECUTABLE']:
+				# Under mod_wsgi, sys.executable is not the Python interpreter
+				context.set_executable(current_app.config['JOB_PYTHON_EXECUTABLE'])
+			executor = ProcessPoolExecutor(max_workers=current_app.config['JOB_MAX_WORKERS'], mp_context=context, initializer=init_worker)
+		return executor
+
+
+def reset_executor(broken):
+	"""
+	Drops a broken process pool, so the next call of get_executor() creates a new one.
+
+	Args:
+		param1 broken (ProcessPoolExecutor): the pool that is broken.
+	"""
+	global executor
+	with executor_lock:
+		if executor is broken:
+			executor = None
+	broken.shutdown(wait=False)
+
+
+def update_job(jobid, **values):
+	"""
+	Updates the columns of a job.
+	"""
+	Job.query.filter_by(jobid=jobid).update(values)
+	db.session.commit()
+
+
+def fail_job(jobid, message):
+	"""
+	Marks a job as failed, with the error message shown to the user. Its row expires after JOB_RESULT_TTL seconds.
+	"""
+	finished = datetime.datetime.utcnow()
+	update_job(jobid, status='failed', message=message, finished=finished,
+		expires=finished+datetime.timedelta(seconds=current_app.config['JOB_RESULT_TTL']))
+
+
+def get_progress_function(jobid):
+	"""
+	Creates the function that the jobs call to report their progress. The job row is updated at most once every
+	PROGRESS_UPDATE_INTERVAL seconds.
+
+	Returns:
+
+		A function that receives the fraction of the job that is done (float between 0 and 1) and a message (string).
+	"""
+	last_update = [0]
+
+	def progress(fraction, message):
+		now = time.monotonic()
+		if now - last_update[0] < PROGRESS_UPDATE_INTERVAL:
+			return
+		last_update[0] = now
+		update_job(jobid, progress=min(max(fraction, 0), 1), message=message)
+
+	return progress
+
+
+def compare_questionnaires_job(parameters, progress):
+	"""
+	Compares whole questionnaires (see compare_whole() in routes.py).
+
+	Args:
+		param1 parameters (dict): study, year, country_languages (list of strings) and format.
+		param2 progress (function): reports the progress of the job (see get_progress_function()).
+
+	Returns:
+
+		A tuple with the chunks of the result file (iterable of bytes), its content type and its extension.
+	"""
+	from .utils import get_dataframe_export
+
+	progress(0, 'Comparing the questionnaires')
+	results = compare_whole_questionnaires(parameters['country_languages'], parameters['year'], parameters['study'])
+
+	if results is None:
+		raise JobError('There are no valid studies for one or more country/language pairs indicated in the filters')
+
+	progress(0.5, 'Writing the comparison')
+	data, content_type, extension = get_dataframe_export(results, parameters['format'])
+	return [data], content_type, extension
+
+
+def download_job(parameters, progress):
+	"""
+	Downloads a questionnaire or an alignment (see download_questionnaire() and download_alignment() in routes.py).
+
+	Args:
+		param1 parameters (dict): export ('questionnaire' or 'alignment'), country_language, year, study, displaytagged, dedupe and format.
+		param2 progress (function): reports the progress of the job (see get_progress_function()).
+
+	Returns:
+
+		A tuple with the chunks of the result file (iterable of bytes), its content type and its extension.
+	"""
+	from .utils import get_results_writer, get_alignment_pair_columns, count_alignment_pairs, dedupe_alignment_rows
+
+	if parameters['export'] == 'questionnaire':
+		query, labels = build_questionnaire_query(parameters['country_language'], parameters['year'], parameters['study'], parameters['displaytagged'])
+	else:
+		query, labels = build_alignment_query(parameters['country_language'], parameters['year'], parameters['study'], parameters['displaytagged'])
+
+	total = execute_query(build_count_query(query)).scalar()
+	db.session.close()
+	db.session.remove()
+	if not total:
+		raise JobError('No results found for your search!')
+
+	dedupe = parameters['dedupe'] and parameters['export'] == 'alignment'
+	batch_size = current_app.config['EXPORT_BATCH_SIZE']
+
+	def read(batches, start, share, action):
+		rows = 0
+		for batch in batches:
+			rows += len(batch)
+			progress(start+share*rows/total, str(rows)+' of '+str(total)+' rows '+action)
+			yield batch
+
+	def batches():
+		if not dedupe:
+			for batch in read(stream_query(query, batch_size), 0, 1, 'written'):
+				yield batch
+			return
+
+		# Both passes of the deduplication read the same snapshot (see utils.stream_export())
+		pair_columns = get_alignment_pair_columns(labels)
+		connection = open_snapshot_connection()
+		try:
+			pairs = count_alignment_pairs(read(stream_query(query, batch_size, connection), 0, 0.5, 'counted'), *pair_columns)
+			for batch in dedupe_alignment_rows(read(stream_query(query, batch_size, connection), 0.5, 0.5, 'written'),
+				pair_columns[0], pair_columns[1], pairs, batch_size):
+				yield batch
+		finally:
+			connection.close()
+
+	write, content_type, extension = get_results_writer(parameters['format'], labels, dedupe)
+	return write(batches()), content_type, extension
+
+
+def collocation_job(parameters, progress):
+	"""
+	Computes the collocations of a word (see compute_collocation() in routes.py).
+
+	Args:
+		param1 parameters (dict): word, country_language, year, study, item_type, n_collocations, measure and format.
+		param2 progress (function): reports the progress of the job (see get_progress_function()).
+
+	Returns:
+
+		A tuple with the chunks of the result file (iterable of bytes), its content type and its extension.
+	"""
+	from .utils import get_dataframe_export
+
+	progress(0, 'Computing the collocations')
+	collocations = search_collocations(parameters['word'], parameters['country_language'], parameters['year'],
+		parameters['study'], parameters['item_type'], parameters['measure'], parameters['n_collocations'])
+	if collocations is None:
+		raise JobError('No results found for your search!')
+
+	progress(0.5, 'Writing the collocations')
+	df = get_collocations_dataframe(collocations, parameters['measure'])
+	data, content_type, extension = get_dataframe_export(df, parameters['format'])
+	return [data], content_type, extension
+
+
+JOB_KINDS = {'compare_whole': compare_questionnaires_job, 'download': download_job, 'collocation': collocation_job}
+
+
+def run_job(jobid):
+	"""
+	Runs a job in a worker process, writing its result to JOB_RESULT_DIR. The file is written under a temporary name
+	and then renamed, so a partially written result is never served.
+
+	Args:
+		param1 jobid (string): the id of the job.
+	"""
+	job = Job.query.filter_by(jobid=jobid).first()
+	if job is None or job.status != 'queued':
+		db.session.close()
+		db.session.remove()
+		return
+	kind = job.kind
+	parameters = json.loads(job.parameters)
+	update_job(jobid, status='running', started=datetime.datetime.utcnow(), message='Started')
+
+	directory = current_app.config['JOB_RESULT_DIR']
+	temporary_path = None
+	try:
+		chunks, content_type, extension = JOB_KINDS[kind](parameters, get_progress_function(jobid))
+		os.makedirs(directory, exist_ok=True)
+		path = os.path.join(directory, jobid+extension)
+		temporary_path = path+'.tmp'
+		with open(temporary_path, 'wb') as result:
+			for chunk in chunks:
+				result.write(chunk)
+		os.replace(temporary_path, path)
+
+		finished = datetime.datetime.utcnow()
+		update_job(jobid, status='done', progress=1, message='Finished', result_path=path, filename='results'+extension,
+			content_type=content_type, finished=finished, expires=finished+datetime.timedelta(seconds=current_app.config['JOB_RESULT_TTL']))
+	except Exception as e:
+		db.session.rollback()
+		if isinstance(e, JobError):
+			message = str(e)
+		else:
+			current_app.logger.exception('Job '+jobid+' failed')
+			message = 'The job failed.'
+		if temporary_path is not None and os.path.exists(temporary_path):
+			os.remove(temporary_path)
+		fail_job(jobid, message)
+	finally:
+		db.session.close()
+		db.session.remove()
+
+
+def expire_jobs():
+	"""
+	Removes the results of the jobs whose time to live is over, and marks them as expired.
+	The jobs that are still queued or running JOB_STALE_AFTER seconds after they were submitted are marked as failed,
+	so they expire JOB_RESULT_TTL seconds later.
+
+	Returns:
+
+		The number of jobs expired (integer).
+	"""
+	now = datetime.datetime.utcnow()
+	stale = Job.query.filter(Job.status.in_(['queued', 'running']),
+		Job.created < now-datetime.timedelta(seconds=current_app.config['JOB_STALE_AFTER'])).all()
+	for job in stale:
+		fail_job(job.jobid, 'The job did not finish in time.')
+
+	expired = Job.query.filter(Job.status != 'expired', Job.expires < now).all()
+	for job in expired:
+		if job.result_path and os.path.exists(job.result_path):
+			os.remove(job.result_path)
+		job.status = 'expired'
+		job.result_path = None
+	db.session.commit()
+	db.session.close()
+	db.session.remove()
+	return len(expired)
+
+
+def check_job_future(flask_app, jobid, pool, future):
+	"""
+	Called when a job submitted to the process pool ends. run_job() handles the errors of the jobs, so the future
+	only fails when the job could not be run. If the pool is broken (a worker process died), it is also dropped.
+
+	Args:
+		param1 flask_app (Flask): the application, whose context is used to update the job.
+		param2 jobid (string): the id of the job.
+		param3 pool (ProcessPoolExecutor): the pool the job was submitted to.
+		param4 future (Future): the future of the job.
+	"""
+	if future.cancelled() or future.exception() is None:
+		return
+	if isinstance(future.exception(), BrokenProcessPool):
+		reset_executor(pool)
+	with flask_app.app_context():
+		try:
+			job = Job.query.filter_by(jobid=jobid).first()
+			if job is not None and job.status in ('queued', 'running'):
+				flask_app.logger.error('Job '+jobid+' failed: '+repr(future.exception()))
+				fail_job(jobid, 'The job failed.')
+		finally:
+			db.session.close()
+			db.session.remove()
+
+
+def submit_job(kind, parameters, owner):
+	"""
+	Creates a job and queues it in the process pool. If the pool is broken, a new one is created. If the job cannot
+	be queued even then, it is marked as failed.
+
+	Args:
+		param1 kind (string): the kind of job, a key of JOB_KINDS.
+		param2 parameters (dict): the parameters of the job function.
+		param3 owner (string): the email of the user who submitted the job. Only this user can see it.
+
+	Returns:
+
+		The id of the job (string).
+	"""
+	expire_jobs()
+
+	jobid = uuid.uuid4().hex
+	created = datetime.datetime.utcnow()
+	job = Job(jobid, kind, json.dumps(parameters), owner, 'queued', created)
+	db.session.add(job)
+	db.session.commit()
+	db.session.close()
+	db.session.remove()
+
+	flask_app = current_app._get_current_object()
+	for attempt in range(2):
+		pool = get_executor()
+		try:
+			future = pool.submit(run_job, jobid)
+		except BrokenProcessPool:
+			reset_executor(pool)
+			continue
+		future.add_done_callback(functools.partial(check_job_future, flask_app, jobid, pool))
+		return jobid
+
+	current_app.logger.error('Job '+jobid+' could not be queued')
+	fail_job(jobid, 'The job could not be started.')
+	db.session.close()
+	db.session.remove()
+	return jobid
+
+
+def get_job(jobid, owner):
+	"""
+	Gets a job of a user.
+
+	Returns:
+
+		The job (Job), or None if the user has no job with this id.
+	"""
+	job = Job.query.filter_by(jobid=jobid, owner=owner).first()
+	db.session.close()
+	db.session.remove()
+	return job
+
+
+def get_job_result_response(job):
+	"""
+	Builds the attachment response of the result file of a finished job, read in chunks.
+	"""
+	from .artifacts import read_artifact
+
+	resp = current_app.response_class(read_artifact(job.result_path, False))
+	resp.headers["Content-Disposition"] = "attachment; filename="+job.filename
+	resp.headers["Content-Type"] = job.content_type
+	resp.content_length = os.path.getsize(job.result_path)
+
+	return resp
+
+
+def get_job_status(job):
+	"""
+	Gets the status of a job, as shown to the user (dictionary).
+	"""
+	def format_date(value):
+		return value.isoformat()+'Z' if value is not None else None
+
+	return {'jobid': job.jobid, 'kind': job.kind, 'status': job.status, 'progress': job.progress, 'message': job.message,
+	'created': format_date(job.created), 'started': format_date(job.started), 'finished': format_date(job.finished),
+	'expires': format_date(job.expires)}
@@ -0,0 +1,99 @@
+import threading
+import time
+from . import db
+
+# Process-wide cache of the corpus metadata shown in the interface: the filtering options of the forms and the
+# Survey and Module tables. It is loaded when the application starts, and a background thread checks every
+# METADATA_REFRESH_INTERVAL seconds if the Survey or Module tables changed, reloading the cache only when they did.
+# This way, rendering a form does not touch the database.
+
+STAMP_QUERY = """select (select md5(coalesce(string_agg(surveyid||':'||coalesce(study, '')||':'||coalesce(wave_round::text, '')||':'||
+coalesce(year::text, '')||':'||coalesce(country_language, ''), '|' order by surveyid), '')) from survey)
+||(select md5(coalesce(string_agg(moduleid::text||':'||coalesce(module_name, ''), '|' order by moduleid), '')) from module)"""
+
+
+class MetadataCache:
+	"""
+	Holds the metadata loaded from the Survey and Module tables.
+	"""
+	def __init__(self):
+		self.stamp = None
+		self.language_country_options = ['No filter']
+		self.year_options = ['No filter']
+		self.surveys = []
+		self.modules = []
+		self.lock = threading.Lock()
+		self.thread = None
+
+	def load(self):
+		"""
+		Loads the metadata from the database, if the Survey or Module tables changed since the last load.
+		"""
+		stamp = db.session.execute(STAMP_QUERY).scalar()
+		if stamp == self.stamp:
+			db.session.close()
+			db.session.remove()
+			return
+
+		surveys = []
+		for result in db.session.execute("select surveyid, study, wave_round, year, country_language from survey"):
+			surveys.append({'surveyid': result[0], 'study': result[1], 'wave_round': result[2], 'year': result[3], 'country_language': result[4]})
+		modules = []
+		for result in db.session.execute("select moduleid, module_name from module"):
+			modules.append({'moduleid': result[0], 'module_name': result[1]})
+
+		db.session.close()
+		db.session.remove()
+
+		language_country_options = sorted(set(survey['country_language'] for survey in surveys))
+		language_country_options.insert(0, 'No filter')
+		year_options = sorted(set(str(survey['year']) for survey in surveys))
+		year_options.insert(0, 'No filter')
+
+		with self.lock:
+			self.stamp = stamp
+			self.surveys = surveys
+			self.modules = modules
+			self.language_country_options = language_country_options
+			self.year_options = year_options
+
+	def start(self, app):
+		"""
+		Loads the metadata and starts the background thread that keeps it up to date.
+
+		Args:
+			param1 app (Flask): the application, whose context is used by the background thread.
+		"""
+		self.load()
+		interval = app.config['METADATA_REFRESH_INTERVAL']
+
+		def refresh():
+			while True:
+				time.sleep(interval)
+				with app.app_context():
+					try:
+						self.load()
+					except Exception:
+						app.logger.exception('Could not refresh the metadata cache')
+
+		self.thread = threading.Thread(target=refresh, name='metadata-cache', daemon=True)
+		self.thread.start()
+
+	def get_language_country_options(self):
+		with self.lock:
+			return list(self.language_country_options)
+
+	def get_year_options(self):
+		with self.lock:
+			return list(self.year_options)
+
+	def get_surveys(self):
+		with self.lock:
+			return list(self.surveys)
+
+	def get_modules(self):
+		with self.lock:
+			return list(self.modules)
+
+
+metadata_cache = MetadataCache()
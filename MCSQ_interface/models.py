@@ -1,6 +1,9 @@
 from . import db
 from sqlalchemy import *
 from flask_login import UserMixin
+from sqlalchemy.dialects.postgresql import TSVECTOR, ARRAY
+from .schema import STUDY_EXPRESSION, YEAR_EXPRESSION, COUNTRY_LANGUAGE_EXPRESSION, LANGUAGE_EXPRESSION, ITEM_ORDER_EXPRESSION
+from .schema import SURVEY_ITEM_TSVECTOR_EXPRESSION, SOURCE_TEXT_TSVECTOR_EXPRESSION, TARGET_TEXT_TSVECTOR_EXPRESSION
 
 class User(db.Model,UserMixin):
 	__tablename__ = 'users'
@@ -44,6 +47,13 @@ class Survey(db.Model):
 
 class Alignment(db.Model):
 	__tablename__ = 'alignment'
+	__table_args__ = (Index('alignment_metadata_idx', 'study', 'year', 'target_country_language', 'target_item_order'),
+	Index('alignment_country_language_idx', 'target_country_language', 'target_item_order'),
+	Index('alignment_language_idx', 'target_language', 'study', 'year'),
+	Index('alignment_year_idx', 'year'),
+	Index('alignment_source_text_tsv_idx', 'source_text_tsv', postgresql_using='gin'),
+	Index('alignment_target_text_tsv_idx', 'target_text_tsv', postgresql_using='gin'),
+	)
 	alignmentid = db.Column(db.Integer, primary_key=True)
 	source_text = Column(db.String)
 	target_text = Column(db.String)
@@ -53,7 +63,13 @@ class Alignment(db.Model):
 	target_pos_tagged_text = db.Column(db.String)
 	source_ner_tagged_text = db.Column(db.String)
 	target_ner_tagged_text = db.Column(db.String)
-
+	study = db.Column(db.String, Computed(STUDY_EXPRESSION.format(column='target_survey_itemid'), persisted=True))
+	year = db.Column(db.Integer, Computed(YEAR_EXPRESSION.format(column='target_survey_itemid'), persisted=True))
+	target_country_language = db.Column(db.String, Computed(COUNTRY_LANGUAGE_EXPRESSION.format(column='target_survey_itemid'), persisted=True))
+	target_language = db.Column(db.String, Computed(LANGUAGE_EXPRESSION.format(column='target_survey_itemid'), persisted=True))
+	target_item_order = db.Column(db.Integer, Computed(ITEM_ORDER_EXPRESSION.format(column='target_survey_itemid'), persisted=True))
+	source_text_tsv = db.Column(TSVECTOR, Computed(SOURCE_TEXT_TSVECTOR_EXPRESSION, persisted=True))
+	target_text_tsv = db.Column(TSVECTOR, Computed(TARGET_TEXT_TSVECTOR_EXPRESSION, persisted=True))
 
 	def __init__(self,source_text, target_text, source_survey_itemid,target_survey_itemid, 
 		source_pos_tagged_text, target_pos_tagged_text, source_ner_tagged_text, target_ner_tagged_text):
@@ -134,6 +150,11 @@ class Survey_item(db.Model):
 	ForeignKeyConstraint(['requestid'], ['request.requestid']),
 	ForeignKeyConstraint(['instructionid'], ['instruction.instructionid']),
 	ForeignKeyConstraint(['introductionid'], ['introduction.introductionid']),
+	Index('survey_item_metadata_idx', 'study', 'year', 'country_language', 'item_order'),
+	Index('survey_item_country_language_idx', 'country_language', 'item_order'),
+	Index('survey_item_language_idx', 'language', 'study', 'year'),
+	Index('survey_item_year_idx', 'year'),
+	Index('survey_item_text_tsv_idx', 'text_tsv', postgresql_using='gin'),
 	)
 
 
@@ -152,8 +173,11 @@ class Survey_item(db.Model):
 	item_type = db.Column(db.String)
 	pos_tagged_text = db.Column(db.String)
 	ner_tagged_text = db.Column(db.String)
-
-
+	study = db.Column(db.String, Computed(STUDY_EXPRESSION.format(column='survey_itemid'), persisted=True))
+	year = db.Column(db.Integer, Computed(YEAR_EXPRESSION.format(column='survey_itemid'), persisted=True))
+	language = db.Column(db.String, Computed(LANGUAGE_EXPRESSION.format(column='survey_itemid'), persisted=True))
+	item_order = db.Column(db.Integer, Computed(ITEM_ORDER_EXPRESSION.format(column='survey_itemid'), persisted=True))
+	text_tsv = db.Column(TSVECTOR, Computed(SURVEY_ITEM_TSVECTOR_EXPRESSION, persisted=True))
 
 	def __init__(self, survey_itemid, surveyid,text, item_value, moduleid, requestid, responseid, instructionid,
 		introductionid, country_language, item_is_source, item_name, item_type, pos_tagged_text, ner_tagged_text):
@@ -172,3 +196,151 @@ class Survey_item(db.Model):
 		self.item_type = item_type
 		self.pos_tagged_text = pos_tagged_text
 		self.ner_tagged_text = ner_tagged_text
+
+class Token_frequency(db.Model):
+	__tablename__ = 'token_frequency'
+	__table_args__ = (PrimaryKeyConstraint('token', 'country_language', 'study', 'year', 'item_type'),
+	Index('token_frequency_language_idx', 'language', 'token'),
+	)
+
+	token = db.Column(db.String)
+	country_language = db.Column(db.String)
+	language = db.Column(db.String)
+	study = db.Column(db.String)
+	year = db.Column(db.Integer)
+	item_type = db.Column(db.String)
+	segments = db.Column(db.Integer)
+	occurrences = db.Column(db.Integer)
+
+	def __init__(self, token, country_language, language, study, year, item_type, segments, occurrences):
+		self.token = token
+		self.country_language = country_language
+		self.language = language
+		self.study = study
+		self.year = year
+		self.item_type = item_type
+		self.segments = segments
+		self.occurrences = occurrences
+
+class Subcorpus(db.Model):
+	__tablename__ = 'subcorpus'
+	__table_args__ = (PrimaryKeyConstraint('country_language', 'study', 'year', 'item_type'),)
+
+	country_language = db.Column(db.String)
+	language = db.Column(db.String)
+	study = db.Column(db.String)
+	year = db.Column(db.Integer)
+	item_type = db.Column(db.String)
+	segments = db.Column(db.Integer)
+	tokens = db.Column(db.BigInteger)
+	fingerprint = db.Column(db.String)
+
+	def __init__(self, country_language, language, study, year, item_type, segments, tokens, fingerprint):
+		self.country_language = country_language
+		self.language = language
+		self.study = study
+		self.year = year
+		self.item_type = item_type
+		self.segments = segments
+		self.tokens = tokens
+		self.fingerprint = fingerprint
+
+class Corpus_version(db.Model):
+	__tablename__ = 'corpus_version'
+	__table_args__ = (PrimaryKeyConstraint('version'),)
+
+	version = db.Column(db.BigInteger)
+
+	def __init__(self, version):
+		self.version = version
+
+class Token_frequency_refresh(db.Model):
+	__tablename__ = 'token_frequency_refresh'
+	__table_args__ = (PrimaryKeyConstraint('corpus_version'),)
+
+	corpus_version = db.Column(db.BigInteger)
+	refreshed = db.Column(db.DateTime)
+
+	def __init__(self, corpus_version, refreshed):
+		self.corpus_version = corpus_version
+		self.refreshed = refreshed
+
+class Token(db.Model):
+	__tablename__ = 'token'
+	__table_args__ = (PrimaryKeyConstraint('tokenid'),
+	UniqueConstraint('token', name='token_token_key'),
+	)
+
+	tokenid = db.Column(db.Integer, autoincrement=True)
+	token = db.Column(db.String, nullable=False)
+
+	def __init__(self, token):
+		self.token = token
+
+class Survey_item_tokens(db.Model):
+	__tablename__ = 'survey_item_tokens'
+	__table_args__ = (PrimaryKeyConstraint('survey_itemid'),)
+
+	survey_itemid = db.Column(db.String)
+	tokens = db.Column(ARRAY(db.Integer))
+
+	def __init__(self, survey_itemid, tokens):
+		self.survey_itemid = survey_itemid
+		self.tokens = tokens
+
+class Tokenized_questionnaire(db.Model):
+	__tablename__ = 'tokenized_questionnaire'
+	__table_args__ = (PrimaryKeyConstraint('study', 'year', 'country_language'),)
+
+	study = db.Column(db.String)
+	year = db.Column(db.Integer)
+	country_language = db.Column(db.String)
+	fingerprint = db.Column(db.String)
+
+	def __init__(self, study, year, country_language, fingerprint):
+		self.study = study
+		self.year = year
+		self.country_language = country_language
+		self.fingerprint = fingerprint
+
+class Token_store_refresh(db.Model):
+	__tablename__ = 'token_store_refresh'
+	__table_args__ = (PrimaryKeyConstraint('corpus_version'),)
+
+	corpus_version = db.Column(db.BigInteger)
+	refreshed = db.Column(db.DateTime)
+
+	def __init__(self, corpus_version, refreshed):
+		self.corpus_version = corpus_version
+		self.refreshed = refreshed
+
+class Job(db.Model):
+	__tablename__ = 'job'
+	__table_args__ = (PrimaryKeyConstraint('jobid'),
+	Index('job_owner_idx', 'owner', 'created'),
+	Index('job_expires_idx', 'status', 'expires'),
+	)
+
+	jobid = db.Column(db.String)
+	kind = db.Column(db.String)
+	parameters = db.Column(db.Text)
+	owner = db.Column(db.String)
+	status = db.Column(db.String)
+	progress = db.Column(db.Float)
+	message = db.Column(db.String)
+	result_path = db.Column(db.String)
+	filename = db.Column(db.String)
+	content_type = db.Column(db.String)
+	created = db.Column(db.DateTime)
+	started = db.Column(db.DateTime)
+	finished = db.Column(db.DateTime)
+	expires = db.Column(db.DateTime)
+
+	def __init__(self, jobid, kind, parameters, owner, status, created):
+		self.jobid = jobid
+		self.kind = kind
+		self.parameters = parameters
+		self.owner = owner
+		self.status = status
+		self.progress = 0
+		self.created = created
@@ -0,0 +1,428 @@
+import functools
+import hashlib
+import os
+import nltk
+import numpy as np
+import pandas as pd
+from nltk.collocations import BigramCollocationFinder, TrigramCollocationFinder
+from flask import current_app
+from . import db
+from .cache import get_corpus_version
+from .queries import SearchQuery, execute_query, unescape_apostrophes, get_full_word_condition
+from .searches import get_columnid_name, compute_word_search_for_collocation
+from .tokens import vocabulary
+
+# Precomputed n-gram count index for the collocations.
+# For each questionnaire of the token store (see tokens.py), the index lists the bigrams and trigrams of each survey item.
+# An n-gram is identified by the token ids of its words, packed into a 64-bit key (TOKEN_ID_BITS bits per token), so keys
+# are comparable across questionnaires. Each index file holds, for each n-gram size, the sorted keys of the n-grams of the
+# questionnaire and, for each survey item (sorted by survey_itemid), the positions of its n-grams in these keys, in the
+# compressed sparse row layout (an array of positions and an array of offsets per survey item).
+# The collocations of a word are then the most frequent n-grams of the survey items containing it: their rows are
+# gathered and counted with numpy.bincount(), and the counts of the questionnaires involved are merged by key, only for
+# the n-grams that can be in the top (see merge_ngram_counts()).
+# The ranking is the one of the NLTK collocation finders with the raw frequency measure (by frequency, ties by the words),
+# which are still used for the questionnaires that have no index.
+# The index files are built by the build-ngram-indexes command, named after the token store fingerprint of the
+# questionnaire, so they go stale when it is tokenized again, and after the corpus version the token store was refreshed
+# from (see tokens.py). The indexes are only used for the current corpus version: after a corpus load, and until the
+# token store and the indexes are built again, the collocations are computed from the survey items tokenized on the fly.
+
+NGRAM_SIZES = {'bigram': 2, 'trigram': 3}
+
+TOKEN_ID_BITS = 21
+
+# Number of questionnaire indexes kept in memory by each process
+NGRAM_INDEX_CACHE_SIZE = 64
+
+
+def get_ngram_keys(tokens, document_of_token, size):
+	"""
+	Computes the keys of the n-grams of a sequence of documents. N-grams do not cross the document boundaries.
+
+	Args:
+		param1 tokens (numpy array): the token ids of all the documents, one after the other (int64).
+		param2 document_of_token (numpy array): the document of each token.
+		param3 size (int): the number of tokens of the n-grams (2 or 3).
+
+	Returns:
+
+		A tuple with the keys of the n-grams (numpy array of int64) and the document of each n-gram (numpy array).
+	"""
+	positions = np.arange(max(len(tokens)-size+1, 0))
+	positions = positions[document_of_token[positions] == document_of_token[positions+size-1]]
+	keys = np.zeros(len(positions), dtype=np.int64)
+	for i in range(size):
+		keys = (keys << TOKEN_ID_BITS) | tokens[positions+i]
+	return keys, document_of_token[positions]
+
+
+def decode_ngram_key(key, size):
+	"""
+	Unpacks the token ids of an n-gram key.
+	"""
+	mask = (1 << TOKEN_ID_BITS) - 1
+	return [(int(key) >> (TOKEN_ID_BITS*(size-1-i))) & mask for i in range(size)]
+
+
+def build_ngram_index(survey_itemids, documents):
+	"""
+	Builds the n-gram index of the survey items of a questionnaire.
+
+	Args:
+		param1 survey_itemids (list): the ids of the survey items (strings).
+		param2 documents (list): the token ids of each survey item (lists of integers).
+
+	Returns:
+
+		A dictionary of numpy arrays: survey_itemids, and the keys, positions and offsets of each n-gram size.
+	"""
+	order = np.argsort(np.array(survey_itemids, dtype=str), kind='mergesort')
+	survey_itemids = np.array(survey_itemids, dtype=str)[order]
+	documents = [documents[i] for i in order]
+
+	lengths = np.array([len(document) for document in documents], dtype=np.int64)
+	tokens = np.fromiter((tokenid for document in documents for tokenid in document), dtype=np.int64, count=int(lengths.sum()))
+	document_of_token = np.repeat(np.arange(len(documents)), lengths)
+
+	index = {'survey_itemids': survey_itemids}
+	for size in NGRAM_SIZES.values():
+		keys, document_of_ngram = get_ngram_keys(tokens, document_of_token, size)
+		unique_keys, positions = np.unique(keys, return_inverse=True)
+		offsets = np.zeros(len(documents)+1, dtype=np.int64)
+		offsets[1:] = np.cumsum(np.bincount(document_of_ngram, minlength=len(documents)))
+		index['keys'+str(size)] = unique_keys
+		index['positions'+str(size)] = positions.astype(np.int32)
+		index['offsets'+str(size)] = offsets
+
+	return index
+
+
+def count_ngrams(index, rows, size):
+	"""
+	Counts the n-grams of some survey items of a questionnaire.
+
+	Args:
+		param1 index (dictionary): the n-gram index of the questionnaire.
+		param2 rows (numpy array): the rows of the survey items in the index.
+		param3 size (int): the number of tokens of the n-grams (2 or 3).
+
+	Returns:
+
+		A tuple with the keys of the n-grams found and their counts (numpy arrays).
+	"""
+	offsets = index['offsets'+str(size)]
+	starts = offsets[rows]
+	lengths = offsets[rows+1]-starts
+	gathered = np.repeat(starts-np.cumsum(lengths)+lengths, lengths)+np.arange(lengths.sum())
+
+	keys = index['keys'+str(size)]
+	counts = np.bincount(index['positions'+str(size)][gathered], minlength=len(keys))
+	found = counts > 0
+	return keys[found], counts[found]
+
+
+def sum_ngram_counts(counted, keys):
+	"""
+	Sums the counts of some n-grams in several questionnaires.
+
+	Args:
+		param1 counted (list): the keys (sorted) and counts of the n-grams found in each questionnaire (tuples of numpy arrays).
+		param2 keys (numpy array): the keys of the n-grams to sum.
+
+	Returns:
+
+		The total count of each n-gram (numpy array).
+	"""
+	totals = np.zeros(len(keys), dtype=np.int64)
+	for questionnaire_keys, questionnaire_counts in counted:
+		positions = np.minimum(np.searchsorted(questionnaire_keys, keys), len(questionnaire_keys)-1)
+		found = questionnaire_keys[positions] == keys
+		totals[found] += questionnaire_counts[positions[found]]
+	return totals
+
+
+def merge_ngram_counts(counted, n_collocations):
+	"""
+	Merges the counts of the n-grams found in several questionnaires, keeping only the n-grams that can be in the top
+	n_collocations. The n-grams with the highest counts in each questionnaire give a lower bound of the count of the last
+	one of the top, and an n-gram whose total count reaches that bound must reach the bound divided by the number of
+	questionnaires in at least one of them. Only the n-grams that do are summed.
+
+	Args:
+		param1 counted (list): the keys (sorted) and counts of the n-grams found in each questionnaire (tuples of numpy arrays).
+		param2 n_collocations (int): the number of n-grams that will be returned.
+
+	Returns:
+
+		A tuple with the keys of the n-grams (sorted, without repetitions) and their total counts (numpy arrays).
+	"""
+	counted = [x for x in counted if len(x[0])]
+	if not counted:
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+	if len(counted) == 1:
+		return counted[0]
+
+	seeds = [keys if len(keys) <= n_collocations else keys[np.argpartition(counts, len(counts)-n_collocations)[len(counts)-n_collocations:]]
+		for keys, counts in counted]
+	seeds = np.unique(np.concatenate(seeds))
+	if len(seeds) < n_collocations:
+		bound = 0
+	else:
+		totals = sum_ngram_counts(counted, seeds)
+		bound = np.partition(totals, len(totals)-n_collocations)[len(totals)-n_collocations]
+
+	keys = np.unique(np.concatenate([keys[counts*len(counted) >= bound] for keys, counts in counted]))
+	return keys, sum_ngram_counts(counted, keys)
+
+
+def get_top_ngrams(keys, counts, n_collocations, size, decode):
+	"""
+	Ranks n-grams by count and then by their words, as the NLTK collocation finders with the raw frequency measure.
+	Only the n-grams that can be in the top n_collocations (the ones with at least the count of the last one) are decoded.
+
+	Args:
+		param1 keys (numpy array): the keys of the n-grams, possibly repeated (e.g. counted in several questionnaires).
+		param2 counts (numpy array): the count of each key.
+		param3 n_collocations (int): the number of n-grams to return.
+		param4 size (int): the number of tokens of the n-grams (2 or 3).
+		param5 decode (function): decodes lists of token ids into lists of tokens (see tokens.TokenVocabulary).
+
+	Returns:
+
+		A list with the words (tuple of strings) of the top n-grams.
+	"""
+	keys, inverse = np.unique(keys, return_inverse=True)
+	counts = np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+	if len(keys) == 0 or n_collocations < 1:
+		return []
+
+	if len(keys) > n_collocations:
+		threshold = np.partition(counts, len(counts)-n_collocations)[len(counts)-n_collocations]
+		candidates = counts >= threshold
+		keys = keys[candidates]
+		counts = counts[candidates]
+
+	words = decode([decode_ngram_key(key, size) for key in keys])
+	ranked = sorted(zip(counts.tolist(), words), key=lambda x: (-x[0], tuple(x[1])))
+	return [tuple(x[1]) for x in ranked[:n_collocations]]
+
+
+def find_collocations(documents, measure, n_collocations):
+	"""
+	Finds the collocations of tokenized documents with the NLTK collocation finders, ranked by raw frequency.
+
+	Args:
+		param1 documents (list): the tokens (lists of strings) of each document.
+		param2 measure (string): 'bigram' or 'trigram'.
+		param3 n_collocations (int): the number of collocations to return.
+
+	Returns:
+
+		A list with the words (tuple of strings) of the collocations.
+	"""
+	if measure == 'bigram':
+		finder = BigramCollocationFinder.from_documents(documents)
+		return finder.nbest(nltk.collocations.BigramAssocMeasures().raw_freq, int(n_collocations))
+	else:
+		finder = TrigramCollocationFinder.from_documents(documents)
+		return finder.nbest(nltk.collocations.TrigramAssocMeasures().raw_freq, int(n_collocations))
+
+
+def get_ngram_index_path(study, year, country_language, fingerprint, version):
+	"""
+	Gets the path of the n-gram index file of a questionnaire, for a given token store fingerprint and corpus version.
+	"""
+	name = hashlib.sha1('|'.join([str(study), str(year), str(country_language), str(fingerprint), str(version)]).encode('utf-8')).hexdigest()
+	return os.path.join(current_app.config['NGRAM_INDEX_DIR'], name+'.npz')
+
+
+def write_ngram_index(path, study, year, country_language):
+	"""
+	Builds the n-gram index of a questionnaire from the token store and writes it to a file. The file is written under
+	a temporary name and then renamed, so a partially written index is never read.
+	"""
+	survey_itemids = []
+	documents = []
+	for result in db.session.execute("""select t.survey_itemid, t.tokens from survey_item_tokens t join survey_item s using (survey_itemid)
+	where s.study = :study and s.year = :year and s.country_language = :country_language""",
+	{'study': study, 'year': year, 'country_language': country_language}):
+		survey_itemids.append(result[0])
+		documents.append(result[1])
+
+	temporary_path = path+'.tmp'
+	with open(temporary_path, 'wb') as f:
+		np.savez_compressed(f, **build_ngram_index(survey_itemids, documents))
+	os.replace(temporary_path, path)
+
+
+def build_ngram_indexes():
+	"""
+	Builds the n-gram indexes of the questionnaires of the token store that are missing for their current fingerprint,
+	and removes the stale ones. The indexes are built for the corpus version recorded by the last refresh of the token
+	store, so they are not used if it is not the current one.
+
+	Returns:
+
+		The number of indexes built, kept and removed (tuple of integers).
+	"""
+	directory = current_app.config['NGRAM_INDEX_DIR']
+	os.makedirs(directory, exist_ok=True)
+
+	max_tokenid = db.session.execute("select coalesce(max(tokenid), 0) from token").scalar()
+	if max_tokenid >= 1 << TOKEN_ID_BITS:
+		raise ValueError('Token ids do not fit in '+str(TOKEN_ID_BITS)+' bits, the n-gram keys cannot be built.')
+
+	version = db.session.execute("select max(corpus_version) from token_store_refresh").scalar()
+	questionnaires = db.session.execute("select study, year, country_language, fingerprint from tokenized_questionnaire").fetchall()
+
+	built = 0
+	kept = 0
+	current = set()
+	for study, year, country_language, fingerprint in questionnaires:
+		path = get_ngram_index_path(study, year, country_language, fingerprint, version)
+		current.add(os.path.basename(path))
+		if os.path.exists(path):
+			kept += 1
+		else:
+			write_ngram_index(path, study, year, country_language)
+			built += 1
+
+	db.session.close()
+	db.session.remove()
+
+	removed = 0
+	for name in os.listdir(directory):
+		if name not in current:
+			os.remove(os.path.join(directory, name))
+			removed += 1
+
+	return built, kept, removed
+
+
+@functools.lru_cache(maxsize=NGRAM_INDEX_CACHE_SIZE)
+def load_ngram_index(path):
+	"""
+	Reads an n-gram index file. The file name changes with the fingerprint of the questionnaire and the corpus version,
+	so cached indexes never go stale.
+	"""
+	with np.load(path) as index:
+		return {name: index[name] for name in index.files}
+
+
+def get_index_rows(index, survey_itemids):
+	"""
+	Finds the rows of survey items in an n-gram index.
+
+	Returns:
+
+		The rows (numpy array), or None if a survey item is not in the index (e.g. it was added after the index was built).
+	"""
+	survey_itemids = np.array(survey_itemids, dtype=str)
+	rows = np.searchsorted(index['survey_itemids'], survey_itemids)
+	if np.any(rows >= len(index['survey_itemids'])):
+		return None
+	if np.any(index['survey_itemids'][rows] != survey_itemids):
+		return None
+	return rows
+
+
+def get_indexed_collocations(word, country_language, year, study, item_type, measure, n_collocations):
+	"""
+	Computes the collocations of a word from the n-gram indexes of the questionnaires where it is found.
+
+	Returns:
+
+		A list with the words (tuple of strings) of the collocations, None if the word is not found, or False if a
+		questionnaire where the word is found has no n-gram index for its fingerprint and the current corpus version.
+	"""
+	version = get_corpus_version()
+	query = SearchQuery('survey_item left join tokenized_questionnaire using (study, year, country_language)',
+		['survey_itemid', 'study', 'year', 'country_language', 'fingerprint'])
+	query.where(*get_full_word_condition('text', unescape_apostrophes(word), country_language))
+	query.filter_metadata(country_language, year, study)
+	if item_type != 'No filter':
+		query.where(get_columnid_name(item_type)+" is not null")
+	results = execute_query(query).fetchall()
+
+	survey_itemids = {}
+	for result in results:
+		survey_itemids.setdefault(tuple(result[1:]), []).append(result[0])
+
+	size = NGRAM_SIZES[measure]
+	counted = []
+	for (study, year, country_language, fingerprint), ids in survey_itemids.items():
+		path = get_ngram_index_path(study, year, country_language, fingerprint, version)
+		if fingerprint is None or not os.path.exists(path):
+			db.session.close()
+			db.session.remove()
+			return False
+		index = load_ngram_index(path)
+		rows = get_index_rows(index, ids)
+		if rows is None:
+			db.session.close()
+			db.session.remove()
+			return False
+		counted.append(count_ngrams(index, rows, size))
+
+	if not counted:
+		collocations = None
+	else:
+		keys, counts = merge_ngram_counts(counted, int(n_collocations))
+		collocations = get_top_ngrams(keys, counts, int(n_collocations), size, vocabulary.decode)
+
+	db.session.close()
+	db.session.remove()
+
+	return collocations
+
+
+def search_collocations(word, country_language, year, study, item_type, measure, n_collocations):
+	"""
+	Computes the collocations of a word in the survey items that contain it, ranked by frequency. The n-gram indexes are
+	used when they are built for the current corpus version for all the questionnaires involved, otherwise the tokens of
+	the survey items are read (see compute_word_search_for_collocation()) and the collocations found with the NLTK finders.
+
+	Args:
+		param1 word (string): the word that will be used to compute collocations.
+		param2 country_language (string): country and language questionnaire metadata.
+		param3 year (string): year metadata filter. Indicates in which year a given study was released.
+		param4 study (string): study questionnaire metadata. Can be ESS, EVS, SHARE or WIS.
+		param5 item_type (string): item type metadata filter. Can be INTRODUCTION, INSTRUCTION, REQUEST or RESPONSE.
+		param6 measure (string): 'bigram' or 'trigram'.
+		param7 n_collocations (int): the number of collocations to return.
+
+	Returns:
+
+		A list with the words (tuple of strings) of the collocations, or None if the word is not found.
+	"""
+	collocations = get_indexed_collocations(word, country_language, year, study, item_type, measure, n_collocations)
+	if collocations is not False:
+		return collocations
+
+	documents = compute_word_search_for_collocation(word, country_language, year, study, item_type)
+	if not documents:
+		return None
+	return find_collocations(documents, measure, n_collocations)
+
+
+def get_collocations_dataframe(collocations, measure):
+	"""
+	Builds the results dataframe of the collocations of a word.
+	"""
+	if measure == 'bigram':
+		return pd.DataFrame.from_records(collocations, columns=['word 1', 'word 2'])
+	else:
+		return pd.DataFrame.from_records(collocations, columns=['word 1', 'word 2', 'word 3'])
+
+
+def get_collocations_comparison_dataframe(collocations1, collocations2, measure):
+	"""
+	Builds the results dataframe of the comparison of the collocations of two words, side by side.
+	"""
+	rows = [c1+c2 for c1, c2 in zip(collocations1, collocations2)]
+	if measure == 'bigram':
+		return pd.DataFrame.from_records(rows, columns=['word 1 (first word)', 'word 2 (first word)', 'word 1 (second word)', 'word 2 (second word)'])
+	else:
+		return pd.DataFrame.from_records(rows, columns=['word 1 (first word)', 'word 2 (first word)', 'word 3 (first word)',
+		'word 1 (second word)', 'word 2 (second word)', 'word 3 (second word)'])
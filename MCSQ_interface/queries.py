@@ -0,0 +1,510 @@
+import base64
+import hashlib
+import json
+from collections import namedtuple
+from flask import g, has_app_context
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from . import db
+from .schema import TEXT_SEARCH_CONFIGURATIONS, DEFAULT_TEXT_SEARCH_CONFIGURATION
+
+
+class SearchQuery:
+	"""
+	Composable specification of a search query. Conditions are added with '?' placeholders for the user inputs,
+	which are always sent to PostgreSQL as bound parameters, never concatenated into the SQL text.
+	Since the SQL text only depends on the shape of the search (which filters are used), and not on the values searched for,
+	the same statement is reused by all searches with the same shape (see execute_query()).
+	"""
+	def __init__(self, table, columns):
+		self.table = table
+		self.columns = list(columns)
+		self.column_parameters = []
+		self.conditions = []
+		self.parameters = []
+		self.group_by = []
+		self.order_by = []
+		self.limit = None
+
+	def select(self, column, *parameters):
+		"""
+		Adds a column (or an aggregate) to the query.
+
+		Args:
+			param1 column (string): SQL expression of the column, with one '?' placeholder per parameter.
+			param2 parameters: the values of the placeholders, in order.
+
+		Returns:
+
+			The query itself, so calls can be chained.
+		"""
+		self.columns.append(column)
+		self.column_parameters.extend(parameters)
+		return self
+
+	def where(self, condition, *parameters):
+		"""
+		Adds a condition to the query.
+
+		Args:
+			param1 condition (string): SQL condition, with one '?' placeholder per parameter.
+			param2 parameters: the values of the placeholders, in order.
+
+		Returns:
+
+			The query itself, so calls can be chained.
+		"""
+		self.conditions.append(condition)
+		self.parameters.extend(parameters)
+		return self
+
+	def filter_metadata(self, country_language='No filter', year='No filter', study='No filter', item_type='No filter', prefix=''):
+		"""
+		Adds the metadata filters selected by the user. Filters set to 'No filter' are ignored.
+
+		Args:
+			param1 country_language (string): country and language (e.g. CAT_ES) or just language (e.g. CAT) metadata.
+			param2 year (string): year metadata. Indicates in which year a given study was released.
+			param3 study (string): study questionnaire metadata.
+			param4 item_type (string): item type metadata. Can be INTRODUCTION, INSTRUCTION, REQUEST or RESPONSE.
+			param5 prefix (string): prefix of the country_language/language columns, 'target_' for the Alignment table.
+
+		Returns:
+
+			The query itself, so calls can be chained.
+		"""
+		if study != 'No filter':
+			self.where("study = ?", get_study_code(study))
+		if year != 'No filter':
+			self.where("year = ?", int(year))
+		if country_language != 'No filter':
+			self.where(*get_country_language_condition(country_language, prefix))
+		if item_type != 'No filter':
+			self.where("item_type ilike ?", item_type)
+		return self
+
+	def group(self, *columns):
+		"""
+		Sets the grouping of the results, for queries with aggregate columns.
+
+		Returns:
+
+			The query itself, so calls can be chained.
+		"""
+		self.group_by = list(columns)
+		return self
+
+	def order(self, *columns):
+		"""
+		Sets the ordering of the results.
+
+		Returns:
+
+			The query itself, so calls can be chained.
+		"""
+		self.order_by = list(columns)
+		return self
+
+	def to_sql(self, named=False):
+		"""
+		Renders the query as a PostgreSQL statement with positional parameters ($1, $2, ...).
+
+		Args:
+			param1 named (boolean): renders named bind parameters (:p0, :p1, ...) instead, for statements that are not prepared.
+
+		Returns:
+
+			A tuple with the SQL text (string) and the list of parameters.
+		"""
+		sql = "select "+", ".join(self.columns)+" from "+self.table
+		if self.conditions:
+			sql = sql+" where "+" and ".join(self.conditions)
+		if self.group_by:
+			sql = sql+" group by "+", ".join(self.group_by)
+		if self.order_by:
+			sql = sql+" order by "+", ".join(self.order_by)
+		if self.limit is not None:
+			sql = sql+" limit "+str(int(self.limit))
+
+		pieces = sql.split('?')
+		sql = pieces[0]
+		for i, piece in enumerate(pieces[1:]):
+			if named:
+				sql = sql+":p"+str(i)+piece
+			else:
+				sql = sql+"$"+str(i+1)+piece
+
+		return sql, self.column_parameters+self.parameters
+
+
+def execute_query(query):
+	"""
+	Executes a search query as a prepared statement. Each distinct SQL text is prepared once per database connection,
+	and the names of the statements already prepared are kept in the connection info dictionary (which lives as long
+	as the pooled DBAPI connection), so repeated searches skip the parse and plan steps.
+
+	Args:
+		param1 query (SearchQuery): the query to be executed.
+
+	Returns:
+
+		The result proxy of the query.
+	"""
+	sql, parameters = query.to_sql()
+	statement_name = 'mcsq_'+hashlib.sha1(sql.encode('utf-8')).hexdigest()[:24]
+
+	connection = db.session.connection()
+	prepared_statements = connection.info.setdefault('prepared_statements', set())
+	if statement_name not in prepared_statements:
+		connection.execute(text("prepare "+statement_name+" as "+sql))
+		prepared_statements.add(statement_name)
+
+	if parameters:
+		placeholders = ", ".join(":p"+str(i) for i in range(len(parameters)))
+		values = {"p"+str(i): value for i, value in enumerate(parameters)}
+		return connection.execute(text("execute "+statement_name+"("+placeholders+")"), values)
+	else:
+		return connection.execute(text("execute "+statement_name))
+
+
+@event.listens_for(Session, 'after_begin')
+def apply_statement_timeout(session, transaction, connection):
+	"""
+	Applies the statement timeout of the current application context (g.statement_timeout, in milliseconds) to every
+	transaction of the database session. The timeout is set again each time the session begins a transaction, so it
+	holds even when the session is closed between the queries of a search (e.g. when the corpus version is checked).
+	"""
+	if has_app_context() and g.get('statement_timeout'):
+		connection.execute(text("set local statement_timeout = "+str(int(g.statement_timeout))))
+
+
+def stream_query(query, batch_size, connection=None):
+	"""
+	Executes a search query through a named server-side cursor, reading the results in batches, so exports of any size
+	are sent to the user without holding all of their rows in memory. Unless a connection is given, the cursor runs on
+	its own connection, which is closed when the generator is exhausted or closed. The connection is only opened on the
+	first iteration, which must happen inside the application context.
+
+	Args:
+		param1 query (SearchQuery): the query to be executed.
+		param2 batch_size (int): the number of rows fetched from the cursor at a time.
+		param3 connection (Connection): the connection to run the cursor on, left open (see open_snapshot_connection()).
+
+	Returns:
+
+		A generator of lists of rows.
+	"""
+	sql, parameters = query.to_sql(named=True)
+	values = {"p"+str(i): value for i, value in enumerate(parameters)}
+
+	own_connection = connection is None
+	if own_connection:
+		connection = db.engine.connect()
+	try:
+		results = connection.execution_options(stream_results=True).execute(text(sql), values)
+		try:
+			while True:
+				rows = results.fetchmany(batch_size)
+				if not rows:
+					break
+				yield rows
+		finally:
+			results.close()
+	finally:
+		if own_connection:
+			connection.close()
+
+
+def open_snapshot_connection():
+	"""
+	Opens a connection with a REPEATABLE READ transaction, so that the queries run on it, such as the two passes of a
+	deduplicated export, all see the same snapshot of the corpus. The transaction is read only and ends (rolled back)
+	when the connection is closed.
+
+	Returns:
+
+		The connection (Connection).
+	"""
+	connection = db.engine.connect().execution_options(isolation_level='REPEATABLE READ')
+	connection.begin()
+	connection.execute(text("set transaction read only"))
+	return connection
+
+
+# A page of results of a keyset paginated search. The cursor is the (encoded) key of the last row of the previous page
+# when moving forward, or of the first row of the next page when moving backward (direction 'prev'). No cursor means the first page.
+Page = namedtuple('Page', ['cursor', 'direction', 'size'])
+
+
+class PagedResults:
+	"""
+	The rows of a page of results, plus the total number of results and the cursors of the previous and next pages.
+	"""
+	def __init__(self, rows, total, prev_cursor, next_cursor):
+		self.rows = rows
+		self.total = total
+		self.prev_cursor = prev_cursor
+		self.next_cursor = next_cursor
+
+	def __iter__(self):
+		return iter(self.rows)
+
+	def __len__(self):
+		return len(self.rows)
+
+
+def encode_cursor(values):
+	"""
+	Encodes the key of a row as an opaque, URL safe cursor (string).
+	"""
+	return base64.urlsafe_b64encode(json.dumps(list(values)).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+	"""
+	Decodes a cursor created by encode_cursor(). Invalid cursors are decoded as None (first page).
+	"""
+	try:
+		return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+	except (ValueError, TypeError, AttributeError):
+		return None
+
+
+def build_count_query(query):
+	"""
+	Builds the query that counts the results of a search query, with the same conditions.
+	"""
+	count = SearchQuery(query.table, ['count(*)'])
+	count.conditions = list(query.conditions)
+	count.parameters = list(query.parameters)
+	return count
+
+
+def execute_paged_query(query, key_columns, page):
+	"""
+	Executes a search query with keyset pagination: instead of skipping rows with an offset, the rows are filtered
+	by the key of the last (or first) row of the adjacent page and read in key order, so every page costs the same
+	and is served by the index of the key columns. The total number of results is computed by a count query with the same conditions.
+
+	Args:
+		param1 query (SearchQuery): the query to be executed.
+		param2 key_columns (list): the columns (strings) that uniquely identify and order the results (e.g. survey_itemid).
+		param3 page (Page): the page to retrieve, or None to retrieve all results.
+
+	Returns:
+
+		The result proxy of the query if page is None, otherwise a PagedResults object.
+	"""
+	if page is None:
+		return execute_query(query)
+
+	total = execute_query(build_count_query(query)).scalar()
+
+	backward = page.direction == 'prev'
+	for column in key_columns:
+		query.select(column)
+	values = decode_cursor(page.cursor) if page.cursor else None
+	if values is not None and len(values) == len(key_columns):
+		placeholders = ", ".join("?" for column in key_columns)
+		operator = " < " if backward else " > "
+		query.where("("+", ".join(key_columns)+")"+operator+"("+placeholders+")", *values)
+	else:
+		values = None
+		backward = False
+	query.order(*[column+(" desc" if backward else "") for column in key_columns])
+	query.limit = page.size+1
+
+	rows = execute_query(query).fetchall()
+	has_more = len(rows) > page.size
+	rows = rows[:page.size]
+	if backward:
+		rows.reverse()
+
+	prev_cursor = None
+	next_cursor = None
+	if rows:
+		first = encode_cursor(rows[0][-len(key_columns):])
+		last = encode_cursor(rows[-1][-len(key_columns):])
+		if backward:
+			prev_cursor = first if has_more else None
+			next_cursor = last
+		else:
+			prev_cursor = first if values is not None else None
+			next_cursor = last if has_more else None
+
+	return PagedResults(rows, total, prev_cursor, next_cursor)
+
+
+def add_page_info(df, results):
+	"""
+	Stores the pagination information of a page of results in the attributes of the dataframe built from it.
+
+	Args:
+		param1 df (dataframe): the pandas dataframe built from the results.
+		param2 results: the results returned by execute_paged_query().
+	"""
+	if isinstance(results, PagedResults):
+		df.attrs['page'] = {'total': results.total, 'rows': len(results.rows),
+		'prev_cursor': results.prev_cursor, 'next_cursor': results.next_cursor}
+
+
+def get_study_code(study):
+	"""
+	Returns the study code used in the MCSQ IDs. SHARE is the only study whose code differs from its name.
+
+	Args:
+		param1 study (string): study questionnaire metadata. Can be ESS, EVS, SHARE or WIS.
+
+	Returns:
+
+		The study code (string).
+	"""
+	if study == 'SHARE':
+		return 'SHA'
+	return study
+
+
+def unescape_apostrophes(word):
+	"""
+	Users escape apostrophes by doubling them (e.g., d''acord), as the words used to be concatenated into the query.
+	Since words are now bound parameters, the escaping is undone before searching.
+
+	Args:
+		param1 word (string): the word (or multiple words) that the user wants to search for.
+
+	Returns:
+
+		The word (string) without the apostrophe escaping.
+	"""
+	return word.replace("''", "'")
+
+
+def get_country_language_condition(country_language, prefix=''):
+	"""
+	Builds the condition that filters by the country_language (e.g. CAT_ES) or language (e.g. CAT) metadata columns.
+	The language-only options of the download and TMX forms are passed through the same parameter, so a value without an
+	underscore is matched against the language column instead.
+
+	Args:
+		param1 country_language (string): country and language (or just language) questionnaire metadata.
+		param2 prefix (string): prefix of the metadata columns, 'target_' for the Alignment table.
+
+	Returns:
+
+		A tuple with the condition (string) followed by its parameter.
+	"""
+	if '_' in country_language:
+		return prefix+"country_language = ?", country_language
+	else:
+		return prefix+"language = ?", country_language
+
+
+def get_country_languages_condition(country_languages, prefix=''):
+	"""
+	Builds the condition that filters by several country_language (or language) values at once, so the questionnaires
+	of all of them are retrieved with a single query (see get_country_language_condition()).
+
+	Args:
+		param1 country_languages (list): country and language (or just language) questionnaire metadata (strings).
+		param2 prefix (string): prefix of the metadata columns, 'target_' for the Alignment table.
+
+	Returns:
+
+		A tuple with the condition (string) followed by its parameters.
+	"""
+	conditions = []
+	parameters = []
+	country_language_values = sorted(set(x for x in country_languages if '_' in x))
+	language_values = sorted(set(x for x in country_languages if '_' not in x))
+	if country_language_values:
+		conditions.append(prefix+"country_language = any(?)")
+		parameters.append(country_language_values)
+	if language_values:
+		conditions.append(prefix+"language = any(?)")
+		parameters.append(language_values)
+
+	return ("("+" or ".join(conditions)+")",) + tuple(parameters)
+
+
+def get_text_search_configuration(country_language):
+	"""
+	Returns the text search configuration used to index the texts of a given language (see TEXT_SEARCH_CONFIGURATIONS in schema.py).
+
+	Args:
+		param1 country_language (string): country and language (or just language) questionnaire metadata.
+
+	Returns:
+
+		The name of the PostgreSQL text search configuration (string).
+	"""
+	language = country_language.split('_')[0]
+	return TEXT_SEARCH_CONFIGURATIONS.get(language, DEFAULT_TEXT_SEARCH_CONFIGURATION)
+
+
+def get_condition_by_configuration(condition, word, country_language, prefix=''):
+	"""
+	Builds a condition that depends on the text search configuration used to index each row (see get_full_word_condition()).
+	If a language filter is applied, the condition is built with the configuration of that language, otherwise
+	it is built for each configuration and restricted to the rows of the languages indexed with it.
+
+	Args:
+		param1 condition (string): the condition, with a {configuration} field and one '?' placeholder for the word.
+		param2 word (string): the word that the user wants to search for.
+		param3 country_language (string): country and language (or just language) questionnaire metadata.
+		param4 prefix (string): prefix of the language column, 'target_' for the Alignment table.
+
+	Returns:
+
+		A tuple with the condition (string) followed by its parameters.
+	"""
+	if country_language != 'No filter':
+		return (condition.format(configuration=get_text_search_configuration(country_language)), word)
+
+	languages_by_configuration = {}
+	for language, configuration in TEXT_SEARCH_CONFIGURATIONS.items():
+		if configuration != DEFAULT_TEXT_SEARCH_CONFIGURATION:
+			languages_by_configuration.setdefault(configuration, []).append("\'"+language+"\'")
+
+	conditions = []
+	for configuration, languages in sorted(languages_by_configuration.items()):
+		conditions.append("("+prefix+"language in ("+", ".join(languages)+") and "+condition.format(configuration=configuration)+")")
+	other_languages = [language for languages in languages_by_configuration.values() for language in languages]
+	conditions.append("("+prefix+"language not in ("+", ".join(other_languages)+") and "+condition.format(configuration=DEFAULT_TEXT_SEARCH_CONFIGURATION)+")")
+
+	return ("("+" or ".join(conditions)+")",) + (word,) * len(conditions)
+
+
+def get_full_word_condition(column, word, country_language, prefix=''):
+	"""
+	Builds the full word search condition over the stored tsvector column of a given text column (e.g. text_tsv for text).
+	The query must be parsed with the same configuration that was used to index each row, so if no language filter is applied
+	the condition is built for each configuration and restricted to the rows of the languages indexed with it.
+	The resulting condition is served by the GIN index of the tsvector column.
+
+	Args:
+		param1 column (string): name of the text column (text, source_text or target_text).
+		param2 word (string): the word (or words, separated by &) that the user wants to search for.
+		param3 country_language (string): country and language (or just language) questionnaire metadata.
+		param4 prefix (string): prefix of the language column, 'target_' for the Alignment table.
+
+	Returns:
+
+		A tuple with the condition (string) followed by its parameters.
+	"""
+	return get_condition_by_configuration(column+"_tsv @@ to_tsquery(\'{configuration}\', ?)", word, country_language, prefix)
+
+
+def get_token_condition(word, country_language):
+	"""
+	Builds the condition that matches the token column of the Token frequency table against a word,
+	normalized (e.g. stemmed) with the same text search configuration used to build the token frequencies.
+
+	Args:
+		param1 word (string): the word that the user wants to search for.
+		param2 country_language (string): country and language (or just language) questionnaire metadata.
+
+	Returns:
+
+		A tuple with the condition (string) followed by its parameters.
+	"""
+	return get_condition_by_configuration("token = any(tsvector_to_array(to_tsvector(\'{configuration}\', ?)))", word, country_language)
@@ -6,7 +6,7 @@ import re
 from .models import db, Survey, Module, Alignment, Survey_item, Instruction, Introduction, Request, Response, User
 from .searches import *
 from .utils import *
-from flask import Flask, request, render_template, make_response,redirect, flash
+from flask import Flask, request, render_template, make_response,redirect, flash, jsonify
 from datetime import datetime as dt
 from flask import current_app as app
 import pandas as pd
@@ -15,11 +15,14 @@ from wtforms import StringField, SubmitField, PasswordField
 from wtforms.validators import DataRequired
 from os.path import join, dirname
 from flask_login import UserMixin, login_required, current_user, login_user,logout_user
-import nltk
-from nltk.collocations import *
-from nltk.tokenize import TweetTokenizer
 import string
 from .tmx import *
+from .cache import get_result_cache
+from .metadata import metadata_cache
+from .artifacts import serve_export_artifact
+from .item_matrix import compare_whole_questionnaires
+from .ngrams import search_collocations, get_collocations_dataframe, get_collocations_comparison_dataframe
+from .jobs import submit_job, get_job, get_job_status, get_job_result_response
 from flask import Response
 
 from flask_jwt_extended import create_access_token, decode_token
@@ -279,6 +282,14 @@ def logout():
 	return redirect('/')
 
 
+@app.context_processor
+def inject_export_formats():
+	"""
+	Tells the search forms if the columnar download formats (Parquet, Arrow) can be offered.
+	"""
+	return {'columnar_formats': columnar_formats_available()}
+
+
 @app.route('/', methods=['GET'])
 def index():
 	"""
@@ -309,15 +320,12 @@ def display_survey():
 	Displays which questionnaires are available in the MCSQ.
 	"""
 	if current_user.is_authenticated:
-		surveys = db.session.query(Survey).all()
 		lst = []
-		for survey in surveys:
-			item = {'Survey ID': survey.surveyid, 'Study': survey.study, 'Wave or Round': survey.wave_round, 
-			'Year': survey.year, 'Language/Country': survey.country_language}
+		for survey in metadata_cache.get_surveys():
+			item = {'Survey ID': survey['surveyid'], 'Study': survey['study'], 'Wave or Round': survey['wave_round'], 
+			'Year': survey['year'], 'Language/Country': survey['country_language']}
 			lst.append(item)
 
-		db.session.close()
-		db.session.remove()
 		df = pd.DataFrame.from_dict(lst)
 		return render_template('display_table.html', maintitle='Questionnaires available in MCSQ',table=df.to_html(), title ='MCSQ Survey Collection')
 	else:
@@ -331,14 +339,11 @@ def display_modules():
 	Displays which modules are present across all questionnaires.
 	"""
 	if current_user.is_authenticated:
-		modules = db.session.query(Module).all()
 		lst = []
-		for module in modules:
-			item = {'Module ID': module.moduleid, 'Module Name': module.module_name}
+		for module in metadata_cache.get_modules():
+			item = {'Module ID': module['moduleid'], 'Module Name': module['module_name']}
 			lst.append(item)
 
-		db.session.close()
-		db.session.remove()
 		df = pd.DataFrame.from_dict(lst)
 		return render_template('display_table.html', maintitle='Modules in MCSQ',table=df.to_html(), title ='MCSQ Module Collection')
 	else:
@@ -352,21 +357,14 @@ def download_survey():
 	Creates a pandas dataframe of the survey table and outputs it for the user as a tab separated csv.
 	"""
 	if current_user.is_authenticated:
-		surveys = db.session.query(Survey).all()
 		lst = []
-		for survey in surveys:
-			item = {'Survey ID': survey.surveyid, 'Study': survey.study, 'Wave or Round': survey.wave_round, 
-			'Year': survey.year, 'Country/Language': survey.country_language}
+		for survey in metadata_cache.get_surveys():
+			item = {'Survey ID': survey['surveyid'], 'Study': survey['study'], 'Wave or Round': survey['wave_round'], 
+			'Year': survey['year'], 'Country/Language': survey['country_language']}
 			lst.append(item)
 
-		db.session.close()
-		db.session.remove()
 		df = pd.DataFrame.from_dict(lst)
-		resp = make_response(df.to_csv(sep='\t', encoding='utf-8-sig', index=False))
-		resp.headers["Content-Disposition"] = "attachment; filename=results.tsv"
-		resp.headers["Content-Type"] = "text/csv"
-
-		return resp
+		return results_export(df, get_export_format(request.args))
 	else:
 		return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
 
@@ -378,20 +376,13 @@ def download_modules():
 	Creates a pandas dataframe of the module table and outputs it for the user as a tab separated csv.
 	"""
 	if current_user.is_authenticated:
-		modules = db.session.query(Module).all()
 		lst = []
-		for module in modules:
-			item = {'Module ID': module.moduleid, 'Module Name': module.module_name}
+		for module in metadata_cache.get_modules():
+			item = {'Module ID': module['moduleid'], 'Module Name': module['module_name']}
 			lst.append(item)
 
-		db.session.close()
-		db.session.remove()
 		df = pd.DataFrame.from_dict(lst)
-		resp = make_response(df.to_csv(sep='\t', encoding='utf-8-sig', index=False))
-		resp.headers["Content-Disposition"] = "attachment; filename=results.tsv"
-		resp.headers["Content-Type"] = "text/csv"
-
-		return resp
+		return results_export(df, get_export_format(request.args))
 	else:
 		return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
 
@@ -433,17 +424,20 @@ def search_request():
 						flash(error_message, "danger")
 						return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 
-				df = call_appropriated_word_search_method('requestid', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search)
-				
+				if csv:
+					resp = stream_results_export(get_export_format(request.values), *build_word_search_query('requestid', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search))
+					if resp is None:
+						flash("No results found for your search!", "warning")
+						return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
+					return resp
+
+				df = call_appropriated_word_search_method('requestid', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search, page=get_page(request.form))
+
 				if df.empty:
 					flash("No results found for your search!", "warning")
 					return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 				else:
-					if csv:
-						resp = results_to_csv(df)
-						return resp
-
-					return render_template('display_table.html', maintitle='Search results',table=df.to_html(), title ='Search results for the word "'+str(word)+'" in MCSQ Request Collection')
+					return render_results_page(df, 'Search results', 'Search results for the word "'+str(word)+'" in MCSQ Request Collection')
 	
 		return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 	else:
@@ -486,17 +480,20 @@ def search_instruction():
 						flash(error_message, "danger")
 						return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 
-				df = call_appropriated_word_search_method('instructionid', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search)
+				if csv:
+					resp = stream_results_export(get_export_format(request.values), *build_word_search_query('instructionid', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search))
+					if resp is None:
+						flash("No results found for your search!", "warning")
+						return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
+					return resp
+
+				df = call_appropriated_word_search_method('instructionid', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search, page=get_page(request.form))
 
 				if df.empty:
 					flash("No results found for your search!", "warning")
 					return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 				else:
-					if csv:
-						resp = results_to_csv(df)
-						return resp
-
-					return render_template('display_table.html', maintitle='Search results',table=df.to_html(), title ='Search results for the word(s) "'+str(word)+'" in MCSQ Instruction Collection')
+					return render_results_page(df, 'Search results', 'Search results for the word(s) "'+str(word)+'" in MCSQ Instruction Collection')
 		return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 	else:
 		return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
@@ -538,16 +535,20 @@ def search_introduction():
 						flash(error_message, "danger")
 						return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 
-				df = call_appropriated_word_search_method('introductionid', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search)
+				if csv:
+					resp = stream_results_export(get_export_format(request.values), *build_word_search_query('introductionid', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search))
+					if resp is None:
+						flash("No results found for your search!", "warning")
+						return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
+					return resp
+
+				df = call_appropriated_word_search_method('introductionid', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search, page=get_page(request.form))
 
 				if df.empty:
 					flash("No results found for your search!", "warning")
 					return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 				else:
-					if csv:
-						resp = results_to_csv(df)
-						return resp
-					return render_template('display_table.html', maintitle='Search results',table=df.to_html(), title ='Search results for the word '+str(word)+' in MCSQ Introduction Collection')
+					return render_results_page(df, 'Search results', 'Search results for the word '+str(word)+' in MCSQ Introduction Collection')
 		return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 	else:
 		return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
@@ -589,17 +590,20 @@ def search_response():
 						return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 
 
-				df = call_appropriated_word_search_method('responseid', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search)
+				if csv:
+					resp = stream_results_export(get_export_format(request.values), *build_word_search_query('responseid', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search))
+					if resp is None:
+						flash("No results found for your search!", "warning")
+						return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
+					return resp
+
+				df = call_appropriated_word_search_method('responseid', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search, page=get_page(request.form))
 
 				if df.empty:
 					flash("No results found for your search!", "warning")
 					return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 				else:
-					if csv:
-						resp = results_to_csv(df)
-						return resp
-
-					return render_template('display_table.html', maintitle='Search results',table=df.to_html(), title ='Search results for the word '+str(word)+' in MCSQ Response Collection')
+					return render_results_page(df, 'Search results', 'Search results for the word '+str(word)+' in MCSQ Response Collection')
 		return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 	else:
 		return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
@@ -641,17 +645,20 @@ def search_survey_item():
 						flash(error_message, "danger")
 						return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 
-				df = call_appropriated_word_search_method('', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search)
+				if csv:
+					resp = stream_results_export(get_export_format(request.values), *build_word_search_query('', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search))
+					if resp is None:
+						flash("No results found for your search!", "warning")
+						return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
+					return resp
+
+				df = call_appropriated_word_search_method('', word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex_search, page=get_page(request.form))
 
 				if df.empty:
 					flash("No results found for your search!", "warning")
 					return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 				else:
-					if csv:
-						resp = results_to_csv(df)
-						return resp
-
-					return render_template('display_table.html', maintitle='Search results',table=df.to_html(), title ='Search results for the word '+str(word)+' in MCSQ')
+					return render_results_page(df, 'Search results', 'Search results for the word '+str(word)+' in MCSQ')
 		return render_template('word_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 	else:
 		return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
@@ -707,17 +714,20 @@ def search_alignment():
 							flash(error_message, "danger")
 							return render_template('alignment_search.html', langcountriestarget=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 
-				df = call_appropriated_word_search_method('alignment', [source_word, target_word], case_sensitive, partial, langcountrytarget, year,  study, multiple_words, displaytagged, regex_search)
+				if csv:
+					resp = stream_results_export(get_export_format(request.values), *build_word_search_query('alignment', [source_word, target_word], case_sensitive, partial, langcountrytarget, year,  study, multiple_words, displaytagged, regex_search))
+					if resp is None:
+						flash("No results found for your search!", "warning")
+						return render_template('alignment_search.html', langcountriestarget=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
+					return resp
+
+				df = call_appropriated_word_search_method('alignment', [source_word, target_word], case_sensitive, partial, langcountrytarget, year,  study, multiple_words, displaytagged, regex_search, page=get_page(request.form))
 
 				if df.empty:
 					flash("No results found for your search!", "warning")
 					return render_template('alignment_search.html', langcountriestarget=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 				else:
-					if csv:
-						resp = results_to_csv(df)
-						return resp
-
-					return render_template('display_table.html', maintitle='Search results',table=df.to_html(), title ='Search results retrieved from MCSQ Alignment Collection')
+					return render_results_page(df, 'Search results', 'Search results retrieved from MCSQ Alignment Collection')
 				
 		return render_template('alignment_search.html', langcountriestarget=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 	else:
@@ -788,17 +798,9 @@ def compare_by_word():
 								flash("Full word search is only case insensitive!", "warning")
 								return render_template('compare_by_word.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 							else:
-								results = []
-								for country_lang in list_all_country_lang:
-									df = compare_by_word_case_insensitive(word, country_lang, year, study, multiple_words, partial)
-									if df.empty == False:
-										results.append(df)
+								results = [df for df in compare_by_word_case_insensitive(word, country_lang_filters, year, study, multiple_words, partial) if df.empty == False]
 						else:
-							results = []
-							for country_lang in list_all_country_lang:
-								df = compare_by_word_case_insensitive(word, country_lang, year, study, multiple_words, partial)
-								if df.empty == False:
-									results.append(df)
+							results = [df for df in compare_by_word_case_insensitive(word, country_lang_filters, year, study, multiple_words, partial) if df.empty == False]
 				
 						if len(results)<2:
 							flash('There are no valid results for this filter combination', "warning")
@@ -806,11 +808,7 @@ def compare_by_word():
 						else:
 							results = manipulate_results_dataframe(results)
 							if csv:
-								resp = make_response(results.to_csv(sep='\t', encoding='utf-8-sig', index=False))
-								resp.headers["Content-Disposition"] = "attachment; filename=results.tsv"
-								resp.headers["Content-Type"] = "text/csv"
-
-								return resp
+								return results_export(results, get_export_format(request.values))
 
 							return render_template('display_table.html', maintitle='Search results',table=results.to_html(),title ='Comparing by word')					
 		else:
@@ -859,11 +857,7 @@ def compare_by_item_type():
 						flash('Select at least two country/language pairs to compare', "warning")
 						return render_template('compare_by_type.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options)
 					else:
-						results = []
-						for country_lang in list_all_country_lang:		
-							df = search_to_compare_by_item_type(country_lang,year,study,item_type)
-							if df.empty == False:
-								results.append(df)
+						results = [df for df in search_to_compare_by_item_type(country_lang_filters,year,study,item_type) if df.empty == False]
 						
 						if len(results)<2:
 							flash('There are no valid studies for one or more country/language pairs indicated in the filters', "warning")
@@ -871,11 +865,7 @@ def compare_by_item_type():
 						else:
 							results = manipulate_results_dataframe(results)
 							if csv:
-								resp = make_response(results.to_csv(sep='\t', encoding='utf-8-sig', index=False))
-								resp.headers["Content-Disposition"] = "attachment; filename=results.tsv"
-								resp.headers["Content-Type"] = "text/csv"
-
-								return resp
+								return results_export(results, get_export_format(request.values))
 		
 							return render_template('display_table.html', maintitle='Search results',table=results.to_html(),title ='Comparing by item type')					
 		else:
@@ -920,23 +910,19 @@ def compare_whole():
 						flash('Select at least two country/language pairs to compare', "warning")
 						return render_template('compare_whole.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 					else:
-						results = []
-						for country_lang in list_all_country_lang:		
-							df = search_to_compare_item_type_independent(country_lang,year,study)
-							if df.empty == False:
-								results.append(df)
+						if request.form.get('background'):
+							jobid = submit_job('compare_whole', {'study': study, 'year': year, 'country_languages': country_lang_filters,
+								'format': get_export_format(request.values)}, current_user.email)
+							return redirect('/jobs/'+jobid)
+
+						results = compare_whole_questionnaires(country_lang_filters,year,study)
 						
-						if len(results)<2:
+						if results is None:
 							flash('There are no valid studies for one or more country/language pairs indicated in the filters', "warning")
 							return render_template('compare_whole.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 						else:
-							results = manipulate_results_dataframe(results)
 							if csv:
-								resp = make_response(results.to_csv(sep='\t', encoding='utf-8-sig', index=False))
-								resp.headers["Content-Disposition"] = "attachment; filename=results.tsv"
-								resp.headers["Content-Type"] = "text/csv"
-
-								return resp
+								return results_export(results, get_export_format(request.values))
 							return render_template('display_table.html', maintitle='Search results',table=results.to_html(),title ='Comparing whole questionnaires')	
 		else:
 			return render_template('compare_whole.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
@@ -961,38 +947,24 @@ def word_frequency():
 				item_type = request.form.get('item_type')
 				multiple_words = request.form.get('multiplew')
 				combined_frequency = request.form.get('combined')
+				facets = request.form.get('facets')
 
-				if ';' in word and not combined_frequency and not multiple_words:
-					flash("Semicolons are valid only for Multiple/Combined word filters.", "warning")
-					return render_template('word_frequency.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options)
-				if '!' in word or ':' in word or ',' in word or '.' in word or '&' in word or ')' in word or '(' in word or '/' in word or '\\' in word or '*' in word or '%' in word or '#' in word or '|' in word or '=' in word or '~' in word or 'º' in word or 'ª' in word:
-					flash("Special characters are not allowed in the word search.", "warning")
-					return render_template('word_frequency.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options)
-				if combined_frequency and multiple_words:
-					flash("Cannot use both Multiple/Combined word filters at the same time, one must be chosen.", "warning")
-					return render_template('word_frequency.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options)
-				if ' ' in word or '\t' in word or '\n' in word:
-					flash("Word search cannot contain spaces (or tabs, or line breaks). If you want to search for multiple words, mark the 'Multiple word search?' option and separate words by semicolon (e.g., read;this)", "warning")
-					return render_template('word_frequency.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options)
-				if '"' in word or '`' in word:
-					flash("Quotes are not allowed in the word search.", "warning")
-					return render_template('word_frequency.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options)
-				if word.count("'") % 2 != 0:
-					flash("Please use double 's for escaping words that contain apostrophes (e.g., d''acord instead of d'acord).", "warning")
+				error_message = check_frequency_search_restrictions(word, multiple_words, combined_frequency)
+				if error_message != '':
+					flash(error_message, "warning")
 					return render_template('word_frequency.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options)
 
-				df = compute_word_frequency(word, language_country, year,  study, multiple_words, combined_frequency, item_type)
+				if facets:
+					df = compute_word_frequency_by_facets(word, language_country, year,  study, multiple_words, combined_frequency, item_type)
+				else:
+					df = compute_word_frequency(word, language_country, year,  study, multiple_words, combined_frequency, item_type)
 				
 				if df.empty:
 					flash("No results found for your search!", "warning")
 					return render_template('word_frequency.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options)
 				else:
 					if csv:
-						resp = make_response(df.to_csv(sep='\t', encoding='utf-8-sig', index=False))
-						resp.headers["Content-Disposition"] = "attachment; filename=results.tsv"
-						resp.headers["Content-Type"] = "text/csv"
-
-						return resp
+						return results_export(df, get_export_format(request.values))
 
 					return render_template('display_table.html', maintitle='Search results',table=df.to_html(), title ='Frequency of the word(s) "'+str(word)+'" in MCSQ')
 		return render_template('word_frequency.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options)
@@ -1000,98 +972,6 @@ def word_frequency():
 		return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
 
 
-def tokenize_texts(text_list):
-	preprocessed_text = []
-	tknzr = TweetTokenizer()
-	for text in text_list:
-		if isinstance(text, str):
-			text = text.replace('-',' ')
-			text = text.replace('\n',' ')
-			text = text.replace('\t',' ')
-			text = text.replace('—',' ')
-			text = text.replace('…',' ')
-			text = text.replace('‘',"'")
-			text = text.replace('`',"'")
-			text = text.replace('“',' ')
-			text = text.replace('“',' ')
-
-			text = text.rstrip()
-			text = text.lstrip()
-			
-			tokens = tknzr.tokenize(text.lower())
-			tokens_without_punct = []
-			for token in tokens: 
-				token = re.sub(r"[^\w\d'\s]+",'',token) 
-				if token != '' and token != '«' and token != '»':
-					tokens_without_punct.append(token)
-
-			preprocessed_text.append(tokens_without_punct)
-
-
-	return preprocessed_text
-
-def tokenize_and_produce_collocations(text_list, measure, n_collocations):
-	if measure == 'bigram':
-		bigram_measures = nltk.collocations.BigramAssocMeasures()
-		preprocessed_text = tokenize_texts(text_list)
-		finder = BigramCollocationFinder.from_documents(preprocessed_text)
-		collocations = finder.nbest(bigram_measures.raw_freq, int(n_collocations))
-		ret = pd.DataFrame(columns=['word 1', 'word 2'])
-
-		for item in collocations:
-			data = {'word 1': item[0], 'word 2': item[1]}
-			ret = ret.append(data, ignore_index=True)
-	else:
-		trigram_measures = nltk.collocations.TrigramAssocMeasures()
-		preprocessed_text = tokenize_texts(text_list)
-		finder = TrigramCollocationFinder.from_documents(preprocessed_text)
-		collocations = finder.nbest(trigram_measures.raw_freq, int(n_collocations))
-		ret = pd.DataFrame(columns=['word 1', 'word 2', 'word 3'])
-
-		for item in collocations:
-			data = {'word 1': item[0], 'word 2': item[1], 'word 3': item[2]}
-			ret = ret.append(data, ignore_index=True)
-
-
-	return ret
-
-def tokenize_and_produce_collocations_comparison(text_list1, text_list2, measure, n_collocations):
-	if measure == 'bigram':
-		bigram_measures = nltk.collocations.BigramAssocMeasures()
-		preprocessed_text1 = tokenize_texts(text_list1)
-		finder = BigramCollocationFinder.from_documents(preprocessed_text1)
-		collocations1 = finder.nbest(bigram_measures.raw_freq, int(n_collocations))
-
-		preprocessed_text2 = tokenize_texts(text_list2)
-		finder = BigramCollocationFinder.from_documents(preprocessed_text2)
-		collocations2 = finder.nbest(bigram_measures.raw_freq, int(n_collocations))
-
-		ret = pd.DataFrame(columns=['word 1 (first word)', 'word 2 (first word)', 'word 1 (second word)', 'word 2 (second word)'])
-
-		for c1, c2 in zip(collocations1, collocations2):
-			data = {'word 1 (first word)': c1[0], 'word 2 (first word)': c1[1], 'word 1 (second word)': c2[0], 'word 2 (second word)': c2[1]}
-			ret = ret.append(data, ignore_index=True)
-	else:
-		trigram_measures = nltk.collocations.TrigramAssocMeasures()
-		preprocessed_text1 = tokenize_texts(text_list1)
-		finder = TrigramCollocationFinder.from_documents(preprocessed_text1)
-		collocations1 = finder.nbest(trigram_measures.raw_freq, n_collocations)
-
-		preprocessed_text2 = tokenize_texts(text_list2)
-		finder = TrigramCollocationFinder.from_documents(preprocessed_text2)
-		collocations2 = finder.nbest(trigram_measures.raw_freq, n_collocations)
-
-		ret = pd.DataFrame(columns=['word 1 (first word)', 'word 2 (first word)', 'word 3 (first word)',
-		 'word 1 (second word)', 'word 2 (second word)', 'word 3 (second word)'])
-
-		for c1, c2 in zip(collocations1, collocations2):
-			data = {'word 1 (first word)': c1[0], 'word 2 (first word)': c1[1],  'word 3 (first word)': c1[2],
-			'word 1 (second word)': c2[0], 'word 2 (second word)': c2[1], 'word 3 (second word)': c2[2]}
-			ret = ret.append(data, ignore_index=True)
-
-
-	return ret
-
 @app.route('/collocation', methods=['GET', 'POST'])
 @login_required
 def compute_collocation():
@@ -1118,36 +998,25 @@ def compute_collocation():
 				else:
 					measure = 'bigram'
 				
-				if ';' in word:
-					flash("Semicolons are not valid characters in the collocation functionality", "warning")
-					return render_template('word_collocation.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, n_collocations=n_collocation_options)
-				if ' ' in word or '\t' in word or '\n' in word:
-					flash("Word search cannot contain spaces (or tabs, or line breaks). If you want to search for multiple words, mark the 'Multiple word search?' option and separate words by semicolon (e.g., read;this)", "warning")
-					return render_template('word_collocation.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, n_collocations=n_collocation_options)
-				if '"' in word or '`' in word:
-					flash("Quotes are not allowed in the word search.", "warning")
-					return render_template('word_collocation.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, n_collocations=n_collocation_options)
-				if '!' in word or ':' in word or ',' in word or '.' in word or '&' in word or ')' in word or '(' in word or '/' in word or '\\' in word or '*' in word or '%' in word or '#' in word or '|' in word or '=' in word or '~' in word or 'º' in word or 'ª' in word:
-					flash("Special characters are not allowed in the word search.", "warning")
-					return render_template('word_collocation.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, n_collocations=n_collocation_options)
-				if word.count("'") % 2 != 0:
-					flash("Please use double 's for escaping words that contain apostrophes (e.g., d''acord instead of d'acord).", "warning")
+				error_message = check_collocation_search_restrictions(word)
+				if error_message != '':
+					flash(error_message, "warning")
 					return render_template('word_collocation.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, n_collocations=n_collocation_options)
 
+				if request.form.get('background'):
+					jobid = submit_job('collocation', {'word': word, 'country_language': language_country, 'year': year, 'study': study,
+						'item_type': item_type, 'n_collocations': int(n_collocations), 'measure': measure, 'format': get_export_format(request.values)}, current_user.email)
+					return redirect('/jobs/'+jobid)
+
+				collocations = search_collocations(word, language_country, year, study, item_type, measure, int(n_collocations))  
 				
-				text_list = compute_word_search_for_collocation(word, language_country, year, study, item_type)  
-				
-				if not text_list:
+				if collocations is None:
 					flash("No results found for your search!", "warning")
 					return render_template('word_collocation.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, n_collocations=n_collocation_options)
 				else:
-					df = tokenize_and_produce_collocations(text_list, measure, n_collocations)
+					df = get_collocations_dataframe(collocations, measure)
 					if csv:
-						resp = make_response(df.to_csv(sep='\t', encoding='utf-8-sig', index=False))
-						resp.headers["Content-Disposition"] = "attachment; filename=results.tsv"
-						resp.headers["Content-Type"] = "text/csv"
-
-						return resp
+						return results_export(df, get_export_format(request.values))
 					return render_template('display_table.html', maintitle='Search results',table=df.to_html(), title ='Collocations for the word "'+str(word)+'" in MCSQ, ranked by frequency')
 		return render_template('word_collocation.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, n_collocations=n_collocation_options)
 	else:
@@ -1213,26 +1082,22 @@ def compare_collocation():
 					flash("Special characters are not allowed in the word search.", "warning")
 					return render_template('compare_word_collocation.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, n_collocations=n_collocation_options)
 					
-				text_list1 = compute_word_search_for_collocation(word1, language_country, year, study, item_type)  
-				text_list2 = compute_word_search_for_collocation(word2, language_country2, year2, study2, item_type2) 
+				collocations1 = search_collocations(word1, language_country, year, study, item_type, measure, int(n_collocations))  
+				collocations2 = search_collocations(word2, language_country2, year2, study2, item_type2, measure, int(n_collocations)) 
 				
-				if not text_list1 and not text_list2:
+				if collocations1 is None and collocations2 is None:
 					flash("No results found for your search!", "warning")
 					return render_template('compare_word_collocation.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, n_collocations=n_collocation_options)
-				elif not text_list1:
+				elif collocations1 is None:
 					flash("No results found for the word "+word1+"!", "warning")
 					return render_template('compare_word_collocation.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, n_collocations=n_collocation_options)
-				elif not text_list2:
+				elif collocations2 is None:
 					flash("No results found for the word "+word2+"!", "warning")
 					return render_template('compare_word_collocation.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, n_collocations=n_collocation_options)
 				else:
-					df = tokenize_and_produce_collocations_comparison(text_list1, text_list2, measure, n_collocations)
+					df = get_collocations_comparison_dataframe(collocations1, collocations2, measure)
 					if csv:
-						resp = make_response(df.to_csv(sep='\t', encoding='utf-8-sig', index=False))
-						resp.headers["Content-Disposition"] = "attachment; filename=results.tsv"
-						resp.headers["Content-Type"] = "text/csv"
-
-						return resp
+						return results_export(df, get_export_format(request.values))
 					return render_template('display_table.html', maintitle='Search results',table=df.to_html(), title ='Comparing collocations for the words "'+str(word1)+'" and "'+str(word2)+'" in MCSQ, ranked by frequency')
 		return render_template('compare_word_collocation.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, n_collocations=n_collocation_options)
 	else:
@@ -1263,20 +1128,20 @@ def display_questionnaire():
 				flash("It is necessary to use at least two filters from the following: language/country, study or year.", "warning")
 				return render_template('display_data.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 			else:
-				df = get_questionnaire(language_country, year, study, displaytagged)
+				if csv:
+					resp = stream_results_export(get_export_format(request.values), *build_questionnaire_query(language_country, year, study, displaytagged))
+					if resp is None:
+						flash("No results found for your search!", "warning")
+						return render_template('display_data.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
+					return resp
+
+				df = get_questionnaire(language_country, year, study, displaytagged, page=get_page(request.form))
 
 				if df.empty:
 					flash("No results found for your search!", "warning")
 					return render_template('display_data.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 				else:
-					if csv:
-						resp = make_response(df.to_csv(sep='\t', encoding='utf-8-sig', index=False))
-						resp.headers["Content-Disposition"] = "attachment; filename=results.tsv"
-						resp.headers["Content-Type"] = "text/csv"
-
-						return resp
-
-					return render_template('display_table.html', maintitle='Search results',table=df.to_html(), title ='Search results')
+					return render_results_page(df, 'Search results', 'Search results')
 		return render_template('display_data.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 	else:
 		return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
@@ -1307,20 +1172,20 @@ def display_alignment():
 				flash("It is necessary to use at least two filters from the following: language/country, study or year.", "warning")
 				return render_template('display_data.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 			else:
-				df = get_alignment(language_country, year, study, displaytagged)
+				if csv:
+					resp = stream_results_export(get_export_format(request.values), *build_alignment_query(language_country, year, study, displaytagged))
+					if resp is None:
+						flash("No results found for your search!", "warning")
+						return render_template('display_data.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
+					return resp
+
+				df = get_alignment(language_country, year, study, displaytagged, page=get_page(request.form))
 
 				if df.empty:
 					flash("No results found for your search!", "warning")
 					return render_template('display_data.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 				else:
-					if csv:
-						resp = make_response(df.to_csv(sep='\t', encoding='utf-8-sig', index=False))
-						resp.headers["Content-Disposition"] = "attachment; filename=results.tsv"
-						resp.headers["Content-Type"] = "text/csv"
-
-						return resp
-
-					return render_template('display_table.html', maintitle='Search results',table=df.to_html(), title ='Search results')
+					return render_results_page(df, 'Search results', 'Search results')
 		return render_template('display_data.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 	else:
 		return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
@@ -1332,12 +1197,13 @@ def display_alignment():
 def download_questionnaire():
 	if current_user.is_authenticated:
 		language_options = ['No filter', 'CAT', 'CZE', 'ENG', 'FRE', 'GER', 'NOR', 'POR', 'RUS', 'SPA']
-		if request.method == 'POST':
-			language_country = request.form.get('langcountry')
-			language = request.form.get('lang')
-			study = request.form.get('study')
-			year = request.form.get('year')
-			displaytagged = request.form.get('displaytagged')
+		if request.method == 'POST' or request.args:
+			language_country = request.values.get('langcountry', 'No filter')
+			language = request.values.get('lang', 'No filter')
+			study = request.values.get('study', 'No filter')
+			year = request.values.get('year', 'No filter')
+			displaytagged = request.values.get('displaytagged')
+			export_format = get_export_format(request.values)
 			
 
 			if language != 'No filter' and language_country != 'No filter':
@@ -1348,18 +1214,25 @@ def download_questionnaire():
 				return render_template('download_data.html', langs=language_options, langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 			else:
 				if language != 'No filter':
-					df = get_questionnaire(language, year, study, displaytagged)
+					country_language = language
 				else:
-					df = get_questionnaire(language_country, year, study, displaytagged)
+					country_language = language_country
 
-				if df.empty:
+				if request.values.get('background'):
+					jobid = submit_job('download', {'export': 'questionnaire', 'country_language': country_language, 'year': year, 'study': study,
+						'displaytagged': bool(displaytagged), 'dedupe': False, 'format': export_format}, current_user.email)
+					return redirect('/jobs/'+jobid)
+
+				resp = None
+				if export_format == 'tsv':
+					resp = serve_export_artifact('questionnaire', country_language, year, study, displaytagged, "results.tsv", "text/csv")
+				if resp is None:
+					resp = stream_results_export(export_format, *build_questionnaire_query(country_language, year, study, displaytagged))
+
+				if resp is None:
 					flash("No results found for your search!", "warning")
 					return render_template('download_data.html', langs=language_options, langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 				else:
-					resp = make_response(df.to_csv(sep='\t', encoding='utf-8-sig', index=False))
-					resp.headers["Content-Disposition"] = "attachment; filename=results.tsv"
-					resp.headers["Content-Type"] = "text/csv"
-
 					return resp
 		return render_template('download_data.html', langs=language_options, langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 	else:
@@ -1371,12 +1244,14 @@ def download_questionnaire():
 def download_alignment():
 	if current_user.is_authenticated:
 		language_options = ['No filter', 'CAT', 'CZE', 'ENG', 'FRE', 'GER', 'NOR', 'POR', 'RUS', 'SPA']
-		if request.method == 'POST':
-			language_country = request.form.get('langcountry')
-			language = request.form.get('lang')
-			study = request.form.get('study')
-			year = request.form.get('year')
-			displaytagged = request.form.get('displaytagged')
+		if request.method == 'POST' or request.args:
+			language_country = request.values.get('langcountry', 'No filter')
+			language = request.values.get('lang', 'No filter')
+			study = request.values.get('study', 'No filter')
+			year = request.values.get('year', 'No filter')
+			displaytagged = request.values.get('displaytagged')
+			export_format = get_export_format(request.values)
+			dedupe = request.values.get('dedupe')
 
 			if language != 'No filter' and language_country != 'No filter':
 				flash("Use only language filter or language/country filter, not both!", "warning")
@@ -1386,18 +1261,25 @@ def download_alignment():
 				return render_template('download_data.html', langs=language_options, langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 			else:
 				if language != 'No filter':
-					df = get_alignment(language, year, study, displaytagged)
+					country_language = language
 				else:
-					df = get_alignment(language_country, year, study, displaytagged)
+					country_language = language_country
 
-				if df.empty:
+				if request.values.get('background'):
+					jobid = submit_job('download', {'export': 'alignment', 'country_language': country_language, 'year': year, 'study': study,
+						'displaytagged': bool(displaytagged), 'dedupe': bool(dedupe), 'format': export_format}, current_user.email)
+					return redirect('/jobs/'+jobid)
+
+				resp = None
+				if export_format == 'tsv' and not dedupe:
+					resp = serve_export_artifact('alignment', country_language, year, study, displaytagged, "results.tsv", "text/csv")
+				if resp is None:
+					resp = stream_results_export(export_format, *build_alignment_query(country_language, year, study, displaytagged), dedupe=dedupe)
+
+				if resp is None:
 					flash("No results found for your search!", "warning")
 					return render_template('download_data.html', langs=language_options, langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 				else:
-					resp = make_response(df.to_csv(sep='\t', encoding='utf-8-sig', index=False))
-					resp.headers["Content-Disposition"] = "attachment; filename=results.tsv"
-					resp.headers["Content-Type"] = "text/csv"
-
 					return resp
 
 		return render_template('download_data.html', langs=language_options, langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
@@ -1410,11 +1292,13 @@ def download_alignment():
 def create_tmx():
 	if current_user.is_authenticated:
 		language_options = ['No filter', 'CAT', 'CZE', 'ENG', 'FRE', 'GER', 'NOR', 'POR', 'RUS', 'SPA']
-		if request.method == 'POST':
-			language_country = request.form.get('langcountry')
-			language = request.form.get('lang')
-			study = request.form.get('study')
-			year = request.form.get('year')
+		if request.method == 'POST' or request.args:
+			language_country = request.values.get('langcountry', 'No filter')
+			language = request.values.get('lang', 'No filter')
+			study = request.values.get('study', 'No filter')
+			year = request.values.get('year', 'No filter')
+			mode = request.values.get('mode', 'pair')
+			dedupe = request.values.get('dedupe')
 
 			if language != 'No filter' and language_country != 'No filter':
 				flash("Use only language filter or language/country filter, not both!", "warning")
@@ -1422,26 +1306,41 @@ def create_tmx():
 			if language == 'No filter' and language_country == 'No filter' and study == 'No filter' and year == 'No filter':
 				flash("It is necessary to use at least one filter from the following: language, language/country, study or year.", "warning")
 				return render_template('create_tmx.html', langs=language_options, langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
-			if language == 'No filter' and language_country == 'No filter':
+			if language == 'No filter' and language_country == 'No filter' and mode == 'pair':
 				flash("Language or language/country filter is required to produce the TMX.", "warning")
 				return render_template('create_tmx.html', langs=language_options, langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 			else:
 				if language != 'No filter':
-					df, target_lang = get_alignment_for_tmx(language, year, study)
+					country_language = language
+				else:
+					country_language = language_country
+				export_name = define_export_name(language_country, language, study, year)
+
+				if mode == 'multi':
+					query = build_alignment_for_tmx_bundle_query(country_language, year, study, False)
+					write = lambda batches: iterMultiTargetTMX(batches, 'en', adminlang='en', segtype='phrase', datatype='PlainText', oEncoding='UTF-8')
+					resp = stream_export(query, write, export_name+".tmx", "text/xml")
+				elif mode == 'bundle':
+					query = build_alignment_for_tmx_bundle_query(country_language, year, study, True)
+					batch_size = app.config['EXPORT_BATCH_SIZE']
+					write = lambda batches: iterTMXBundle(batches, 'en', lambda targetlang: export_name+'_'+targetlang.upper()+".tmx", batch_size,
+						adminlang='en', segtype='phrase', datatype='PlainText', oEncoding='UTF-8')
+					resp = stream_export(query, write, export_name+".zip", "application/zip")
+				elif dedupe:
+					query, labels = build_alignment_for_tmx_query(country_language, year, study)
+					write = lambda batches: iterTMX(batches, 'en', labels[2], adminlang='en', segtype='phrase', datatype='PlainText', oEncoding='UTF-8', occurrences=True)
+					resp = stream_export(query, write, export_name+".tmx", "text/xml", (0, 2, 3))
 				else:
-					df, target_lang = get_alignment_for_tmx(language_country, year, study)
+					resp = serve_export_artifact('tmx', country_language, year, study, False, export_name+".tmx", "text/xml")
+					if resp is None:
+						query, labels = build_alignment_for_tmx_query(country_language, year, study)
+						write = lambda batches: iterTMX(batches, 'en', labels[2], adminlang='en', segtype='phrase', datatype='PlainText', oEncoding='UTF-8')
+						resp = stream_export(query, write, export_name+".tmx", "text/xml")
 
-				if df.empty:
+				if resp is None:
 					flash("No results found for your search!", "warning")
 					return render_template('create_tmx.html', langs=language_options, langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
 				else:
-					xml = createTMX(df, 'en', target_lang, adminlang='en', segtype='phrase', datatype='PlainText', oEncoding='UTF-8')
-					# return Response(xml, mimetype='text/xml')
-
-					resp = make_response(xml)
-					resp.headers["Content-Disposition"] = "attachment; filename="+define_export_name(language_country, language, study, year)+".tmx"
-					resp.headers["Content-Type"] = "text/xml"
-
 					return resp
 
 		return render_template('create_tmx.html', langs=language_options, langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year())
@@ -1487,20 +1386,73 @@ def search_by_pos_tags():
 					return render_template('pos_sequence_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, postags=get_pos_tag_options())
 				else:
 			
-					df = search_by_pos_tag_sequence(tag_filters, country_language, year, study, item_type, partial)
+					page = None if csv else get_page(request.form)
+					df = search_by_pos_tag_sequence(tag_filters, country_language, year, study, item_type, partial, page=page)
 
 					if df.empty:
 						flash("No results found for your search!", "warning")
 						return render_template('pos_sequence_search.html', langcountries=get_unique_language_country(),  studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, postags=get_pos_tag_options())
 					else:
 						if csv:
-							resp = make_response(df.to_csv(sep='\t', encoding='utf-8-sig', index=False))
-							resp.headers["Content-Disposition"] = "attachment; filename=results.tsv"
-							resp.headers["Content-Type"] = "text/csv"
-
-							return resp
-						return render_template('display_table.html', maintitle='Search results',table=df.to_html(),title ='Searching for Part-of-Speech tag sequence')					
+							return results_export(df, get_export_format(request.values))
+						return render_results_page(df, 'Search results', 'Searching for Part-of-Speech tag sequence')
 		else:
 			return render_template('pos_sequence_search.html', langcountries=get_unique_language_country(), studies=get_study_options(), years=get_unique_year(), item_types=item_type_options, postags=get_pos_tag_options())
 	else:
 		return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
+
+
+@app.route('/jobs/<jobid>', methods=['GET'])
+@login_required
+def job_status(jobid):
+	"""
+	Shows the status of a background job of the user, with the link to download its results when it is done.
+	"""
+	if current_user.is_authenticated:
+		job = get_job(jobid, current_user.email)
+		if job is None:
+			flash("Job not found!", "danger")
+			return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
+		return render_template('job_status.html', job=get_job_status(job))
+	else:
+		return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
+
+
+@app.route('/jobs/<jobid>/status', methods=['GET'])
+@login_required
+def job_status_json(jobid):
+	"""
+	Returns the status of a background job of the user as JSON.
+	"""
+	job = get_job(jobid, current_user.email)
+	if job is None:
+		return jsonify({'error': 'Job not found!'}), 404
+	return jsonify(get_job_status(job))
+
+
+@app.route('/jobs/<jobid>/download', methods=['GET'])
+@login_required
+def job_download(jobid):
+	"""
+	Downloads the results of a finished background job of the user.
+	"""
+	if current_user.is_authenticated:
+		job = get_job(jobid, current_user.email)
+		if job is None:
+			flash("Job not found!", "danger")
+			return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
+		if job.status != 'done':
+			flash("The results of this job are not available.", "warning")
+			return redirect('/jobs/'+jobid)
+		return get_job_result_response(job)
+	else:
+		return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
+
+
+@app.route('/cachestats', methods=['GET'])
+@login_required
+def cache_stats():
+	if current_user.is_authenticated:
+		return jsonify(get_result_cache().get_stats())
+	else:
+		return render_template('index.html',maintitle='MCSQ Interface', title='Welcome to the MCSQ Interface!')
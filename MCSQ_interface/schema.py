@@ -0,0 +1,192 @@
+from . import db
+
+# Schema upgrades applied on top of the original MCSQ tables.
+# Survey item IDs follow the STUDY_ROUND_YEAR_LANGUAGE_COUNTRY_ORDER format (e.g. ESS_R01_2002_CAT_ES_12).
+# The metadata encoded in them is stored as typed, generated columns, so it can be served by B-tree indexes.
+
+STUDY_EXPRESSION = "split_part({column}, '_', 1)"
+YEAR_EXPRESSION = "substring({column} from '^[^_]*_[^_]*_([0-9]+)_')::integer"
+COUNTRY_LANGUAGE_EXPRESSION = "substring({column} from '^[^_]*_[^_]*_[^_]*_(.*)_[^_]*$')"
+LANGUAGE_EXPRESSION = "split_part({column}, '_', 4)"
+ITEM_ORDER_EXPRESSION = "substring({column} from '_([0-9]+)$')::integer"
+
+# Text search configuration used for each MCSQ language. PostgreSQL has no Catalan nor Czech stemmer,
+# so these languages (and any language added later without a mapping) are indexed with the 'simple' configuration.
+TEXT_SEARCH_CONFIGURATIONS = {'ENG': 'english', 'FRE': 'french', 'GER': 'german', 'NOR': 'norwegian', 
+'POR': 'portuguese', 'RUS': 'russian', 'SPA': 'spanish', 'CAT': 'simple', 'CZE': 'simple'}
+DEFAULT_TEXT_SEARCH_CONFIGURATION = 'simple'
+
+
+def get_generated_column_ddl(table, column, column_type, expression):
+	"""
+	Builds the DDL statement that adds a stored generated column to an existing table.
+
+	Args:
+		param1 table (string): name of the table.
+		param2 column (string): name of the generated column.
+		param3 column_type (string): PostgreSQL type of the generated column.
+		param4 expression (string): SQL expression used to compute the column.
+
+	Returns:
+
+		The DDL statement (string).
+	"""
+	return "alter table "+table+" add column if not exists "+column+" "+column_type+" generated always as ("+expression+") stored"
+
+
+def get_text_search_configuration_expression(language_expression):
+	"""
+	Builds a SQL expression that picks the text search configuration (regconfig) of a row from its language.
+
+	Args:
+		param1 language_expression (string): SQL expression that evaluates to the language code of the row (e.g. CAT).
+
+	Returns:
+
+		A SQL CASE expression (string).
+	"""
+	expression = "case "+language_expression
+	for language, configuration in sorted(TEXT_SEARCH_CONFIGURATIONS.items()):
+		expression = expression+" when '"+language+"' then '"+configuration+"'::regconfig"
+	expression = expression+" else '"+DEFAULT_TEXT_SEARCH_CONFIGURATION+"'::regconfig end"
+
+	return expression
+
+
+def get_tsvector_expression(text_column, language_expression):
+	"""
+	Builds the SQL expression of a stored tsvector column, computed with the text search configuration of the row language.
+
+	Args:
+		param1 text_column (string): name of the column containing the text segment.
+		param2 language_expression (string): SQL expression that evaluates to the language code of the row.
+
+	Returns:
+
+		A SQL expression (string).
+	"""
+	return "to_tsvector("+get_text_search_configuration_expression(language_expression)+", coalesce("+text_column+", ''))"
+
+
+# Tables of the corpus, whose modifications increase the corpus version.
+CORPUS_TABLES = ['survey', 'survey_item', 'alignment']
+CORPUS_VERSION_QUERY = "select max(version) from corpus_version"
+
+SURVEY_ITEM_TSVECTOR_EXPRESSION = get_tsvector_expression('text', LANGUAGE_EXPRESSION.format(column='survey_itemid'))
+SOURCE_TEXT_TSVECTOR_EXPRESSION = "to_tsvector('english'::regconfig, coalesce(source_text, ''))"
+TARGET_TEXT_TSVECTOR_EXPRESSION = get_tsvector_expression('target_text', LANGUAGE_EXPRESSION.format(column='target_survey_itemid'))
+
+
+def get_metadata_columns_ddl():
+	"""
+	Builds the DDL statements that decompose the survey item IDs into study, year, country_language, language and item order columns,
+	in both the Survey item and the Alignment tables, and index them.
+
+	Returns:
+
+		A list of DDL statements (strings).
+	"""
+	statements = [
+		get_generated_column_ddl('survey_item', 'study', 'varchar', STUDY_EXPRESSION.format(column='survey_itemid')),
+		get_generated_column_ddl('survey_item', 'year', 'integer', YEAR_EXPRESSION.format(column='survey_itemid')),
+		get_generated_column_ddl('survey_item', 'language', 'varchar', LANGUAGE_EXPRESSION.format(column='survey_itemid')),
+		get_generated_column_ddl('survey_item', 'item_order', 'integer', ITEM_ORDER_EXPRESSION.format(column='survey_itemid')),
+		get_generated_column_ddl('alignment', 'study', 'varchar', STUDY_EXPRESSION.format(column='target_survey_itemid')),
+		get_generated_column_ddl('alignment', 'year', 'integer', YEAR_EXPRESSION.format(column='target_survey_itemid')),
+		get_generated_column_ddl('alignment', 'target_country_language', 'varchar', COUNTRY_LANGUAGE_EXPRESSION.format(column='target_survey_itemid')),
+		get_generated_column_ddl('alignment', 'target_language', 'varchar', LANGUAGE_EXPRESSION.format(column='target_survey_itemid')),
+		get_generated_column_ddl('alignment', 'target_item_order', 'integer', ITEM_ORDER_EXPRESSION.format(column='target_survey_itemid')),
+		"create index if not exists survey_item_metadata_idx on survey_item (study, year, country_language, item_order)",
+		"create index if not exists survey_item_country_language_idx on survey_item (country_language, item_order)",
+		"create index if not exists survey_item_language_idx on survey_item (language, study, year)",
+		"create index if not exists survey_item_year_idx on survey_item (year)",
+		"create index if not exists alignment_metadata_idx on alignment (study, year, target_country_language, target_item_order)",
+		"create index if not exists alignment_country_language_idx on alignment (target_country_language, target_item_order)",
+		"create index if not exists alignment_language_idx on alignment (target_language, study, year)",
+		"create index if not exists alignment_year_idx on alignment (year)",
+	]
+
+	return statements
+
+
+def get_text_search_columns_ddl():
+	"""
+	Builds the DDL statements that store a precomputed tsvector for the Survey item text and for the source and target texts
+	of the Alignment table, plus the GIN indexes used by the full word searches.
+
+	Returns:
+
+		A list of DDL statements (strings).
+	"""
+	statements = [
+		get_generated_column_ddl('survey_item', 'text_tsv', 'tsvector', SURVEY_ITEM_TSVECTOR_EXPRESSION),
+		get_generated_column_ddl('alignment', 'source_text_tsv', 'tsvector', SOURCE_TEXT_TSVECTOR_EXPRESSION),
+		get_generated_column_ddl('alignment', 'target_text_tsv', 'tsvector', TARGET_TEXT_TSVECTOR_EXPRESSION),
+		"create index if not exists survey_item_text_tsv_idx on survey_item using gin (text_tsv)",
+		"create index if not exists alignment_source_text_tsv_idx on alignment using gin (source_text_tsv)",
+		"create index if not exists alignment_target_text_tsv_idx on alignment using gin (target_text_tsv)",
+	]
+
+	return statements
+
+
+def get_trigram_indexes_ddl():
+	"""
+	Builds the DDL statements that enable the pg_trgm extension and create trigram GIN indexes over the text columns.
+	These indexes serve the partial ('like'/'ilike' with leading wildcards) and regex ('~'/'~*') searches, 
+	which cannot be served by B-tree nor tsvector indexes. They are not declared in models.py because they depend on the extension.
+
+	Returns:
+
+		A list of DDL statements (strings).
+	"""
+	statements = [
+		"create extension if not exists pg_trgm",
+		"create index if not exists survey_item_text_trgm_idx on survey_item using gin (text gin_trgm_ops)",
+		"create index if not exists alignment_source_text_trgm_idx on alignment using gin (source_text gin_trgm_ops)",
+		"create index if not exists alignment_target_text_trgm_idx on alignment using gin (target_text gin_trgm_ops)",
+	]
+
+	return statements
+
+
+def get_corpus_version_ddl():
+	"""
+	Builds the DDL statements of the corpus version: a single row counter, increased by a statement trigger whenever
+	the Survey, Survey item or Alignment tables are modified, so that precomputed data can be checked against the corpus
+	it was computed from.
+	The triggers do not see a load that drops and recreates the tables, which is why upgrade_schema() also increases the version.
+
+	Returns:
+
+		A list of DDL statements (strings).
+	"""
+	statements = ["create table if not exists corpus_version (version bigint primary key)",
+	"insert into corpus_version (version) select 1 where not exists (select 1 from corpus_version)",
+	"""create or replace function increase_corpus_version() returns trigger language plpgsql as $$
+begin
+	update corpus_version set version = version + 1;
+	return null;
+end $$"""]
+	for table in CORPUS_TABLES:
+		statements.append("drop trigger if exists "+table+"_corpus_version on "+table)
+		statements.append("create trigger "+table+"_corpus_version after insert or update or delete or truncate on "+table+
+		" for each statement execute procedure increase_corpus_version()")
+
+	return statements
+
+
+def upgrade_schema():
+	"""
+	Applies all schema upgrades to an existing MCSQ database. Every statement is idempotent, so this can be run after each corpus load.
+	"""
+	for statement in get_metadata_columns_ddl()+get_text_search_columns_ddl()+get_trigram_indexes_ddl()+get_corpus_version_ddl():
+		db.session.execute(statement)
+	db.session.execute("update corpus_version set version = version + 1")
+	db.session.commit()
+	db.session.execute("analyze survey_item")
+	db.session.execute("analyze alignment")
+	db.session.commit()
+
+	db.session.close()
+	db.session.remove()
@@ -5,48 +5,35 @@ import re
 import pandas as pd
 from flask import Flask, render_template, request,flash
 from .models import db, Survey, Module, Alignment, Survey_item, Instruction, Introduction, Request, Response, User
+from .queries import SearchQuery, execute_query, execute_paged_query, add_page_info, unescape_apostrophes, get_full_word_condition, get_country_languages_condition
+from .cache import cached_result
+from .metadata import metadata_cache
+from .frequencies import token_frequencies_available, get_token_frequency, get_token_frequency_by_facets, get_frequency_item, get_frequency_dataframe
+from .tokens import vocabulary, tokenize_texts, token_store_available
 
 def get_unique_language_country():
 	"""
 	Gets the unique language-country combinations from the MCSQ to be shown in the interface dropdown menus.
 	Also adds 'No filter' as a possible option, in case the user does not want to use this metadata as a filter.
+	The options are served from the metadata cache (see metadata.py), so no query is done.
 
 	Returns: 
 
 		the language-country filtering options (list of strings).
 	"""
-	options = []
-	results = db.session.execute("select distinct country_language from survey")
-	for res in results:
-		options.append(res[0])
-	db.session.close()
-	db.session.remove()
-
-	options = sorted(options)
-	options.insert(0, 'No filter')
-
-	return options
+	return metadata_cache.get_language_country_options()
 
 def get_unique_year():
 	"""
 	Gets the unique years from the MCSQ to be shown in the interface dropdown menus.
 	Also adds 'No filter' as a possible option, in case the user does not want to use this metadata as a filter.
+	The options are served from the metadata cache (see metadata.py), so no query is done.
 		
 	Returns: 
 
 		the year filtering options (list of strings).
 	"""
-	options = []
-	results = db.session.execute("select distinct year from survey")
-	for res in results:
-		options.append(str(res[0]))
-	db.session.close()
-	db.session.remove()
-
-	options = sorted(options)
-	options.insert(0, 'No filter')
-
-	return options
+	return metadata_cache.get_year_options()
 
 def get_study_options():
 	"""
@@ -76,13 +63,13 @@ def get_pos_tag_options():
 def prepare_words_for_multiple_word_search(word):
 	"""
 	This method is used just if the 'Multiple word search' option is selected in the interface.
-	It manipulates the portion of the query string concerning the words the user wants to search.
+	It manipulates the words the user wants to search for in a partial (or case sensitive) search.
 	In the interface, the user inputs each of the words separated by a semi-colon (;).
-	This method checks if a word is not a blank space, then adds the '%' symbol where applicable. 
+	This method checks if a word is not a blank space, then adds the '%' symbol where applicable.
 
-	Returns: 
+	Returns:
 
-		The manipulated portion , in a syntax appropriate for queries in PostgreSQL.
+		The manipulated words, as a pattern for the 'like'/'ilike' operators in PostgreSQL.
 	"""
 	words = word.split(';')
 	clean_w = []
@@ -94,54 +81,126 @@ def prepare_words_for_multiple_word_search(word):
 
 	return multiple_words
 
-def adapt_for_search_type_case_sensitive(regex, word):
+def prepare_words_for_multiple_full_word_search(word):
+	"""
+	This method is used just if the 'Multiple word search' option is selected in the interface for a full word search.
+	In the interface, the user inputs each of the words separated by a semi-colon (;).
+	This method checks if a word is not a blank space, then joins the words with the '&' tsquery operator.
+
+	Returns:
+
+		The manipulated words, as a query for to_tsquery in PostgreSQL.
+	"""
+	words = word.split(';')
+	clean_w = []
+	for w in words:
+		if w!='' and w!=' ':
+			clean_w.append(w)
+
+	return ' & '.join(clean_w)
+
+def adapt_for_search_type_case_sensitive(regex, word, multiple_words=False, column='text'):
 	"""
 	Uses the correct operator for the specified case sensitive search.
-	If common word search, uses 'like' operator, otherwise uses '~' operator
-	
+	If common word search, uses 'like' operator, otherwise uses '~' operator.
+	Both operators are applied directly to the text column, so they can be served by its trigram index.
+
 	Args:
 		param1 regex (string): indicates if the user is doing a regex based search.
 		param2 word (string): the word (or multiple words) that the user wants to search for.
-		
-	Returns: 
+		param3 multiple_words (string): indicates if the user is searching for a single words or multiple words.
+		param4 column (string): name of the text column being searched.
+
+	Returns:
 
-		A piece of the search query (string) using the correct operator.
+		A tuple with the search condition (string) followed by its parameters.
 	"""
+	word = unescape_apostrophes(word)
 	if regex:
-		return " ~ \'"+str(word)+"\'"
-	else: 
-		return "like \'%"+str(word)+"%\'"
+		return column+" ~ ?", word
+	elif multiple_words:
+		return column+" like ?", prepare_words_for_multiple_word_search(word)
+	else:
+		return column+" like ?", '%'+word+'%'
 
-def adapt_for_search_type_case_insensitive(regex, word, partial):
+def adapt_for_search_type_case_insensitive(regex, word, partial, multiple_words=False, country_language='No filter', column='text', prefix=''):
 	"""
 	Uses the correct operator for the specified case insensitive search.
 	If common word search allowing partial results, uses 'ilike' operator,
-	if partial results are not allowed, use to_tsvector() and to_tsquery,
+	if partial results are not allowed, uses the stored tsvector column and to_tsquery,
 	otherwise uses '~*' operator.
-	
+	The 'ilike' and '~*' operators are applied directly to the text column, so they can be served by its trigram index.
+
 	Args:
 		param1 regex (string): indicates if the user is doing a regex based search.
 		param2 word (string): the word (or multiple words) that the user wants to search for.
 		param3 partial (string): indicates if the user wants see partial results (e.g. running, runs when searching for run).
-		
-	Returns: 
+		param4 multiple_words (string): indicates if the user is searching for a single words or multiple words.
+		param5 country_language (string): country and language metadata filter, used to choose the text search configuration.
+		param6 column (string): name of the text column being searched.
+		param7 prefix (string): prefix of the language column, 'target_' for the target text of the Alignment table.
 
-		A piece of the search query (string) using the correct operator.
+	Returns:
+
+		A tuple with the search condition (string) followed by its parameters.
 	"""
+	word = unescape_apostrophes(word)
 	if regex:
-		return "text ~* \'"+str(word)+"\'"
-	elif not regex and partial:
-		return "ilike \'%"+str(word)+"%\'"
-	elif not regex and not partial:
-		return "to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\')"
+		return column+" ~* ?", word
+	elif partial and multiple_words:
+		return column+" ilike ?", prepare_words_for_multiple_word_search(word)
+	elif partial:
+		return column+" ilike ?", '%'+word+'%'
+	elif multiple_words:
+		return get_full_word_condition(column, prepare_words_for_multiple_full_word_search(word), country_language, prefix)
+	else:
+		return get_full_word_condition(column, word, country_language, prefix)
+
+
+def get_results_dataframe(results, labels):
+	"""
+	Builds the dataframe of a search from its results. Columns appended to the query after the labelled ones
+	(e.g. the key columns of a paginated query) are left out.
+
+	Args:
+		param1 results: the rows returned by the search query.
+		param2 labels (list): the labels (strings) of the columns of the dataframe, in the order of the query columns.
+
+	Returns:
+
+		A pandas dataframe containing the results of the search query.
+	"""
+	return pd.DataFrame.from_records([tuple(result[:len(labels)]) for result in results], columns=labels)
+
+
+def build_generic_case_sensitive_search_query(tableid, word, country_language, year, study, multiplew, displaytagged, regex):
+	"""
+	Builds the query of generic_case_sensitive_search(), without executing it, so it can be either paginated or streamed.
+	The arguments are the same, except for the page.
 
+	Returns:
 
-def generic_case_sensitive_search(tableid, word, country_language, year, study, multiplew, displaytagged, regex):
+		A tuple with the query (SearchQuery) and the labels of its columns (list of strings).
+	"""
+	if displaytagged:
+		labels = ['survey_itemid', 'Text', 'POS Tagged Text', 'NER Tagged Text', 'item_name', 'country_language', 'moduleid']
+		tagged_column = ['pos_tagged_text', 'ner_tagged_text']
+	else:
+		labels = ['survey_itemid', 'Text', 'item_name', 'country_language', 'moduleid']
+		tagged_column = []
+
+	query = SearchQuery('survey_item', ['survey_itemid', 'text']+tagged_column+['item_name', 'country_language', 'moduleid'])
+	query.where(*adapt_for_search_type_case_sensitive(regex, word, multiplew))
+	query.filter_metadata(country_language, year, study)
+	query.where(tableid+" is not null")
+	return query, labels
+
+
+def generic_case_sensitive_search(tableid, word, country_language, year, study, multiplew, displaytagged, regex, page=None):
 	"""
 	This is a generic case sensitive word search that works for all tables containing questionnaire text, except for the Alignment and Survey item, which have their own methods.
-	The search query is built depending on the metadata selected by the user. 
-	This method considers all possible combinations between the set of metadata available for this search.
-	
+	The search query is built with the metadata filters selected by the user.
+
 	Args:
 		param1 tableid (string): indicates from which table the results should be retrieved.
 		param2 word (string): the word (or multiple words) that the user wants to search for.
@@ -151,75 +210,51 @@ def generic_case_sensitive_search(tableid, word, country_language, year, study,
 		param6 multiplew (string): indicates if the user is searching for a single words or multiple words.
 		param7 displaytagged (string): indicates if the user wants the results to include Part-of-Speech and Named Entity Recognition annotations or not.
 		param8 regex (string): indicates if the user is doing a regex based search.
+		param9 page (Page): the page of results to retrieve (see queries.py), or None to retrieve all results.
 
-	Returns: 
+	Returns:
 
 		A pandas dataframe containing the results of the search query.
 	"""
+	query, labels = build_generic_case_sensitive_search_query(tableid, word, country_language, year, study, multiplew, displaytagged, regex)
+	results = execute_paged_query(query, ['survey_itemid'], page)
 
-	if multiplew:
-		word = prepare_words_for_multiple_word_search(word)
+	df = get_results_dataframe(results, labels)
+	add_page_info(df, results)
 
-	if study == 'SHARE':
-		study = 'SHA'
+	db.session.close()
+	db.session.remove()
+	return df
 
-	if displaytagged:
-		tagged_column = 'pos_tagged_text, ner_tagged_text, '
-	else:
-		tagged_column = ''
-
-	operator = adapt_for_search_type_case_sensitive(regex, word)
-
-	#country_language=Y, study=Y, year=Y
-	if country_language != 'No filter' and study != 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\' and "+tableid+" is not null")	
-	#country_language=Y, study=N, year=N
-	elif country_language != 'No filter' and study == 'No filter' and year == 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'%"+str(country_language)+"%\' and "+tableid+" is not null")	
-	#country_language=Y, study=Y, year=N
-	elif country_language != 'No filter' and study != 'No filter' and year == 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\' and "+tableid+" is not null")
-	#country_language=Y, study=N, year=Y
-	elif country_language != 'No filter' and study == 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\' and "+tableid+" is not null")
-	#country_language=N, study=Y, year=N
-	elif country_language == 'No filter' and study != 'No filter' and year == 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'"+str(study)+"%\' and "+tableid+" is not null")	
-	#country_language=N, study=Y, year=Y
-	elif country_language == 'No filter' and study != 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\' and "+tableid+" is not null")	
-	#country_language=N, study=N, year=Y
-	elif study == 'No filter' and country_language == 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'%_"+str(year)+"_%\' and "+tableid+" is not null")
-	#country_language=N, study=N, year=N
-	else:
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text "+operator+" and "+tableid+" is not null")
 
-	lst = []
+
+def build_generic_case_insensitive_search_query(tableid, word, country_language, year, study, multiple_words, partial, displaytagged, regex):
+	"""
+	Builds the query of generic_case_insensitive_search(), without executing it, so it can be either paginated or streamed.
+	The arguments are the same, except for the page.
+
+	Returns:
+
+		A tuple with the query (SearchQuery) and the labels of its columns (list of strings).
+	"""
 	if displaytagged:
-		for result in results:
-			item = {'survey_itemid': result[0], 'Text':result[1],  'POS Tagged Text':result[2], 'NER Tagged Text':result[3], 
-			'item_name': result[4], 'country_language': result[5], 'moduleid': result[6]}
-			lst.append(item)
+		labels = ['survey_itemid', 'Text', 'POS Tagged Text', 'NER Tagged Text', 'item_name', 'country_language', 'moduleid']
+		tagged_column = ['pos_tagged_text', 'ner_tagged_text']
 	else:
-		for result in results:
-			item = {'survey_itemid': result[0], 'Text':result[1],  'item_name': result[2], 
-			'country_language': result[3], 'moduleid': result[4]}
-			lst.append(item)
-	
-	df = pd.DataFrame.from_dict(lst)
-
-	db.session.close()
-	db.session.remove()
-	return df
+		labels = ['survey_itemid', 'Text', 'item_name', 'country_language', 'moduleid']
+		tagged_column = []
 
+	query = SearchQuery('survey_item', ['survey_itemid', 'text']+tagged_column+['item_name', 'country_language', 'moduleid'])
+	query.where(*adapt_for_search_type_case_insensitive(regex, word, partial, multiple_words, country_language))
+	query.filter_metadata(country_language, year, study)
+	query.where(tableid+" is not null")
+	return query, labels
 
 
-def generic_case_insensitive_search(tableid, word, country_language, year, study, multiple_words, partial, displaytagged, regex):
+def generic_case_insensitive_search(tableid, word, country_language, year, study, multiple_words, partial, displaytagged, regex, page=None):
 	"""
 	This is a generic case insensitive word search that works for all tables containing questionnaire text, except for the Alignment and Survey item, which have their own methods.
-	The search query is built depending on the metadata selected by the user. 
-	This method considers all possible combinations between the set of metadata available for this search.
+	The search query is built with the metadata filters selected by the user.
 
 	Args:
 		param1 tableid (string): indicates from which table the results should be retrieved.
@@ -231,94 +266,17 @@ def generic_case_insensitive_search(tableid, word, country_language, year, study
 		param7 partial (string): indicates if the user wants see partial results (e.g. running, runs when searching for run).
 		param8 displaytagged (string): indicates if the user wants the results to include Part-of-Speech and Named Entity Recognition annotations or not.
 		param9 regex (string): indicates if the user is doing a regex based search.
+		param10 page (Page): the page of results to retrieve (see queries.py), or None to retrieve all results.
 
-	Returns: 
+	Returns:
 
 		A pandas dataframe containing the results of the search query.
 	"""
-	if multiple_words and partial:
-		word = prepare_words_for_multiple_word_search(word)
-	elif multiple_words and not partial:
-		words = word.split(';')
-		clean_w = []
-		for w in words:
-			if w!='' and w!=' ':
-				clean_w.append(w)
-		word = ' & '.join(clean_w)
-
-	if study == 'SHARE':
-		study = 'SHA'
-
-	if displaytagged:
-		tagged_column = 'pos_tagged_text, ner_tagged_text, '
-	else:
-		tagged_column = ''
-
-	operator = adapt_for_search_type_case_insensitive(regex, word, partial)
-
-	#country_language=Y, study=Y, year=Y
-	if country_language != 'No filter' and study != 'No filter' and year != 'No filter':
-		if partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text  "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\' and "+tableid+" is not null")	
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\' and "+tableid+" is not null")
-	#country_language=Y, study=N, year=N
-	elif country_language != 'No filter' and study == 'No filter' and year == 'No filter':
-		if partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'%"+str(country_language)+"%\' and "+tableid+" is not null")	
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'%"+str(country_language)+"%\' and "+tableid+" is not null")	
-	#country_language=Y, study=Y, year=N
-	elif country_language != 'No filter' and study != 'No filter' and year == 'No filter':
-		if partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text  "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\' and "+tableid+" is not null")
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\' and "+tableid+" is not null")
-	#country_language=Y, study=N, year=Y
-	elif country_language != 'No filter' and study == 'No filter' and year != 'No filter':
-		if partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text  "+operator+" and survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\' and "+tableid+" is not null")
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\' and "+tableid+" is not null")
-	#country_language=N, study=Y, year=N
-	elif country_language == 'No filter' and study != 'No filter' and year == 'No filter':
-		if partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text  "+operator+" and survey_itemid ilike \'"+str(study)+"%\' and "+tableid+" is not null")	
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'"+str(study)+"%\' and "+tableid+" is not null")	
-	#country_language=N, study=Y, year=Y
-	elif country_language == 'No filter' and study != 'No filter' and year != 'No filter':
-		if partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text  "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\' and "+tableid+" is not null")	
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\' and "+tableid+" is not null")	
-	#country_language=N, study=N, year=Y
-	elif study == 'No filter' and country_language == 'No filter' and year != 'No filter':
-		if partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text  "+operator+" and survey_itemid ilike \'%_"+str(year)+"_%\' and "+tableid+" is not null")
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'%"+str(year)+"%\' and "+tableid+" is not null")
-	#country_language=N, study=N, year=N
-	else:
-		if partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where text  "+operator+" and "+tableid+" is not null")
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where "+operator+" and "+tableid+" is not null")
+	query, labels = build_generic_case_insensitive_search_query(tableid, word, country_language, year, study, multiple_words, partial, displaytagged, regex)
+	results = execute_paged_query(query, ['survey_itemid'], page)
 
-
-	lst = []
-	if displaytagged:
-		for result in results:
-			item = {'survey_itemid': result[0], 'Text':result[1],  'POS Tagged Text':result[2], 'NER Tagged Text':result[3], 
-			'item_name': result[4], 'country_language': result[5], 'moduleid': result[6]}
-			lst.append(item)
-	else:
-		for result in results:
-			item = {'survey_itemid': result[0], 'Text':result[1],  'item_name': result[2], 
-			'country_language': result[3], 'moduleid': result[4]}
-			lst.append(item)
-	
-	df = pd.DataFrame.from_dict(lst)
+	df = get_results_dataframe(results, labels)
+	add_page_info(df, results)
 
 	db.session.close()
 	db.session.remove()
@@ -326,82 +284,87 @@ def generic_case_insensitive_search(tableid, word, country_language, year, study
 
 
 
-def customize_query_sensitive(source_word, target_word, regex):
+def customize_query_sensitive(query, source_word, target_word, multiple_words, regex):
 	"""
 	Customizes the query for a case sensitive search in the Alignment table.
-	Since the user can choose to search for a source word, for a target word, or both, this method constructs 
-	the portion of the query concerning the source and target words according to which words the user inputed in the form.
-	
+	Since the user can choose to search for a source word, for a target word, or both, this method adds
+	the conditions concerning the source and target words according to which words the user inputed in the form.
+
 	Args:
-		param1 source_word (string): the word (or multiple words) that the user wants to search for in the source text.
-		param2 target_word (string): the word (or multiple words) that the user wants to search for in the target text.
-		param3 regex (string): indicates if the user is doing a regex based search.
+		param1 query (SearchQuery): the search query being built.
+		param2 source_word (string): the word (or multiple words) that the user wants to search for in the source text.
+		param3 target_word (string): the word (or multiple words) that the user wants to search for in the target text.
+		param4 multiple_words (string): indicates if the user is searching for a single words or multiple words.
+		param5 regex (string): indicates if the user is doing a regex based search.
 
-	Returns: 
+	Returns:
 
-		partial search query (string), that refers to the words inputed by the user.
+		The search query, with the conditions that refer to the words inputed by the user.
 	"""
-	if regex:
-		if source_word and target_word:
-			return "source_text ~ \'"+str(source_word)+"\' and target_text ~ \'"+str(target_word)+"\' "
-		elif source_word and not target_word:
-			return "source_text ~ \'"+str(source_word)+"\' "
-		elif target_word  and not source_word:
-			return "target_text ~ \'"+str(target_word)+"\' "
-	else:
-		if source_word and target_word:
-			return "source_text like \'%"+str(source_word)+"%\' and target_text like \'%"+str(target_word)+"%\' "
-		elif source_word and not target_word:
-			return "source_text like \'%"+str(source_word)+"%\' "
-		elif target_word  and not source_word:
-			return "target_text like \'%"+str(target_word)+"%\' "
-
+	if source_word:
+		query.where(*adapt_for_search_type_case_sensitive(regex, source_word, multiple_words, 'source_text'))
+	if target_word:
+		query.where(*adapt_for_search_type_case_sensitive(regex, target_word, multiple_words, 'target_text'))
 
+	return query
 
 
-def customize_query_insensitive(partial, source_word, target_word, regex):
+def customize_query_insensitive(query, partial, source_word, target_word, multiple_words, regex, langcountrytarget='No filter'):
 	"""
 	Customizes the query for a case insensitive search in the Alignment table.
-	Since the user can choose to search for a source word, for a target word, or both, this method constructs 
-	the portion of the query concerning the source and target words according to which words the user inputed in the form.
-	
+	Since the user can choose to search for a source word, for a target word, or both, this method adds
+	the conditions concerning the source and target words according to which words the user inputed in the form.
+
 	Args:
-		param1 partial (string): indicates if the user wants see partial results (e.g. running, runs when searching for run).
-		param2 source_word (string): the word (or multiple words) that the user wants to search for in the source text.
-		param3 target_word (string): the word (or multiple words) that the user wants to search for in the target text.
-		param4 regex (string): indicates if the user is doing a regex based search.
+		param1 query (SearchQuery): the search query being built.
+		param2 partial (string): indicates if the user wants see partial results (e.g. running, runs when searching for run).
+		param3 source_word (string): the word (or multiple words) that the user wants to search for in the source text.
+		param4 target_word (string): the word (or multiple words) that the user wants to search for in the target text.
+		param5 multiple_words (string): indicates if the user is searching for a single words or multiple words.
+		param6 regex (string): indicates if the user is doing a regex based search.
+		param7 langcountrytarget (string): country and language metadata of the target questionnaire, used to choose the text search configuration.
 
-	Returns: 
+	Returns:
 
-		A piece of the search query (string), that refers to the words inputed by the user.
+		The search query, with the conditions that refer to the words inputed by the user.
 	"""
-	if regex:
-		if source_word and target_word:
-			return "source_text ~* \'"+str(source_word)+"\' and target_text ~* \'"+str(target_word)+"\' "
-		elif source_word and not target_word:
-			return "source_text ~* \'"+str(source_word)+"\' "
-		elif target_word  and not source_word:
-			return "target_text ~* \'"+str(target_word)+"\' "
-	if partial and not regex:
-		if source_word and target_word:
-			return "source_text ilike \'%"+str(source_word)+"%\' and target_text ilike \'%"+str(target_word)+"%\' "
-		elif source_word and not target_word:
-			return "source_text ilike \'%"+str(source_word)+"%\' "
-		elif target_word  and not source_word:
-			return "target_text ilike \'%"+str(target_word)+"%\' "
-	if not partial and not regex:
-		if source_word and target_word:
-			return "to_tsvector(source_text) @@ to_tsquery(\'"+str(source_word)+"\') and to_tsvector(target_text) @@ to_tsquery(\'"+str(target_word)+"\') "
-		elif source_word and not target_word:
-			return "to_tsvector(source_text) @@ to_tsquery(\'"+str(source_word)+"\') "
-		elif target_word  and not source_word:
-			return "to_tsvector(target_text) @@ to_tsquery(\'"+str(target_word)+"\') "
-
-def alignment_search(source_word, target_word, langcountrytarget, year, study, multiple_words, partial, case_sensitive, displaytagged, regex):
-	"""
-	Implements a word search in the Alignment table. The search query is built depending on the metadata selected by the user. 
-	This method considers all possible combinations between the set of metadata available for this search.
-	
+	if source_word:
+		query.where(*adapt_for_search_type_case_insensitive(regex, source_word, partial, multiple_words, 'ENG', 'source_text'))
+	if target_word:
+		query.where(*adapt_for_search_type_case_insensitive(regex, target_word, partial, multiple_words, langcountrytarget, 'target_text', 'target_'))
+
+	return query
+
+def build_alignment_search_query(source_word, target_word, langcountrytarget, year, study, multiple_words, partial, case_sensitive, displaytagged, regex):
+	"""
+	Builds the query of alignment_search(), without executing it, so it can be either paginated or streamed.
+	The arguments are the same, except for the page.
+
+	Returns:
+
+		A tuple with the query (SearchQuery) and the labels of its columns (list of strings).
+	"""
+	if displaytagged:
+		labels = ['source_survey_itemid', 'target_survey_itemid', 'Source Text', 'Target Text', 'POS Tagged Source Text', 'POS Tagged Target Text',
+		'NER Tagged Source Text', 'NER Tagged Target Text']
+		tagged_column = ['source_pos_tagged_text', 'target_pos_tagged_text', 'source_ner_tagged_text', 'target_ner_tagged_text']
+	else:
+		labels = ['source_survey_itemid', 'target_survey_itemid', 'Source Text', 'Target Text']
+		tagged_column = []
+
+	query = SearchQuery('alignment', ['source_survey_itemid', 'target_survey_itemid', 'source_text', 'target_text']+tagged_column)
+	if case_sensitive:
+		customize_query_sensitive(query, source_word, target_word, multiple_words, regex)
+	else:
+		customize_query_insensitive(query, partial, source_word, target_word, multiple_words, regex, langcountrytarget)
+	query.filter_metadata(langcountrytarget, year, study, prefix='target_')
+	return query, labels
+
+
+def alignment_search(source_word, target_word, langcountrytarget, year, study, multiple_words, partial, case_sensitive, displaytagged, regex, page=None):
+	"""
+	Implements a word search in the Alignment table. The search query is built with the metadata filters selected by the user.
+
 	Args:
 		param1 source_word (string): the word (or multiple words) that the user wants to search for in the source text.
 		param2 target_word (string): the word (or multiple words) that the user wants to search for in the target text.
@@ -413,96 +376,50 @@ def alignment_search(source_word, target_word, langcountrytarget, year, study, m
 		param8 case_sensitive (string): indicates if the user wants to do a case sensitive word search.
 		param9 displaytagged (string): indicates if the user wants the results to include Part-of-Speech and Named Entity Recognition annotations.
 		param10 regex (string): indicates if the user is doing a regex based search.
+		param11 page (Page): the page of results to retrieve (see queries.py), or None to retrieve all results.
 
-	Returns: 
+	Returns:
 
 		A pandas dataframe containing the results of the search query.
 	"""
-	if multiple_words and partial:
-		if source_word:
-			source_word = prepare_words_for_multiple_word_search(source_word)
-		if target_word:
-			target_word = prepare_words_for_multiple_word_search(target_word)
-	elif multiple_words and not partial:
-		if source_word:
-			words = source_word.split(';')
-			clean_w = []
-			for w in words:
-				if w!='' and w!=' ':
-					clean_w.append(w)
-			source_word = ' & '.join(clean_w)
-		if target_word:
-			words = target_word.split(';')
-			clean_w = []
-			for w in words:
-				if w!='' and w!=' ':
-					clean_w.append(w)
-			target_word = ' & '.join(clean_w)
+	query, labels = build_alignment_search_query(source_word, target_word, langcountrytarget, year, study, multiple_words, partial, case_sensitive, displaytagged, regex)
+	results = execute_paged_query(query, ['alignmentid'], page)
 
-	if study == 'SHARE':
-		study = 'SHA'	
+	df = get_results_dataframe(results, labels)
+	add_page_info(df, results)
 
-	if displaytagged:
-		tagged_column = ', source_pos_tagged_text, target_pos_tagged_text, source_ner_tagged_text, target_ner_tagged_text '
-	else:
-		tagged_column = ''
+	db.session.close()
+	db.session.remove()
+	return df
 
-	if case_sensitive:
-		custom_query = customize_query_sensitive(source_word, target_word, regex)
-	else:
-		custom_query = customize_query_insensitive(partial, source_word, target_word, regex)
-
-	#study=Y, year=Y, langcountrytarget=Y
-	if study != 'No filter' and year != 'No filter' and langcountrytarget != 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text, target_text  "+tagged_column+" from alignment where "+custom_query+" and source_survey_itemid ilike  \'"+str(study)+"%"+str(year)+"%\' and target_survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(langcountrytarget)+"%\'")	
-	#study=Y, year=N, langcountrytarget=N
-	elif study != 'No filter' and year == 'No filter' and langcountrytarget == 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text, target_text  "+tagged_column+" from alignment where "+custom_query+" and source_survey_itemid ilike  \'"+str(study)+"%\' and target_survey_itemid ilike \'"+str(study)+"%\'")	
-	#study=N, year=Y, langcountrytarget=N
-	elif study == 'No filter' and year != 'No filter' and langcountrytarget == 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text, target_text  "+tagged_column+" from alignment where "+custom_query+" and source_survey_itemid ilike  \'%_"+str(year)+"_%\' and target_survey_itemid ilike \'%_"+str(year)+"_%\'")	
-	#study=N, year=N, langcountrytarget=Y
-	elif study == 'No filter' and year == 'No filter' and langcountrytarget != 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text, target_text  "+tagged_column+" from alignment where "+custom_query+" and target_survey_itemid ilike \'%_"+str(langcountrytarget)+"_%\'")	
-	#study=Y, year=Y, langcountrytarget=N
-	elif study != 'No filter' and year != 'No filter' and langcountrytarget == 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text, target_text  "+tagged_column+" from alignment where "+custom_query+" and source_survey_itemid ilike  \'"+str(study)+"%"+str(year)+"%\' and target_survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\'")	
-	#study=Y, year=N, langcountrytarget=Y
-	elif study != 'No filter' and year == 'No filter' and langcountrytarget != 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text, target_text  "+tagged_column+" from alignment where "+custom_query+" and source_survey_itemid ilike  \'"+str(study)+"%\' and target_survey_itemid ilike \'"+str(study)+"%"+str(langcountrytarget)+"%\'")	
-	#study=N, year=Y, langcountrytarget=Y
-	elif study == 'No filter' and year != 'No filter' and langcountrytarget != 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text, target_text  "+tagged_column+" from alignment where "+custom_query+" and source_survey_itemid ilike  \'%_"+str(year)+"_%\' and target_survey_itemid ilike  \'%_"+str(year)+"%"+str(langcountrytarget)+"%\'")	
-	#study=N, year=N, langcountrytarget=N
-	else:
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text, target_text  "+tagged_column+" from alignment where "+custom_query)	
 
-	lst = []
+def build_case_sensitive_search_item_type_independent_query(word, country_language, year, study, multiple_words, displaytagged, regex):
+	"""
+	Builds the query of case_sensitive_search_item_type_independent(), without executing it, so it can be either paginated or streamed.
+	The arguments are the same, except for the page.
+
+	Returns:
+
+		A tuple with the query (SearchQuery) and the labels of its columns (list of strings).
+	"""
 	if displaytagged:
-		for result in results:
-			item = {'source_survey_itemid': result[0], 'target_survey_itemid':result[1],  
-			'Source Text': result[2], 'Target Text': result[3], 'POS Tagged Source Text': result[4], 'POS Tagged Target Text': result[5], 
-			'NER Tagged Source Text': result[6], 'NER Tagged Target Text': result[7]}
-			lst.append(item)
+		labels = ['survey_itemid', 'Text', 'POS Tagged Text', 'NER Tagged Text', 'item_name', 'item_type', 'country_language', 'moduleid']
+		tagged_column = ['pos_tagged_text', 'ner_tagged_text']
 	else:
-		for result in results:
-			item = {'source_survey_itemid': result[0], 'target_survey_itemid':result[1],  
-			'Source Text': result[2], 'Target Text': result[3]}
-			lst.append(item)
+		labels = ['survey_itemid', 'Text', 'item_name', 'item_type', 'country_language', 'moduleid']
+		tagged_column = []
 
-	df = pd.DataFrame.from_dict(lst)
-
-	db.session.close()
-	db.session.remove()
-	return df
+	query = SearchQuery('survey_item', ['survey_itemid', 'text']+tagged_column+['item_name', 'item_type', 'country_language', 'moduleid'])
+	query.where(*adapt_for_search_type_case_sensitive(regex, word, multiple_words))
+	query.filter_metadata(country_language, year, study)
+	return query, labels
 
 
-def case_sensitive_search_item_type_independent(word, country_language, year, study, multiple_words, displaytagged, regex):
+def case_sensitive_search_item_type_independent(word, country_language, year, study, multiple_words, displaytagged, regex, page=None):
 	"""
 	This is a sensitive word search for the Survey item table.
-	Implements a word search in the Survey Item table. The search query is built depending on the metadata selected by the user. 
-	This method considers all possible combinations between the set of metadata available for this search.
-	
+	Implements a word search in the Survey Item table. The search query is built with the metadata filters selected by the user.
+
 	Args:
 		param1 word (string): the word (or multiple words) that the user wants to search for.
 		param2 country_language (string): country and language questionnaire metadata.
@@ -511,75 +428,50 @@ def case_sensitive_search_item_type_independent(word, country_language, year, st
 		param5 multiple_words (string): indicates if the user is searching for a single words or multiple words.
 		param6 displaytagged (string): indicates if the user wants the results to include Part-of-Speech and Named Entity Recognition annotations or not.
 		param7 regex (string): indicates if the user is doing a regex based search.
+		param8 page (Page): the page of results to retrieve (see queries.py), or None to retrieve all results.
 
-	Returns: 
+	Returns:
 
 		A pandas dataframe containing the results of the search query.
 	"""
-	if multiple_words:
-		word = prepare_words_for_multiple_word_search(word)
+	query, labels = build_case_sensitive_search_item_type_independent_query(word, country_language, year, study, multiple_words, displaytagged, regex)
+	results = execute_paged_query(query, ['survey_itemid'], page)
 
-	if study == 'SHARE':
-		study = 'SHA'
+	df = get_results_dataframe(results, labels)
+	add_page_info(df, results)
 
-	if displaytagged:
-		tagged_column = 'pos_tagged_text, ner_tagged_text, '
-	else:
-		tagged_column = ''
-
-	operator = adapt_for_search_type_case_sensitive(regex, word) 
-
-	#country_language=Y, study=Y, year=Y
-	if country_language != 'No filter' and study != 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\'")	
-	#country_language=Y, study=N, year=N
-	elif country_language != 'No filter' and study == 'No filter' and year == 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'%"+str(country_language)+"%\'")	
-	#country_language=Y, study=Y, year=N
-	elif country_language != 'No filter' and study != 'No filter' and year == 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\'")
-	#country_language=Y, study=N, year=Y
-	elif country_language != 'No filter' and study == 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\'")
-	#country_language=N, study=Y, year=N
-	elif country_language == 'No filter' and study != 'No filter' and year == 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'"+str(study)+"%\'")	
-	#country_language=N, study=Y, year=Y
-	elif country_language == 'No filter' and study != 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\'")	
-	#country_language=N, study=N, year=Y
-	elif study == 'No filter' and country_language == 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike  \'%_"+str(year)+"_%\'")
-	#country_language=N, study=N, year=N
-	else:
-		results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+"")
+	db.session.close()
+	db.session.remove()
+	return df
 
 
-	lst = []
+def build_case_insensitive_search_item_type_independent_query(word, country_language, year, study, multiple_words, partial, displaytagged, regex):
+	"""
+	Builds the query of case_insensitive_search_item_type_independent(), without executing it, so it can be either paginated or streamed.
+	The arguments are the same, except for the page.
+
+	Returns:
+
+		A tuple with the query (SearchQuery) and the labels of its columns (list of strings).
+	"""
 	if displaytagged:
-		for result in results:
-			item = {'survey_itemid': result[0], 'Text':result[1], 'POS Tagged Text':result[2], 'NER Tagged Text':result[3], 
-			'item_name': result[4], 'item_type': result[5], 'country_language': result[6], 'moduleid': result[7]}
-			lst.append(item)
+		labels = ['survey_itemid', 'Text', 'POS Tagged Text', 'NER Tagged Text', 'item_name', 'item_type', 'country_language', 'moduleid']
+		tagged_column = ['pos_tagged_text', 'ner_tagged_text']
 	else:
-		for result in results:
-			item = {'survey_itemid': result[0], 'Text':result[1],  'item_name': result[2], 
-			'item_type': result[3], 'country_language': result[4], 'moduleid': result[5]}
-			lst.append(item)
-	
-	df = pd.DataFrame.from_dict(lst)
+		labels = ['survey_itemid', 'Text', 'item_name', 'item_type', 'country_language', 'moduleid']
+		tagged_column = []
 
-	db.session.close()
-	db.session.remove()
-	return df
+	query = SearchQuery('survey_item', ['survey_itemid', 'text']+tagged_column+['item_name', 'item_type', 'country_language', 'moduleid'])
+	query.where(*adapt_for_search_type_case_insensitive(regex, word, partial, multiple_words, country_language))
+	query.filter_metadata(country_language, year, study)
+	return query, labels
 
 
-def case_insensitive_search_item_type_independent(word, country_language, year, study, multiple_words, partial, displaytagged, regex):
+def case_insensitive_search_item_type_independent(word, country_language, year, study, multiple_words, partial, displaytagged, regex, page=None):
 	"""
 	This is a insensitive word search for the Survey item table.
-	Implements a word search in the Survey Item table. The search query is built depending on the metadata selected by the user. 
-	This method considers all possible combinations between the set of metadata available for this search.
-	
+	Implements a word search in the Survey Item table. The search query is built with the metadata filters selected by the user.
+
 	Args:
 		param1 word (string): the word (or multiple words) that the user wants to search for.
 		param2 country_language (string): country and language questionnaire metadata.
@@ -589,106 +481,119 @@ def case_insensitive_search_item_type_independent(word, country_language, year,
 		param6 partial (string): indicates if the user wants see partial results (e.g. running, runs when searching for run).
 		param7 displaytagged (string): indicates if the user wants the results to include Part-of-Speech and Named Entity Recognition annotations or not.
 		param8 regex (string): indicates if the user is doing a regex based search.
+		param9 page (Page): the page of results to retrieve (see queries.py), or None to retrieve all results.
 
-	Returns: 
+	Returns:
 
 		A pandas dataframe containing the results of the search query.
 	"""
-	if multiple_words and partial:
-		word = prepare_words_for_multiple_word_search(word)
-	elif multiple_words and not partial:
-		words = word.split(';')
-		clean_w = []
-		for w in words:
-			if w!='' and w!=' ':
-				clean_w.append(w)
-		word = ' & '.join(clean_w)
+	query, labels = build_case_insensitive_search_item_type_independent_query(word, country_language, year, study, multiple_words, partial, displaytagged, regex)
+	results = execute_paged_query(query, ['survey_itemid'], page)
 
-	if study == 'SHARE':
-		study = 'SHA'
+	df = get_results_dataframe(results, labels)
+	add_page_info(df, results)
 
-	if displaytagged:
-		tagged_column = 'pos_tagged_text, ner_tagged_text, '
+	db.session.close()
+	db.session.remove()
+	return df
+
+def get_frequency_words(word, multiple_words, combined):
+	"""
+	Splits the words of a frequency search. In the case of multiple words (or combined frequency), the words are separated by semicolons (;).
+
+	Returns:
+
+		The list of words (strings).
+	"""
+	if multiple_words or combined:
+		return [w for w in word.split(';') if w!='' and w!=' ']
 	else:
-		tagged_column = ''
+		return [word]
 
-	operator = adapt_for_search_type_case_insensitive(regex, word, partial)
-	
-	#country_language=Y, study=Y, year=Y
-	if country_language != 'No filter' and study != 'No filter' and year != 'No filter':
-		if not partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\'")
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\'")	
-	#country_language=Y, study=N, year=N
-	elif country_language != 'No filter' and study == 'No filter' and year == 'No filter':
-		if not partial:
-			results = db.session.execute("select survey_itemid, text,"+tagged_column+"  item_name, item_type, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'%"+str(country_language)+"%\'")	
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'%"+str(country_language)+"%\'")	
-	#country_language=Y, study=Y, year=N
-	elif country_language != 'No filter' and study != 'No filter' and year == 'No filter':
-		if not partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\'")
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\'")
-	#country_language=Y, study=N, year=Y
-	elif country_language != 'No filter' and study == 'No filter' and year != 'No filter':
-		if not partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\'")
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\'")
-	#country_language=N, study=Y, year=N
-	elif country_language == 'No filter' and study != 'No filter' and year == 'No filter':
-		if not partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'"+str(study)+"%\'")	
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'"+str(study)+"%\'")	
-	#country_language=N, study=Y, year=Y
-	elif country_language == 'No filter' and study != 'No filter' and year != 'No filter':
-		if not partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\'")	
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\'")	
-	#country_language=N, study=N, year=Y
-	elif study == 'No filter' and country_language == 'No filter' and year != 'No filter':
-		if not partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where "+operator+" and survey_itemid ilike \'%"+str(year)+"%\'")
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+" and survey_itemid ilike \'%_"+str(year)+"_%\'")
-	#country_language=N, study=N, year=N
+def add_word_frequency_counts(query, word, country_language, multiple_words, combined):
+	"""
+	Adds the word count aggregates of a frequency search to a query.
+	All words are counted in a single pass over the filtered subcorpus: the rows containing any of the words are retrieved
+	through the full word search index, and each word is counted with its own aggregate filter.
+	In the case of a combined frequency, a single count of the rows containing all words is added instead.
+
+	Args:
+		param1 query (SearchQuery): the search query being built.
+		param2 word (string): the word (or multiple words) that the user wants to search for.
+		param3 country_language (string): country and language questionnaire metadata.
+		param4 multiple_words (string): indicates if the user is searching for a single words or multiple words.
+		param5 combined (string): just for multiple words. Indicates if the frequency to be computed is combined.
+
+	Returns:
+
+		The labels of the counts added to the query (list of strings), in order.
+	"""
+	words = get_frequency_words(word, multiple_words, combined)
+
+	if combined:
+		query.select("count(*)")
+		query.where(*get_full_word_condition('text', ' & '.join(unescape_apostrophes(w) for w in words), country_language))
+		return [word]
 	else:
-		if not partial:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where "+operator+"")
-		else:
-			results = db.session.execute("select survey_itemid, text, "+tagged_column+" item_name, item_type, country_language, moduleid from survey_item where text "+operator+"")
+		for w in words:
+			condition = get_full_word_condition('text', unescape_apostrophes(w), country_language)
+			query.select("count(*) filter (where "+condition[0]+")", *condition[1:])
+		query.where(*get_full_word_condition('text', ' | '.join(unescape_apostrophes(w) for w in words), country_language))
+		return words
 
+@cached_result
+def compute_word_frequency(word, country_language, year, study, multiple_words, combined, item_type):
+	"""
+	This is a insensitive word count search to compute the frequency of either a word or a set of words.
+	In the case of multiple words, the frequency can be computed individually for each word, or the combined frequency for all words.
+	Whenever possible, the frequencies are looked up in the precomputed token frequencies (see frequencies.py), which also give
+	the number of occurrences and the normalized frequencies of each word.
+	Otherwise, all words are counted by a single query (see add_word_frequency_counts()), built with the metadata filters selected by the user.
+	The live counts only give the absolute frequency, so the other columns are left empty.
+
+	Args:
+		param1 word (string): the word (or multiple words) that the user wants to search for.
+		param2 country_language (string): country and language questionnaire metadata.
+		param3 year (string): year metadata filter. Indicates in which year a given study was released.
+		param4 study (string): study questionnaire metadata.
+		param5 multiple_words (string): indicates if the user is searching for a single words or multiple words.
+		param6 combined (string): just for multiple words. Indicates if the frequency to be computed is combined.
+		param7 item_type (string): item type metadata filter. Can be INTRODUCTION, INSTRUCTION, REQUEST or RESPONSE.
+
+	Returns:
+
+		A pandas dataframe containing the results of the search query.
+	"""
+	words = get_frequency_words(word, multiple_words, combined)
+	if token_frequencies_available(words, combined):
+		return get_token_frequency(words, country_language, year, study, item_type)
+
+	query = SearchQuery('survey_item', [])
+	labels = add_word_frequency_counts(query, word, country_language, multiple_words, combined)
+	if not labels:
+		return pd.DataFrame()
+	query.filter_metadata(country_language, year, study, item_type)
+	result = execute_query(query).fetchone()
 
 	lst = []
-	if displaytagged:
-		for result in results:
-			item = {'survey_itemid': result[0], 'Text':result[1], 'POS Tagged Text':result[2],'NER Tagged Text':result[3],
-			'item_name': result[4], 'item_type': result[5], 'country_language': result[6], 'moduleid': result[7]}
-			lst.append(item)
-	else:
-		for result in results:
-			item = {'survey_itemid': result[0], 'Text':result[1],  'item_name': result[2], 
-			'item_type': result[3], 'country_language': result[4], 'moduleid': result[5]}
-			lst.append(item)
-	
-	df = pd.DataFrame.from_dict(lst)
+	for label, frequency in zip(labels, result):
+		lst.append(get_frequency_item(label, frequency))
+
+	df = get_frequency_dataframe(lst)
 
 	db.session.close()
 	db.session.remove()
+
 	return df
 
-def compute_word_frequency(word, country_language, year, study, multiple_words, combined, item_type):
+@cached_result
+def compute_word_frequency_by_facets(word, country_language, year, study, multiple_words, combined, item_type):
 	"""
-	This is a insensitive word count search to compute the frequency of either a word or a set of words.
-	In the case of multiple words, the frequency can be computed individually for each word, or the combined frequency for all words.
-	The search query is built depending on the metadata selected by the user. 
-	This method considers all possible combinations between the set of metadata available for this search.
-	
+	Faceted version of compute_word_frequency(). Instead of one total per word, the frequencies are broken down by
+	country_language, study, year and item_type, all computed by the same grouped query.
+	The results are returned in long format (one row per facet combination and word), ready to be pivoted.
+	Facet combinations in which none of the words occur are not included.
+
 	Args:
 		param1 word (string): the word (or multiple words) that the user wants to search for.
 		param2 country_language (string): country and language questionnaire metadata.
@@ -698,93 +603,34 @@ def compute_word_frequency(word, country_language, year, study, multiple_words,
 		param6 combined (string): just for multiple words. Indicates if the frequency to be computed is combined.
 		param7 item_type (string): item type metadata filter. Can be INTRODUCTION, INSTRUCTION, REQUEST or RESPONSE.
 
-	Returns: 
+	Returns:
 
 		A pandas dataframe containing the results of the search query.
 	"""
-	if study == 'SHARE':
-		study = 'SHA'
+	words = get_frequency_words(word, multiple_words, combined)
+	if token_frequencies_available(words, combined):
+		return get_token_frequency_by_facets(words, country_language, year, study, item_type)
+
+	facets = ['country_language', 'study', 'year', 'item_type']
+	query = SearchQuery('survey_item', facets)
+	labels = add_word_frequency_counts(query, word, country_language, multiple_words, combined)
+	if not labels:
+		return pd.DataFrame()
+	query.filter_metadata(country_language, year, study, item_type)
+	query.group(*facets)
+	query.order(*facets)
+	results = execute_query(query)
 
 	lst = []
-
-	if multiple_words:
-		words = word.split(';')
-		for word in words:
-			if country_language != 'No filter' and study != 'No filter' and year != 'No filter' and item_type != 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\'")
-			elif country_language != 'No filter' and study == 'No filter' and year == 'No filter' and item_type == 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'%"+str(country_language)+"%\'")	
-			elif country_language == 'No filter' and study != 'No filter' and year == 'No filter' and item_type == 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%\'")
-			elif country_language == 'No filter' and study == 'No filter' and year != 'No filter' and item_type == 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'%"+str(year)+"%\'")
-			elif country_language == 'No filter' and study == 'No filter' and year == 'No filter' and item_type != 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\'")
-			elif country_language != 'No filter' and study != 'No filter' and year == 'No filter' and item_type == 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\'")
-			elif country_language != 'No filter' and study == 'No filter' and year != 'No filter' and item_type == 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\'")
-			elif country_language != 'No filter' and study == 'No filter' and year == 'No filter' and item_type != 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'%"+str(country_language)+"%\'")	
-			elif country_language != 'No filter' and study != 'No filter' and year != 'No filter' and item_type == 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\'")
-			elif country_language != 'No filter' and study != 'No filter' and year == 'No filter' and item_type != 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\'")
-			elif country_language != 'No filter' and study == 'No filter' and year != 'No filter' and item_type != 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\'")
-			elif country_language == 'No filter' and study != 'No filter' and year != 'No filter' and item_type != 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\'")	
-			elif country_language == 'No filter' and study != 'No filter' and year != 'No filter' and item_type == 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\'")	
-			elif country_language == 'No filter' and study != 'No filter' and year == 'No filter' and item_type != 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'"+str(study)+"%\'")
-			elif country_language == 'No filter' and study == 'No filter' and year != 'No filter' and item_type != 'No filter':
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'%"+str(year)+"%\'")
-			else:
-				results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\')")
-		
-			for result in results:
-				item = {'Word': word, 'Frequency':result[0]}
-				lst.append(item)
-	else:
-		if country_language != 'No filter' and study != 'No filter' and year != 'No filter' and item_type != 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\'")
-		elif country_language != 'No filter' and study == 'No filter' and year == 'No filter' and item_type == 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'%"+str(country_language)+"%\'")	
-		elif country_language == 'No filter' and study != 'No filter' and year == 'No filter' and item_type == 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%\'")
-		elif country_language == 'No filter' and study == 'No filter' and year != 'No filter' and item_type == 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'%"+str(year)+"%\'")
-		elif country_language == 'No filter' and study == 'No filter' and year == 'No filter' and item_type != 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\'")
-		elif country_language != 'No filter' and study != 'No filter' and year == 'No filter' and item_type == 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\'")
-		elif country_language != 'No filter' and study == 'No filter' and year != 'No filter' and item_type == 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\'")
-		elif country_language != 'No filter' and study == 'No filter' and year == 'No filter' and item_type != 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'%"+str(country_language)+"%\'")	
-		elif country_language != 'No filter' and study != 'No filter' and year != 'No filter' and item_type == 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\'")
-		elif country_language != 'No filter' and study != 'No filter' and year == 'No filter' and item_type != 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\'")
-		elif country_language != 'No filter' and study == 'No filter' and year != 'No filter' and item_type != 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\'")
-		elif country_language == 'No filter' and study != 'No filter' and year != 'No filter' and item_type != 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\'")	
-		elif country_language == 'No filter' and study != 'No filter' and year != 'No filter' and item_type == 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\'")	
-		elif country_language == 'No filter' and study != 'No filter' and year == 'No filter' and item_type != 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'"+str(study)+"%\'")
-		elif country_language == 'No filter' and study == 'No filter' and year != 'No filter' and item_type != 'No filter':
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and item_type ilike \'"+str(item_type)+"\' and survey_itemid ilike \'%"+str(year)+"%\'")
-		else:
-			results = db.session.execute("select count(*) from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\')")
-		for result in results:
-			item = {'Word': word, 'Frequency':result[0]}
+	for result in results:
+		for label, frequency in zip(labels, result[len(facets):]):
+			item = {'country_language': result[0], 'study': result[1], 'year': result[2], 'item_type': result[3]}
+			item.update(get_frequency_item(label, frequency))
 			lst.append(item)
-	
 
-	df = pd.DataFrame.from_dict(lst)
+	df = get_frequency_dataframe(lst)
+	if not df.empty:
+		df['study'] = df['study'].replace('SHA', 'SHARE')
 
 	db.session.close()
 	db.session.remove()
@@ -795,19 +641,22 @@ def verify_is_study_exists(year, study):
 	"""
 	This is a preliminary search to make sure there are questionnaires in the MCSQ that correspond to the survey project (hereby called study)
 	plus year combination that was inputed by the user. This method is used in the functionalities for questionnaires comparison.
-	
+
 	Args:
 		param1 year (string): year metadata filter. Indicates in which year a given study was released.
 		param2 study (string): study questionnaire metadata. Can be ESS, EVS, SHARE or WIS.
 
-	Returns: 
+	Returns:
 
 		A pandas dataframe containing the IDs of all available questionnaires for the inputed study+year combination
 	"""
 	if study == 'SHARE':
 		study = 'SHA'
 
-	results = db.session.execute("select surveyid from survey where study ilike \'"+str(study)+"\' and year="+str(year))
+	query = SearchQuery('survey', ['surveyid'])
+	query.where("study ilike ?", study)
+	query.where("year = ?", int(year))
+	results = execute_query(query)
 
 	lst = []
 	for result in results:
@@ -821,168 +670,135 @@ def verify_is_study_exists(year, study):
 	return df
 
 
-def search_to_compare_item_type_independent(country_language, year, study):
+COMPARE_LABELS = ['survey_itemid', 'Text', 'item_name', 'item_type']
+
+
+def search_to_compare(query, country_languages):
 	"""
-	Retrieves survey items to later on be used on the compare_whole() method, which refers to the functionality of 
-	comparing whole questionnaires. Country and language, year, and study metadata are obligatory for this search.
-	
+	Retrieves the survey items of all the questionnaires being compared with a single query, and splits them by
+	questionnaire. The query selects the country_language and language columns after the labelled ones, so each row
+	is assigned to the questionnaires that it belongs to.
+
 	Args:
-		param1 country_language (string): country and language questionnaire metadata.
-		param2 year (string): year metadata filter. Indicates in which year a given study was released.
-		param3 study (string): study questionnaire metadata. Can be ESS, EVS, SHARE or WIS.
+		param1 query (SearchQuery): the search query, selecting survey_itemid, text, item_name and item_type.
+		param2 country_languages (list): country and language (or just language) metadata of the compared questionnaires.
 
-	Returns: 
+	Returns:
 
-		A pandas dataframe containing the results of the search query.
+		A list of pandas dataframes, one for each country_language (in the same order), containing the results of the search query.
 	"""
-	if study == 'SHARE':
-		study = 'SHA'
+	if not country_languages:
+		return []
 
-	results = db.session.execute("select survey_itemid, text, item_name, item_type from survey_item where survey_itemid ilike \'"+str(study)+"%_"+str(year)+"_%"+str(country_language)+"%\'")
+	query.select('country_language')
+	query.select('language')
+	query.where(*get_country_languages_condition(country_languages))
+	results = execute_query(query)
 
-	lst = []
+	rows_by_value = {}
 	for result in results:
-		item = {'survey_itemid': result[0], 'Text':result[1],  'item_name': result[2], 
-		'item_type': result[3]}
-		lst.append(item)
-	df = pd.DataFrame.from_dict(lst)
+		rows_by_value.setdefault(result[4], []).append(result)
+		rows_by_value.setdefault(result[5], []).append(result)
 
 	db.session.close()
 	db.session.remove()
 
-	return df
+	return [get_results_dataframe(rows_by_value.get(country_language, []), COMPARE_LABELS) for country_language in country_languages]
 
-def search_to_compare_by_item_type(country_language, year, study, item_type):
+def search_to_compare_item_type_independent(country_languages, year, study):
 	"""
-	Retrieves survey items to later on be used on the compare_by_item_type() method, which refers to the functionality of 
-	comparing questionnaires with item type filtering. Country and language, year, and study metadata are obligatory for this search.
-	
+	Retrieves survey items to later on be used on the compare_whole() method, which refers to the functionality of
+	comparing whole questionnaires. Country and language, year, and study metadata are obligatory for this search.
+
 	Args:
-		param1 country_language (string): country and language questionnaire metadata.
+		param1 country_languages (list): country and language questionnaire metadata of the compared questionnaires.
 		param2 year (string): year metadata filter. Indicates in which year a given study was released.
 		param3 study (string): study questionnaire metadata. Can be ESS, EVS, SHARE or WIS.
 
-	Returns: 
+	Returns:
 
-		A pandas dataframe containing the results of the search query.
+		A list of pandas dataframes, one for each country_language, containing the results of the search query.
 	"""
-	if study == 'SHARE':
-		study = 'SHA'
+	query = SearchQuery('survey_item', ['survey_itemid', 'text', 'item_name', 'item_type'])
+	query.filter_metadata('No filter', year, study)
 
-	results = db.session.execute("select survey_itemid, text, item_name, item_type from survey_item where survey_itemid ilike \'"+str(study)+"%_"+str(year)+"_%"+str(country_language)+"%\' and item_type ilike \'"+item_type+"\'")
+	return search_to_compare(query, country_languages)
 
-	lst = []
-	for result in results:
-		item = {'survey_itemid': result[0], 'Text':result[1],  'item_name': result[2], 
-		'item_type': result[3]}
-		lst.append(item)
-	df = pd.DataFrame.from_dict(lst)
+def search_to_compare_by_item_type(country_languages, year, study, item_type):
+	"""
+	Retrieves survey items to later on be used on the compare_by_item_type() method, which refers to the functionality of
+	comparing questionnaires with item type filtering. Country and language, year, and study metadata are obligatory for this search.
 
-	db.session.close()
-	db.session.remove()
+	Args:
+		param1 country_languages (list): country and language questionnaire metadata of the compared questionnaires.
+		param2 year (string): year metadata filter. Indicates in which year a given study was released.
+		param3 study (string): study questionnaire metadata. Can be ESS, EVS, SHARE or WIS.
 
-	return df
+	Returns:
+
+		A list of pandas dataframes, one for each country_language, containing the results of the search query.
+	"""
+	query = SearchQuery('survey_item', ['survey_itemid', 'text', 'item_name', 'item_type'])
+	query.filter_metadata('No filter', year, study, item_type)
+
+	return search_to_compare(query, country_languages)
 
-def compare_by_word_case_sensitive(word, country_language, year, study, multiplew):
+def compare_by_word_case_sensitive(word, country_languages, year, study, multiplew):
 	"""
-	Retrieves survey items to later on be used on the compare_by_word() method in case sensitive mode, which refers to the functionality of 
+	Retrieves survey items to later on be used on the compare_by_word() method in case sensitive mode, which refers to the functionality of
 	comparing questionnaires with word filtering. Country and language, year, and study metadata are obligatory for this search.
-	
+
 	Args:
 
 		param1 word (string): the word (or multiple words) that the user wants to search for.
-		param2 country_language (string): country and language questionnaire metadata.
+		param2 country_languages (list): country and language questionnaire metadata of the compared questionnaires.
 		param3 year (string): year metadata filter. Indicates in which year a given study was released.
 		param4 study (string): study questionnaire metadata. Can be ESS, EVS, SHARE or WIS.
 
-	Returns: 
+	Returns:
 
-		A pandas dataframe containing the results of the search query.
+		A list of pandas dataframes, one for each country_language, containing the results of the search query.
 	"""
-	if multiplew:
-		word = prepare_words_for_multiple_word_search(word)
-
-	if study == 'SHARE':
-		study = 'SHA'
-
-	results = db.session.execute("select survey_itemid, text, item_name,item_type from survey_item where text like \'%"+str(word)+"%\' and survey_itemid ilike \'"+str(study)+"%_"+str(year)+"_%"+str(country_language)+"%\'")	
+	query = SearchQuery('survey_item', ['survey_itemid', 'text', 'item_name', 'item_type'])
+	query.where(*adapt_for_search_type_case_sensitive(False, word, multiplew))
+	query.filter_metadata('No filter', year, study)
 
-	lst = []
-	for result in results:
-		item = {'survey_itemid': result[0], 'Text':result[1],  'item_name': result[2], 
-		'item_type': result[3]}
-		lst.append(item)
-
-	df = pd.DataFrame.from_dict(lst)
-
-
-	db.session.close()
-	db.session.remove()
-
-	return df
+	return search_to_compare(query, country_languages)
 
-def compare_by_word_case_insensitive(word, country_language, year, study, multiple_words, partial):
+def compare_by_word_case_insensitive(word, country_languages, year, study, multiple_words, partial):
 	"""
-	Retrieves survey items to later on be used on the compare_by_word() method in case insensitive mode, which refers to the functionality of 
+	Retrieves survey items to later on be used on the compare_by_word() method in case insensitive mode, which refers to the functionality of
 	comparing questionnaires with word filtering. Country and language, year, and study metadata are obligatory for this search.
-	
+	The full word condition is built for every text search configuration (as when no language filter is applied), so each
+	questionnaire is searched with the configuration of its language.
+
 	Args:
-	
+
 		param1 word (string): the word (or multiple words) that the user wants to search for.
-		param2 country_language (string): country and language questionnaire metadata.
+		param2 country_languages (list): country and language questionnaire metadata of the compared questionnaires.
 		param3 year (string): year metadata filter. Indicates in which year a given study was released.
 		param4 study (string): study questionnaire metadata. Can be ESS, EVS, SHARE or WIS.
 		param5 multiple_words (string): indicates if the user is searching for a single words or multiple words.
 		param6 partial (string): indicates if the user wants see partial results (e.g. running, runs when searching for run).
 
-	Returns: 
+	Returns:
 
-		A pandas dataframe containing the results of the search query.
+		A list of pandas dataframes, one for each country_language, containing the results of the search query.
 	"""
-	if multiple_words and partial:
-		word = prepare_words_for_multiple_word_search(word)
-	elif multiple_words and not partial:
-		words = word.split(';')
-		clean_w = []
-		for w in words:
-			if w!='' and w!=' ':
-				clean_w.append(w)
-		word = ' & '.join(clean_w)
-
-	if study == 'SHARE':
-		study = 'SHA'
-
-	if partial:
-		results = db.session.execute("select survey_itemid, text, item_name, item_type from survey_item where text ilike \'%"+str(word)+"%\' and survey_itemid ilike \'"+str(study)+"%_"+str(year)+"_%"+str(country_language)+"%\'")
-	else:
-		results = db.session.execute("select survey_itemid, text, item_name, item_type from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%_"+str(year)+"_%"+str(country_language)+"%\'")
-			
-
-	lst = []
-	for result in results:
-		item = {'survey_itemid': result[0], 'Text':result[1],  'item_name': result[2], 
-		'item_type': result[3]}
-		lst.append(item)
-		
-	df = pd.DataFrame.from_dict(lst)
-
-	print(df)
-
-	db.session.close()
-	db.session.remove()
-
-	return df
-
+	query = SearchQuery('survey_item', ['survey_itemid', 'text', 'item_name', 'item_type'])
+	query.where(*adapt_for_search_type_case_insensitive(False, word, partial, multiple_words, 'No filter'))
+	query.filter_metadata('No filter', year, study)
 
+	return search_to_compare(query, country_languages)
 
 def get_columnid_name(item_type):
 	"""
 	Returns the name of the column ID based on the item type filter.
-	
+
 	Args:
 		param1 item_type (string): item type metadata filter. Can be INTRODUCTION, INSTRUCTION, REQUEST or RESPONSE.
 
-	Returns: 
+	Returns:
 
 		The name of the column ID that corresponds to a given item type.
 	"""
@@ -1003,9 +819,10 @@ def get_columnid_name(item_type):
 def compute_word_search_for_collocation(word, country_language, year, study, item_type):
 	"""
 	This is a insensitive word count search to compute the word collocations.
-	The search query is built depending on the metadata selected by the user. 
-	This method considers all possible combinations between the set of metadata available for this search.
-	
+	The search query is built with the metadata filters selected by the user. The survey items are read already tokenized
+	from the token store (see tokens.py) when it is up to date with the corpus; otherwise (e.g. the store was not
+	refreshed after a corpus load), or for the survey items that were not tokenized yet, the text is tokenized on the fly.
+
 	Args:
 		param1 word (string): the word that will be used to compute collocations-
 		param2 country_language (string): country and language questionnaire metadata.
@@ -1013,62 +830,30 @@ def compute_word_search_for_collocation(word, country_language, year, study, ite
 		param4 study (string): study questionnaire metadata. Can be ESS, EVS, SHARE or WIS.
 		param5 item_type (string): item type metadata filter. Can be INTRODUCTION, INSTRUCTION, REQUEST or RESPONSE.
 
-	Returns: 
+	Returns:
 
-		A pandas dataframe containing the results of the search query, that will then be used to compute the collocations.
+		A list with the tokens (list of strings) of each survey item found, that will then be used to compute the collocations.
 	"""
-	if study == 'SHARE':
-		study = 'SHA'
-
-	lst = []
-
-	columnid_type = get_columnid_name(item_type)
-
-	#C=y S=y Y=y I=y
-	if country_language != 'No filter' and study != 'No filter' and year != 'No filter' and item_type != 'No filter':
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\' and "+columnid_type+" is not null")
-	#C=y S=n Y=n I=n
-	elif country_language != 'No filter' and study == 'No filter' and year == 'No filter' and item_type == 'No filter':
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'%"+str(country_language)+"%\'")	
-	#C=y S=y Y=n I=n
-	elif country_language != 'No filter' and study != 'No filter' and year == 'No filter' and item_type == 'No filter':
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\'")
-	#C=y S=n Y=y I=n
-	elif country_language != 'No filter' and study == 'No filter' and year != 'No filter' and item_type == 'No filter':
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\'")
-	#C=y S=n Y=n I=y
-	elif country_language != 'No filter' and study == 'No filter' and year == 'No filter' and item_type != 'No filter':
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'%"+str(country_language)+"%\' and "+columnid_type+" is not null")
-	#C=y S=y Y=y I=n
-	elif country_language != 'No filter' and study != 'No filter' and year != 'No filter' and item_type == 'No filter':
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\'")
-	#C=y S=y Y=n I=y
-	elif country_language != 'No filter' and study != 'No filter' and year == 'No filter' and item_type != 'No filter':
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\' and "+columnid_type+" is not null")
-	#C=y S=n Y=y I=y
-	elif country_language != 'No filter' and study == 'No filter' and year != 'No filter' and item_type != 'No filter':
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\' and "+columnid_type+" is not null")
-	#C=n S=y Y=n I=n
-	elif country_language == 'No filter' and study != 'No filter' and year == 'No filter' and item_type == 'No filter':
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%\'")	
-	#C=n S=y Y=y I=n
-	elif country_language == 'No filter' and study != 'No filter' and year != 'No filter' and item_type == 'No filter':
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\'")	
-	#C=n S=y Y=n I=y
-	elif country_language == 'No filter' and study != 'No filter' and year == 'No filter' and item_type != 'No filter':
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'"+str(study)+"%\' and "+columnid_type+" is not null")	
-	#C=n S=n Y=y I=n
-	elif country_language == 'No filter' and study == 'No filter' and year != 'No filter' and item_type == 'No filter':
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and survey_itemid ilike \'%"+str(year)+"%\'")
-	#C=n S=n Y=n I=y
-	elif country_language == 'No filter' and study == 'No filter' and year == 'No filter' and item_type != 'No filter':
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\') and "+columnid_type+" is not null") 
+	if token_store_available():
+		query = SearchQuery('survey_item left join survey_item_tokens using (survey_itemid)', ['survey_item_tokens.tokens',
+			'case when survey_item_tokens.tokens is null then text end'])
 	else:
-		results = db.session.execute("select text from survey_item where to_tsvector(text) @@ to_tsquery(\'"+str(word)+"\')")
-		
+		query = SearchQuery('survey_item', ['null', 'text'])
+	query.where(*get_full_word_condition('text', unescape_apostrophes(word), country_language))
+	query.filter_metadata(country_language, year, study)
+	if item_type != 'No filter':
+		query.where(get_columnid_name(item_type)+" is not null")
+	results = execute_query(query)
+
+	token_ids = []
+	texts = []
 	for result in results:
-		lst.append(result[0])
-	
+		if result[0] is not None:
+			token_ids.append(result[0])
+		else:
+			texts.append(result[1])
+
+	lst = vocabulary.decode(token_ids) + tokenize_texts(texts)
 
 	db.session.close()
 	db.session.remove()
@@ -1076,322 +861,260 @@ def compute_word_search_for_collocation(word, country_language, year, study, ite
 	return lst
 
 
-def get_questionnaire(country_language, year, study, displaytagged):
+def build_questionnaire_query(country_language, year, study, displaytagged):
+	"""
+	Builds the query of get_questionnaire(), without executing it, so it can be either paginated or streamed.
+	The arguments are the same, except for the page. The questionnaire is ordered by item order.
+
+	Returns:
+
+		A tuple with the query (SearchQuery) and the labels of its columns (list of strings).
+	"""
+	if displaytagged:
+		labels = ['survey_itemid', 'item_type', 'Text', 'POS Tagged Text', 'NER Tagged Text', 'item_name', 'country_language', 'moduleid']
+		tagged_column = ['pos_tagged_text', 'ner_tagged_text']
+	else:
+		labels = ['survey_itemid', 'item_type', 'Text', 'item_name', 'country_language', 'moduleid']
+		tagged_column = []
+
+	query = SearchQuery('survey_item', ['survey_itemid', 'item_type', 'text']+tagged_column+['item_name', 'country_language', 'moduleid'])
+	query.filter_metadata(country_language, year, study)
+	query.order('item_order')
+	return query, labels
+
+
+@cached_result
+def get_questionnaire(country_language, year, study, displaytagged, page=None):
 	"""
 	Retrieves a given questionnaire (or set of questionnaires) to be either displayed to, or downloaded by the user (display_questionnaire() and download_questionnaire()).
-	
+
 	Args:
-	
+
 		param1 country_language (string): country and language questionnaire metadata.
 		param2 year (string): year metadata. Indicates in which year a given study was released.
 		param3 study (string): study questionnaire metadata.
 		param4 displaytagged (string): indicates if the user wants the results to include Part-of-Speech and Named Entity Recognition annotations or not.
+		param5 page (Page): the page of results to retrieve (see queries.py), or None to retrieve all results.
 
-	Returns: 
+	Returns:
 
 		A pandas dataframe containing the results of the search query.
 	"""
-	if study == 'SHARE':
-		study = 'SHA'
+	query, labels = build_questionnaire_query(country_language, year, study, displaytagged)
+	results = execute_paged_query(query, ['item_order', 'survey_itemid'], page)
 
-	if displaytagged:
-		tagged_column = 'pos_tagged_text, ner_tagged_text, '
-	else:
-		tagged_column = ''
-
-	#country_language=Y, study=Y, year=Y
-	if country_language != 'No filter' and study != 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, item_type, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\'")	
-	#country_language=Y, study=N, year=N
-	elif country_language != 'No filter' and study == 'No filter' and year == 'No filter':
-		results = db.session.execute("select survey_itemid, item_type, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where survey_itemid ilike \'%"+str(country_language)+"%\'")	
-	#country_language=Y, study=Y, year=N
-	elif country_language != 'No filter' and study != 'No filter' and year == 'No filter':
-		results = db.session.execute("select survey_itemid, item_type, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\'")
-	#country_language=Y, study=N, year=Y
-	elif country_language != 'No filter' and study == 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, item_type, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\'")
-	#country_language=N, study=Y, year=N
-	elif country_language == 'No filter' and study != 'No filter' and year == 'No filter':
-		results = db.session.execute("select survey_itemid, item_type, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where survey_itemid ilike \'"+str(study)+"%\'")	
-	#country_language=N, study=Y, year=Y
-	elif country_language == 'No filter' and study != 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, item_type, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\'")	
-	#country_language=N, study=N, year=Y
-	elif study == 'No filter' and country_language == 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, item_type, text, "+tagged_column+" item_name, country_language, moduleid from survey_item where survey_itemid ilike \'%_"+str(year)+"_%\'")
-	
-	lst = []
-	if displaytagged:
-		for result in results:
-			item = {'survey_itemid': result[0], 'item_type':  result[1], 'Text':result[2],  'POS Tagged Text':result[3],  'NER Tagged Text':result[4],
-			'item_name': result[5], 'country_language': result[6], 'moduleid': result[7]}
-			lst.append(item)
-	else:
-		for result in results:
-			item = {'survey_itemid': result[0], 'item_type':  result[1], 'Text':result[2],  'item_name': result[3], 
-			'country_language': result[4], 'moduleid': result[5]}
-			lst.append(item)
-	
-
-	lst = sorted(lst, key=lambda x: int(x['survey_itemid'].split("_")[-1]))
-	df = pd.DataFrame.from_dict(lst)
+	df = get_results_dataframe(results, labels)
+	add_page_info(df, results)
 
 	db.session.close()
 	db.session.remove()
 	return df
 
-def get_alignment(country_language, year, study, displaytagged):
+def build_alignment_query(country_language, year, study, displaytagged):
+	"""
+	Builds the query of get_alignment(), without executing it, so it can be either paginated or streamed.
+	The arguments are the same, except for the page.
+
+	Returns:
+
+		A tuple with the query (SearchQuery) and the labels of its columns (list of strings).
+	"""
+	if displaytagged:
+		labels = ['source_survey_itemid', 'target_survey_itemid', 'Source Text', 'Target Text', 'POS Tagged Source Text', 'POS Tagged Target Text',
+		'NER Tagged Source Text', 'NER Tagged Target Text']
+		tagged_column = ['source_pos_tagged_text', 'target_pos_tagged_text', 'source_ner_tagged_text', 'target_ner_tagged_text']
+	else:
+		labels = ['source_survey_itemid', 'target_survey_itemid', 'Source Text', 'Target Text']
+		tagged_column = []
+
+	query = SearchQuery('alignment', ['source_survey_itemid', 'target_survey_itemid', 'source_text', 'target_text']+tagged_column)
+	query.filter_metadata(country_language, year, study, prefix='target_')
+	return query, labels
+
+
+@cached_result
+def get_alignment(country_language, year, study, displaytagged, page=None):
 	"""
 	Retrieves a given questionnaire (or set of questionnaires) alignment to be either displayed to, or downloaded by the user (display_alignment() and download_alignment()).
-	
+
 	Args:
-	
+
 		param1 country_language (string): country and language questionnaire metadata.
 		param2 year (string): year metadata. Indicates in which year a given study was released.
 		param3 study (string): study questionnaire metadata.
 		param4 displaytagged (string): indicates if the user wants the results to include Part-of-Speech and Named Entity Recognition annotations or not.
+		param5 page (Page): the page of results to retrieve (see queries.py), or None to retrieve all results.
 
-	Returns: 
+	Returns:
 
 		A pandas dataframe containing the results of the search query.
 	"""
-	if study == 'SHARE':
-		study = 'SHA'
-
-	if displaytagged:
-		tagged_column = ', source_pos_tagged_text, target_pos_tagged_text, source_ner_tagged_text, target_ner_tagged_text '
-	else:
-		tagged_column = ''
-
-	#country_language=Y, study=Y, year=Y
-	if country_language != 'No filter' and study != 'No filter' and year != 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text,target_text "+tagged_column+" from alignment  where target_survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\'")	
-	#country_language=Y, study=N, year=N
-	elif country_language != 'No filter' and study == 'No filter' and year == 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text,target_text "+tagged_column+" from alignment  where target_survey_itemid ilike \'%"+str(country_language)+"%\'")	
-	#country_language=Y, study=Y, year=N
-	elif country_language != 'No filter' and study != 'No filter' and year == 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text,target_text "+tagged_column+" from alignment  where target_survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\'")
-	#country_language=Y, study=N, year=Y
-	elif country_language != 'No filter' and study == 'No filter' and year != 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text,target_text "+tagged_column+" from alignment  where target_survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\'")
-	#country_language=N, study=Y, year=N
-	elif country_language == 'No filter' and study != 'No filter' and year == 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text,target_text "+tagged_column+" from alignment  where target_survey_itemid ilike \'"+str(study)+"%\'")	
-	#country_language=N, study=Y, year=Y
-	elif country_language == 'No filter' and study != 'No filter' and year != 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text,target_text "+tagged_column+" from alignment  where target_survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\'")	
-	#country_language=N, study=N, year=Y
-	elif study == 'No filter' and country_language == 'No filter' and year != 'No filter':
-		results = db.session.execute("select source_survey_itemid, target_survey_itemid, source_text,target_text "+tagged_column+" from alignment  where target_survey_itemid ilike \'%_"+str(year)+"_%\'")
-	
-	lst = []
-	if displaytagged:
-		for result in results:
-			item = {'source_survey_itemid': result[0], 'target_survey_itemid':result[1],  
-			'Source Text': result[2], 'Target Text': result[3], 'POS Tagged Source Text': result[4], 'POS Tagged Target Text': result[5],
-			'NER Tagged Source Text': result[6], 'NER Tagged Target Text': result[7]}
-			lst.append(item)
-	else:
-		for result in results:
-			item = {'source_survey_itemid': result[0], 'target_survey_itemid':result[1],  
-			'Source Text': result[2], 'Target Text': result[3]}
-			lst.append(item)
-
-	df = pd.DataFrame.from_dict(lst)
+	query, labels = build_alignment_query(country_language, year, study, displaytagged)
+	results = execute_paged_query(query, ['alignmentid'], page)
 
+	df = get_results_dataframe(results, labels)
+	add_page_info(df, results)
 
 	db.session.close()
 	db.session.remove()
 	return df
 
+def get_tmx_language(country_language):
+	"""
+	Gets the language code used in the translation memories (e.g. 'cat' for CAT_ES).
+
+	Args:
+
+		param1 country_language (string): country and language (or just language) questionnaire metadata.
+
+	Returns:
+
+		The language code (string).
+	"""
+	if "_" in country_language:
+		return country_language.split("_")[0].lower()
+	else:
+		return country_language.lower()
+
+def build_alignment_for_tmx_query(country_language, year, study):
+	"""
+	Builds the query of get_alignment_for_tmx(), without executing it, so it can be streamed.
+	The arguments are the same.
+
+	Returns:
+
+		A tuple with the query (SearchQuery) and the labels of its columns (list of strings). The target language is the third label.
+	"""
+	target_lang = get_tmx_language(country_language)
+	labels = ['en', 'en_id', target_lang, target_lang+'_id']
+
+	query = SearchQuery('alignment', ['source_text', 'source_survey_itemid', 'target_text', 'target_survey_itemid'])
+	query.filter_metadata(country_language, year, study, prefix='target_')
+	return query, labels
+
+def build_alignment_for_tmx_bundle_query(country_language, year, study, by_language):
+	"""
+	Builds the query of the multi-target and bundled translation memories (see iterMultiTargetTMX() and iterTMXBundle()),
+	which read all the target languages of the filtered alignment in a single pass.
+
+	Args:
+
+		param1 country_language (string): country and language questionnaire metadata. Can be 'No filter'.
+		param2 year (string): year metadata. Indicates in which year a given study was released.
+		param3 study (string): study questionnaire metadata.
+		param4 by_language (boolean): orders the rows by target language (bundle), instead of by source segment (multi-target).
+
+	Returns:
+
+		The query (SearchQuery), whose rows are the source text, source segment id, target text, target segment id and target language.
+	"""
+	query = SearchQuery('alignment', ['source_text', 'source_survey_itemid', 'target_text', 'target_survey_itemid', 'lower(target_language)'])
+	query.filter_metadata(country_language, year, study, prefix='target_')
+	if by_language:
+		query.order('target_language', 'alignmentid')
+	else:
+		query.order('source_survey_itemid', 'target_language', 'alignmentid')
+	return query
+
 def get_alignment_for_tmx(country_language, year, study):
 	"""
 	Retrieves a given questionnaire (or set of questionnaires) alignment to build a translation memory on create_tmx() method.
-	
+
 	Args:
-	
+
 		param1 country_language (string): country and language questionnaire metadata.
 		param2 year (string): year metadata. Indicates in which year a given study was released.
 		param3 study (string): study questionnaire metadata.
 
-	Returns: 
+	Returns:
 
 		A pandas dataframe containing the results of the search query.
 	"""
-	if study == 'SHARE':
-		study = 'SHA'
+	query, labels = build_alignment_for_tmx_query(country_language, year, study)
+	results = execute_query(query)
 
-	
-	#country_language=Y, study=Y, year=Y
-	if country_language != 'No filter' and study != 'No filter' and year != 'No filter':
-		results = db.session.execute("select source_text, source_survey_itemid, target_text, target_survey_itemid from alignment  where target_survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\'")	
-	#country_language=Y, study=N, year=N
-	elif country_language != 'No filter' and study == 'No filter' and year == 'No filter':
-		results = db.session.execute("select source_text, source_survey_itemid, target_text, target_survey_itemid from alignment  where target_survey_itemid ilike \'%"+str(country_language)+"%\'")	
-	#country_language=Y, study=Y, year=N
-	elif country_language != 'No filter' and study != 'No filter' and year == 'No filter':
-		results = db.session.execute("select source_text, source_survey_itemid, target_text, target_survey_itemid from alignment  where target_survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\'")
-	#country_language=Y, study=N, year=Y
-	elif country_language != 'No filter' and study == 'No filter' and year != 'No filter':
-		results = db.session.execute("select source_text, source_survey_itemid, target_text, target_survey_itemid from alignment  where target_survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\'")
-	#country_language=N, study=Y, year=N
-	elif country_language == 'No filter' and study != 'No filter' and year == 'No filter':
-		results = db.session.execute("select source_text, source_survey_itemid, target_text, target_survey_itemid from alignment  where target_survey_itemid ilike \'"+str(study)+"%\'")	
-	#country_language=N, study=Y, year=Y
-	elif country_language == 'No filter' and study != 'No filter' and year != 'No filter':
-		results = db.session.execute("select source_text, source_survey_itemid, target_text, target_survey_itemid from alignment  where target_survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\'")	
-	#country_language=N, study=N, year=Y
-	elif study == 'No filter' and country_language == 'No filter' and year != 'No filter':
-		results = db.session.execute("select source_text, source_survey_itemid, target_text, target_survey_itemid from alignment  where target_survey_itemid ilike \'%_"+str(year)+"_%\'")
-	
-	lst = []
-	if "_" in country_language:
-		target_lang = country_language.split("_")[0].lower()
-	else:
-		target_lang =country_language.lower()
-
-	for result in results:
-		item = {'en': result[0], 'en_id': result[1],  target_lang:result[2],  target_lang+'_id':result[3]}
-		lst.append(item)
-
-	df = pd.DataFrame.from_dict(lst)
+	df = get_results_dataframe(results, labels)
 
 	db.session.close()
 	db.session.remove()
-	return df, target_lang
+	return df, labels[2]
 
 def prepare_tag_sequence_for_search(tags):
 	"""
-	Prepares the query string that concerns to the tags, to put it in the correct format accepted by PostgreSQL.
-	
+	Prepares the pattern that concerns to the tags, to put it in the correct format accepted by the 'ilike' operator in PostgreSQL.
+
 	Args:
-	
+
 		param1 tags (list): list of tags (strings), as specified by the user in the search form.
 
-	Returns: 
+	Returns:
 
-		A portion of the search query (string) that refers to the tag sequence. 
+		The pattern (string) that matches the tag sequence.
 	"""
-	if len(tags) == 1:
-		return " and pos_tagged_text ilike \'%"+str(tags[0])+"%\'" 
-	else:
-		query = " and pos_tagged_text ilike \'%"+str(tags[0])+"%"
-		for tag in tags[1:]:
-			query = query+str(tag)+"%"
-		query = query+"\'" 
-		return query
+	return '%'+'%'.join(tags)+'%'
 
-def get_tag_sequence(text):
+def get_tag_sequence_expression(column):
 	"""
-	Extracts only the tags from a given text segment.
-	
+	Builds a SQL expression that extracts only the tags from the text segments of a given column, as a sequence of
+	tags separated by spaces and without the angle brackets (e.g. "DET NOUN VERB").
+
 	Args:
-	
-		param1 text (string): a text segment from a given questionnaire, containing part of speech tagging annotations.
 
-	Returns: 
+		param1 column (string): name of the column containing the text segments with part of speech tagging annotations.
 
-		A sequence of part of speech tags extracted from the text segment (string).
-	"""
-	pos_tag_sequence = re.findall('<.*?>',text)
-	pos_tag_sequence = ' '.join(pos_tag_sequence)
+	Returns:
 
-	return pos_tag_sequence
+		A SQL expression (string).
+	"""
+	return "array_to_string(array(select replace(m[1], '<', '') from regexp_matches("+column+", '<([^>\\n]*)>', 'g') m), ' ')"
 
-def filter_results(results, tags, partial):
+def get_tag_sequence_condition(column, tags, partial):
 	"""
-	Filters the results of the pos tag sequence search. If the search type selected was partial,
+	Builds the condition that filters the results of the pos tag sequence search. If the search type selected was partial,
 	then a partial match will be considered in the results, otherwise only exact matches will be considered.
-	
+	The condition is checked by PostgreSQL, so the pages and the total number of results only count the matching segments.
+
 	Args:
-		param1 results (list): a list of text segments (strings) from questionnaires.
+		param1 column (string): name of the column containing the text segments with part of speech tagging annotations.
 		param2 tags (list): list of tags (strings).
 		param3 partial (string): indicates if the user wants see partial results e.g. a tag sequence that is part of a larger sequence.
 
-	Returns: 
+	Returns:
 
-		A list of results (strings) filtered according to the search type (partial or not partial).
+		A tuple with the condition (string) and its parameter.
 	"""
 	tag_sequence = ' '.join(tags)
-	filtered_results = []
 	if partial:
-		for ret in results:
-			t = get_tag_sequence(ret[2])
-			t = t.replace(">", "")
-			t = t.replace("<", "") 
-			
-			if tag_sequence in t:
-				filtered_results.append(ret)
-	else:
-		for ret in results:
-			t = get_tag_sequence(ret[2])
-			t = t.replace(">", "")
-			t = t.replace("<", "") 
-			
-			if t == tag_sequence:
-				filtered_results.append(ret)
-
-
-	return filtered_results
+		return "strpos("+get_tag_sequence_expression(column)+", ?) > 0", tag_sequence
+	return get_tag_sequence_expression(column)+" = ?", tag_sequence
 
-def search_by_pos_tag_sequence(tags, country_language, year, study, item_type, partial):
+def search_by_pos_tag_sequence(tags, country_language, year, study, item_type, partial, page=None):
 	"""
 	Searches for a Part-of-Speech (POS) tag sequence in the pos_tagged_text column.
 	The tag sequence is manipulated to the approriate format for a query in the prepare_tag_sequence_for_search() method.
-	Then, this method builds the remaining search query according the metadata selected by the user. 
-	This method considers all possible combinations between the set of metadata available for this search.
-	
+	Then, this method adds the metadata filters selected by the user to the search query.
+	The 'ilike' pattern selects the candidate segments, and the tag sequence itself is checked by get_tag_sequence_condition().
+
 	Args:
 		param1 tags (list of strings): the list of POS tags that form the sequence.
 		param2 country_language (string): country and language questionnaire metadata.
 		param3 year (string): year metadata. Indicates in which year a given study was released.
 		param4 study (string): study questionnaire metadata.
-		param5 item_type (string): item_type segment metadata. Can be INTRODUCTION,	 INSTRUCTION, REQUEST or RESPONSE.	
+		param5 item_type (string): item_type segment metadata. Can be INTRODUCTION,	 INSTRUCTION, REQUEST or RESPONSE.
 		param5 multiple_words (string): indicates if the user is searching for a single words or multiple words.
 		param6 partial (string): indicates if the user wants to search for the exact inputed sequence or if more tags are allowed.
+		param7 page (Page): the page of results to retrieve (see queries.py), or None to retrieve all results.
 
-	Returns: 
+	Returns:
 
 		A pandas dataframe containing the results of the search query.
 	"""
-	if study == 'SHARE':
-		study = 'SHA'
-
-	if item_type != 'No filter':
-		add_item_type = " and item_type ilike \'" +item_type+"\'" 
-	else:
-		add_item_type = ''
-
-	tag_query = prepare_tag_sequence_for_search(tags)
-
-	
-	
-	#country_language=Y, study=Y, year=Y
-	if country_language != 'No filter' and study != 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, text, pos_tagged_text from survey_item where survey_itemid ilike \'"+str(study)+"%"+str(year)+"%"+str(country_language)+"%\'"+tag_query+add_item_type)	
-	#country_language=Y, study=N, year=N
-	elif country_language != 'No filter' and study == 'No filter' and year == 'No filter':
-		results = db.session.execute("select survey_itemid, text, pos_tagged_text from survey_item where survey_itemid ilike \'%"+str(country_language)+"%\'"+tag_query+add_item_type)	
-	#country_language=Y, study=Y, year=N
-	elif country_language != 'No filter' and study != 'No filter' and year == 'No filter':
-		results = db.session.execute("select survey_itemid, text, pos_tagged_text from survey_item where survey_itemid ilike \'"+str(study)+"%"+str(country_language)+"%\'"+tag_query+add_item_type)
-	#country_language=Y, study=N, year=Y
-	elif country_language != 'No filter' and study == 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, text, pos_tagged_text from survey_item where survey_itemid ilike \'%"+str(year)+"%"+str(country_language)+"%\'"+tag_query+add_item_type)
-	#country_language=N, study=Y, year=N
-	elif country_language == 'No filter' and study != 'No filter' and year == 'No filter':
-		results = db.session.execute("select survey_itemid, text, pos_tagged_text from survey_item where survey_itemid ilike \'"+str(study)+"%\'"+tag_query+add_item_type)	
-	#country_language=N, study=Y, year=Y
-	elif country_language == 'No filter' and study != 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, text, pos_tagged_text from survey_item where survey_itemid ilike \'"+str(study)+"%"+str(year)+"%\'"+tag_query+add_item_type)	
-	#country_language=N, study=N, year=Y
-	elif study == 'No filter' and country_language == 'No filter' and year != 'No filter':
-		results = db.session.execute("select survey_itemid, text, pos_tagged_text from survey_item where survey_itemid ilike \'%_"+str(year)+"_%\'"+tag_query+add_item_type)
-	
-	results = filter_results(results, tags, partial)
-
+	query = SearchQuery('survey_item', ['survey_itemid', 'text', 'pos_tagged_text'])
+	query.filter_metadata(country_language, year, study)
+	query.where("pos_tagged_text ilike ?", prepare_tag_sequence_for_search(tags))
+	query.where(*get_tag_sequence_condition('pos_tagged_text', tags, partial))
+	query.filter_metadata(item_type=item_type)
+	results = execute_paged_query(query, ['survey_itemid'], page)
 
 	lst = []
 	for result in results:
@@ -1399,7 +1122,8 @@ def search_by_pos_tag_sequence(tags, country_language, year, study, item_type, p
 		lst.append(item)
 
 	df = pd.DataFrame.from_dict(lst)
+	add_page_info(df, results)
 
 	db.session.close()
 	db.session.remove()
-	return df
\ No newline at end of file
+	return df
@@ -1,11 +1,232 @@
 import csv
+import itertools
+import zipfile
 from xml.etree import ElementTree as ET  
 from xml.etree.ElementTree import ElementTree
 from xml.etree.ElementTree import Element, SubElement, Comment, tostring, ElementTree
 import datetime
+from xml.sax.saxutils import escape
 import pandas as pd 
 
 
+# The TMX documents are written incrementally, so translation memories of any size can be streamed to the user
+# without building the whole XML tree in memory. The output is byte for byte the one of ET.tostring() on the
+# equivalent tree: us-ascii encoding with character references, no XML declaration and the same escaping
+# (the entities of ATTRIBUTE_ENTITIES in attribute values, and only &, < and > in text).
+
+ATTRIBUTE_ENTITIES = {'"': '&quot;', '\r': '&#13;', '\n': '&#10;', '\t': '&#09;'}
+
+
+def escape_attribute(value):
+    """
+    Escapes an attribute value, to be written between double quotes.
+    """
+    return escape(value, ATTRIBUTE_ENTITIES)
+
+
+def get_tmx_header(srclang, adminlang='en', segtype='phrase', datatype='PlainText', oEncoding='UTF-8'):
+    """
+    Writes the opening tag of the TMX document and its header.
+
+    Returns:
+
+        The header (string).
+    """
+    attributes = [('creationtool', ''), ('creationtoolversion', ''), ('segtype', segtype), ('o-tmf', ''),
+    ('adminlang', adminlang), ('srclang', srclang), ('datatype', datatype), ('o-encoding', oEncoding)]
+
+    return '<tmx version="1.4"><header '+' '.join(name+'="'+escape_attribute(value)+'"' for name, value in attributes)+' />'
+
+
+def get_tmx_tu(tuvs, props=None):
+    """
+    Writes a translation unit.
+
+    Args:
+
+        param1 tuvs (list): the variants of the unit, as tuples with the language, the text and the id of the segment.
+        Segments without text are written with an empty id.
+        param2 props (list): the properties of the unit, as tuples with the type and the value (strings).
+
+    Returns:
+
+        The translation unit (string).
+    """
+    tu = '<tu>'
+    for prop_type, value in props or []:
+        tu = tu+'<prop type="'+ET._escape_attrib(prop_type)+'">'+ET._escape_cdata(value)+'</prop>'
+    for lang, text, segment_id in tuvs:
+        tu = tu+'<tuv xml:lang="'+escape_attribute(lang)+'">'
+        if text:
+            tu = tu+'<seg id="'+escape_attribute(segment_id)+'">'+escape(text)+'</seg></tuv>'
+        else:
+            tu = tu+'<seg id="" /></tuv>'
+
+    return tu+'</tu>'
+
+
+def writeTMX(tu_batches, srclang, adminlang='en', segtype='phrase', datatype='PlainText', oEncoding='UTF-8'):
+    """
+    Writes a TMX document around batches of translation units, one chunk per batch.
+
+    Args:
+
+        param1 tu_batches (iterable): lists of translation units (strings, see get_tmx_tu()).
+        param2 srclang (string): the source language.
+
+    Returns:
+
+        A generator of chunks of the TMX file (bytes).
+    """
+    chunk = get_tmx_header(srclang, adminlang, segtype, datatype, oEncoding)
+    empty = True
+    for tus in tu_batches:
+        if not tus:
+            continue
+        if empty:
+            chunk = chunk+'<body>'
+            empty = False
+        yield (chunk+''.join(tus)).encode('ascii', 'xmlcharrefreplace')
+        chunk = ''
+
+    if empty:
+        chunk = chunk+'<body />'
+    else:
+        chunk = chunk+'</body>'
+    yield (chunk+'</tmx>').encode('ascii', 'xmlcharrefreplace')
+
+
+def get_occurrence_props(row):
+    """
+    Gets the properties of a deduplicated translation unit: the number of times the segment pair occurs
+    and the surveys where it occurs (see dedupe_alignment_rows()).
+    """
+    return [('x-occurrences', str(row[-2])), ('x-surveys', row[-1])]
+
+
+def iterTMX(batches, srclang, targetlang, adminlang='en', segtype='phrase', datatype='PlainText', oEncoding='UTF-8', occurrences=False):
+    """
+    Streaming version of createTMX(). Writes the translation memory one batch of aligned segments at a time.
+
+    Args:
+
+        param1 batches (iterable): lists of rows with the source text, source segment id, target text and target segment id.
+        param2 srclang (string): in the case of MCSQ, the source is always English.
+        param3 targetlang (string): the target language.
+        param4 occurrences (boolean): the rows are deduplicated and end with the number of occurrences and the surveys of
+        the segment pair, which are written as properties of the translation units.
+
+    Returns:
+
+        A generator of chunks of the TMX file (bytes).
+    """
+    if occurrences:
+        tu_batches = ([get_tmx_tu([(srclang, row[0], row[1]), (targetlang, row[2], row[3])], get_occurrence_props(row)) for row in rows] for rows in batches)
+    else:
+        tu_batches = ([get_tmx_tu([(srclang, row[0], row[1]), (targetlang, row[2], row[3])]) for row in rows] for rows in batches)
+
+    return writeTMX(tu_batches, srclang, adminlang, segtype, datatype, oEncoding)
+
+
+def get_multi_target_tu(srclang, rows):
+    """
+    Writes the translation unit of a source segment with all of its translations.
+
+    Args:
+
+        param1 srclang (string): the source language.
+        param2 rows (list): the alignment rows of the source segment (see iterMultiTargetTMX()).
+
+    Returns:
+
+        The translation unit (string).
+    """
+    return get_tmx_tu([(srclang, rows[0][0], rows[0][1])]+[(row[4], row[2], row[3]) for row in rows])
+
+
+def iterMultiTargetTMX(batches, srclang, adminlang='en', segtype='phrase', datatype='PlainText', oEncoding='UTF-8'):
+    """
+    Writes a multi-target translation memory: a single translation unit per source segment, with the source variant
+    followed by the variants of every target language. The rows must be ordered by source segment id, so the
+    translations of a segment are consecutive. Rows without source segment id (target segments with no
+    source counterpart) are written as units of their own.
+
+    Args:
+
+        param1 batches (iterable): lists of rows with the source text, source segment id, target text, target segment id and target language.
+        param2 srclang (string): in the case of MCSQ, the source is always English.
+
+    Returns:
+
+        A generator of chunks of the TMX file (bytes).
+    """
+    def get_tu_batches():
+        group = []
+        for rows in batches:
+            tus = []
+            for row in rows:
+                if group and (row[1] is None or row[1] != group[0][1]):
+                    tus.append(get_multi_target_tu(srclang, group))
+                    group = []
+                group.append(row)
+            yield tus
+        if group:
+            yield [get_multi_target_tu(srclang, group)]
+
+    return writeTMX(get_tu_batches(), srclang, adminlang, segtype, datatype, oEncoding)
+
+
+class ZipStream:
+    """
+    Write-only, unseekable file that keeps what was written until it is read, so a zip archive can be streamed
+    while it is being written.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iterTMXBundle(batches, srclang, get_filename, batch_size=5000, adminlang='en', segtype='phrase', datatype='PlainText', oEncoding='UTF-8'):
+    """
+    Writes a zip archive with one translation memory per target language. The rows must be ordered by target language,
+    so each memory is written (and compressed) while its rows are read, and the archive is streamed in a single pass.
+
+    Args:
+
+        param1 batches (iterable): lists of rows with the source text, source segment id, target text, target segment id and target language.
+        param2 srclang (string): in the case of MCSQ, the source is always English.
+        param3 get_filename (function): receives a target language and returns the name of its memory in the archive.
+        param4 batch_size (int): the number of translation units written at a time.
+
+    Returns:
+
+        A generator of chunks of the zip file (bytes).
+    """
+    rows = itertools.chain.from_iterable(batches)
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for targetlang, group in itertools.groupby(rows, key=lambda row: row[4]):
+            group_batches = iter(lambda: list(itertools.islice(group, batch_size)), [])
+            with archive.open(get_filename(targetlang), 'w', force_zip64=True) as entry:
+                for chunk in iterTMX(group_batches, srclang, targetlang, adminlang, segtype, datatype, oEncoding):
+                    entry.write(chunk)
+                    data = stream.read()
+                    if data:
+                        yield data
+    yield stream.read()
+
+
 def createTMX(df, srclang, targetlang, adminlang='en', segtype='phrase', datatype='PlainText', oEncoding='UTF-8'):
     """
     Creates a translation memory (a XML file in Translation Memory eXchange specification) using the MCSQ aligment data.
@@ -21,43 +242,6 @@ def createTMX(df, srclang, targetlang, adminlang='en', segtype='phrase', datatyp
 
         A TMX file (XML). 
     """
-    generated_on = str(datetime.datetime.now())
-
-    root = Element('tmx')
-    root.set('version', '1.4')
-
-    header = SubElement(root, 'header')
-    header.set('creationtool','')
-    header.set('creationtoolversion', '')
-    header.set('segtype', segtype)
-    header.set('o-tmf', '')
-    header.set('adminlang', adminlang)
-    header.set('srclang', srclang)
-    header.set('datatype', datatype)
-    header.set('o-encoding', oEncoding)
-
-
-    body = SubElement(root, 'body')
-
-    for i, row in df.iterrows():
-        tu = SubElement(body, 'tu')
-        tuv_src = SubElement(tu, 'tuv')
-        tuv_src.set('xml:lang', srclang)
-        seg_src = SubElement(tuv_src, 'seg')
-        seg_src.text = row[srclang]
-        if row[srclang]:
-            seg_src.set('id', row[srclang+'_id'])
-        else:
-            seg_src.set('id', '')
-            
-        tuv_target = SubElement(tu, 'tuv')
-        tuv_target.set('xml:lang', targetlang)
-        seg_target = SubElement(tuv_target, 'seg')
-        seg_target.text = row[targetlang]
-        if row[targetlang]:
-            seg_target.set('id', row[targetlang+'_id'])
-        else:
-            seg_target.set('id',  '')
-
+    rows = df[[srclang, srclang+'_id', targetlang, targetlang+'_id']].itertuples(index=False, name=None)
 
-    return ET.tostring(root)
\ No newline at end of file
+    return b''.join(iterTMX([rows], srclang, targetlang, adminlang, segtype, datatype, oEncoding))
@@ -0,0 +1,215 @@
+import re
+import datetime
+import threading
+from nltk.tokenize import TweetTokenizer
+from . import db
+from .schema import CORPUS_VERSION_QUERY
+from .frequencies import FINGERPRINT_QUERY
+
+# Pre-tokenized corpus store for the collocations.
+# The Token table is the vocabulary of the corpus, assigning an id to each token, and the Survey item tokens table stores
+# the tokens of each survey item as an array of token ids, tokenized as tokenize_texts() does. Token ids are never
+# reassigned, so they can be cached by each process as they are used (see TokenVocabulary).
+# The store is refreshed per questionnaire (study, year and country_language), as the token frequencies: only the
+# questionnaires whose fingerprint changed since the last refresh are tokenized again. The fingerprint includes
+# TOKENIZER_VERSION, which must be increased whenever tokenize_text() changes, so the whole store is rebuilt.
+# The refresh records the corpus version it was computed from (see schema.py). The store is only read while that version
+# is the current one: after a corpus load, and until the refresh-token-store command is run again, the survey items
+# are tokenized on the fly, so a changed text is never read with its old tokens.
+
+TOKENIZER_VERSION = 1
+
+INSERT_TOKENS = """insert into token (token) select unnest(cast(:tokens as varchar[])) on conflict (token) do nothing"""
+
+INSERT_SURVEY_ITEM_TOKENS = """insert into survey_item_tokens (survey_itemid, tokens) values (:survey_itemid, :tokens)"""
+
+DELETE_SURVEY_ITEM_TOKENS = """delete from survey_item_tokens where survey_itemid in (select survey_itemid from survey_item
+where study = :study and year = :year and country_language = :country_language)"""
+
+DELETE_ORPHAN_SURVEY_ITEM_TOKENS = """delete from survey_item_tokens t
+where not exists (select 1 from survey_item s where s.survey_itemid = t.survey_itemid)"""
+
+
+def tokenize_text(text, tknzr):
+	"""
+	Tokenizes a text for the collocations: the text is lowercased and split with the TweetTokenizer, and punctuation is removed.
+
+	Args:
+		param1 text (string): the text of a survey item.
+		param2 tknzr (TweetTokenizer): the tokenizer.
+
+	Returns:
+
+		The list of tokens (strings).
+	"""
+	text = text.replace('-',' ')
+	text = text.replace('\n',' ')
+	text = text.replace('\t',' ')
+	text = text.replace('—',' ')
+	text = text.replace('…',' ')
+	text = text.replace('‘',"'")
+	text = text.replace('`',"'")
+	text = text.replace('“',' ')
+
+	text = text.rstrip()
+	text = text.lstrip()
+
+	tokens = tknzr.tokenize(text.lower())
+	tokens_without_punct = []
+	for token in tokens:
+		token = re.sub(r"[^\w\d'\s]+",'',token)
+		if token != '' and token != '«' and token != '»':
+			tokens_without_punct.append(token)
+
+	return tokens_without_punct
+
+
+def tokenize_texts(text_list):
+	"""
+	Tokenizes a list of texts (see tokenize_text()). Texts that are not strings (e.g. null texts) are left out.
+
+	Returns:
+
+		A list with the list of tokens of each text.
+	"""
+	tknzr = TweetTokenizer()
+	return [tokenize_text(text, tknzr) for text in text_list if isinstance(text, str)]
+
+
+class TokenVocabulary:
+	"""
+	Process-wide cache of the token ids decoded so far. Ids missing from the cache are read from the Token table.
+	"""
+	def __init__(self):
+		self.tokens = {}
+		self.lock = threading.Lock()
+
+	def decode(self, documents):
+		"""
+		Decodes documents of token ids.
+
+		Args:
+			param1 documents (list): lists of token ids (integers).
+
+		Returns:
+
+			A list with the list of tokens (strings) of each document.
+		"""
+		with self.lock:
+			tokens = self.tokens
+		missing = set(tokenid for document in documents for tokenid in document if tokenid not in tokens)
+
+		if missing:
+			loaded = {}
+			for result in db.session.execute("select tokenid, token from token where tokenid = any(:tokenids)", {'tokenids': list(missing)}):
+				loaded[result[0]] = result[1]
+			with self.lock:
+				self.tokens = {**self.tokens, **loaded}
+				tokens = self.tokens
+
+		return [[tokens[tokenid] for tokenid in document] for document in documents]
+
+
+vocabulary = TokenVocabulary()
+
+
+def get_token_ids(tokens):
+	"""
+	Gets the ids of tokens, adding the new ones to the Token table.
+
+	Args:
+		param1 tokens (set): the tokens (strings).
+
+	Returns:
+
+		A dictionary mapping each token to its id.
+	"""
+	db.session.execute(INSERT_TOKENS, {'tokens': sorted(tokens)})
+	ids = {}
+	for result in db.session.execute("select token, tokenid from token where token = any(cast(:tokens as varchar[]))", {'tokens': list(tokens)}):
+		ids[result[0]] = result[1]
+	return ids
+
+
+def tokenize_questionnaire(study, year, country_language):
+	"""
+	Tokenizes the survey items of a questionnaire and stores their token ids. Survey items without text are not stored.
+	"""
+	parameters = {'study': study, 'year': year, 'country_language': country_language}
+	tknzr = TweetTokenizer()
+	documents = []
+	for result in db.session.execute("""select survey_itemid, text from survey_item
+	where study = :study and year = :year and country_language = :country_language""", parameters):
+		if isinstance(result[1], str):
+			documents.append((result[0], tokenize_text(result[1], tknzr)))
+
+	ids = get_token_ids(set(token for document in documents for token in document[1]))
+	rows = [{'survey_itemid': survey_itemid, 'tokens': [ids[token] for token in tokens]} for survey_itemid, tokens in documents]
+	if rows:
+		db.session.execute(INSERT_SURVEY_ITEM_TOKENS, rows)
+
+
+def refresh_token_store():
+	"""
+	Brings the Survey item tokens table up to date with the Survey item table.
+	Questionnaires that were added or changed since the last refresh (or tokenized with another TOKENIZER_VERSION) are
+	tokenized again, and the tokens of the survey items that were removed are deleted.
+	The corpus version read before the fingerprints is recorded in the Token store refresh table: if the corpus changes
+	during the refresh, the version no longer matches and the store is not used until the next refresh.
+
+	Returns:
+
+		The number of questionnaires tokenized and deleted (tuple of integers).
+	"""
+	corpus_version = db.session.execute(CORPUS_VERSION_QUERY).scalar()
+
+	current = {}
+	for result in db.session.execute(FINGERPRINT_QUERY):
+		current[(result[0], result[1], result[2])] = result[3]+':'+str(TOKENIZER_VERSION)
+
+	stored = {}
+	for result in db.session.execute("select study, year, country_language, fingerprint from tokenized_questionnaire"):
+		stored[(result[0], result[1], result[2])] = result[3]
+
+	removed = [key for key in stored if key not in current]
+	changed = [key for key, fingerprint in current.items() if stored.get(key) != fingerprint]
+
+	for study, year, country_language in removed:
+		db.session.execute("delete from tokenized_questionnaire where study = :study and year = :year and country_language = :country_language",
+			{'study': study, 'year': year, 'country_language': country_language})
+
+	for study, year, country_language in changed:
+		parameters = {'study': study, 'year': year, 'country_language': country_language, 'fingerprint': current[(study, year, country_language)]}
+		db.session.execute(DELETE_SURVEY_ITEM_TOKENS, parameters)
+		tokenize_questionnaire(study, year, country_language)
+		db.session.execute("delete from tokenized_questionnaire where study = :study and year = :year and country_language = :country_language", parameters)
+		db.session.execute("""insert into tokenized_questionnaire (study, year, country_language, fingerprint)
+		values (:study, :year, :country_language, :fingerprint)""", parameters)
+		db.session.commit()
+
+	db.session.execute(DELETE_ORPHAN_SURVEY_ITEM_TOKENS)
+	db.session.execute("delete from token_store_refresh")
+	if corpus_version is not None:
+		db.session.execute("insert into token_store_refresh (corpus_version, refreshed) values (:corpus_version, :refreshed)",
+		{'corpus_version': corpus_version, 'refreshed': datetime.datetime.utcnow()})
+	db.session.commit()
+	db.session.execute("analyze token")
+	db.session.execute("analyze survey_item_tokens")
+	db.session.commit()
+
+	db.session.close()
+	db.session.remove()
+
+	return len(changed), len(removed)
+
+
+def token_store_available():
+	"""
+	Checks if the token store was refreshed from the current corpus version, so the stored tokens of the survey items
+	can be used instead of tokenizing their text.
+
+	Returns:
+
+		True if the token store is up to date, False otherwise.
+	"""
+	return bool(db.session.execute("select coalesce(("+CORPUS_VERSION_QUERY+") = (select max(corpus_version) from token_store_refresh), false)").scalar())
@@ -4,8 +4,12 @@ import operator
 import re
 import hashlib
 import binascii
+import csv
+import io
+import itertools
+import unicodedata
 import pandas as pd
-from flask import Flask, request, render_template, make_response,redirect, flash
+from flask import Flask, request, render_template, make_response,redirect, flash, stream_with_context
 from datetime import datetime as dt
 from flask import current_app as app
 import pandas as pd
@@ -16,6 +20,10 @@ from os.path import join, dirname
 from flask_login import UserMixin, login_required, current_user, login_user,logout_user
 from flask import Flask, request, render_template, make_response,redirect, flash
 from .searches import *
+from .cache import cached_result
+from .queries import Page, stream_query, open_snapshot_connection
+from .columnar import EXPORT_FORMATS, columnar_formats_available, iter_columnar, dataframe_to_columnar
+from .comparison import manipulate_results_dataframe
 from .routes import *
 
 class UserLoginForm(FlaskForm):
@@ -153,9 +161,103 @@ def check_word_search_restrictions(word, multiple_words):
 
 	return error_message
 
+def check_search_restrictions(word, multiple_words, partial, case_sensitive, regex):
+	"""
+	Checks if a word search is valid, for regex based searches (see check_regex_search_restrictions()) or not (see check_word_search_restrictions()).
+	
+	Args:
+
+		param1 word (string): the word (or multiple words) that the user wants to search for.
+		param2 multiple_words (string): indicates if the user is searching for a single words or multiple words.
+		param3 partial (string): indicates if the user wants see partial results (e.g. running, runs when searching for run).
+		param4 case_sensitive (string): indicates if the word search is case sensitive.
+		param5 regex (string): indicates if the user is doing a regex based search.
+
+	Returns: 
+		
+		An error message to be displayed to the user, if any restriction is broken.
+	"""
+	if regex:
+		return check_regex_search_restrictions(word, multiple_words, partial)
+
+	error_message = check_word_search_restrictions(word, multiple_words)
+	if error_message == '' and case_sensitive and not partial:
+		error_message = "Full word search is only case insensitive!"
+
+	return error_message
+
+def check_frequency_search_restrictions(word, multiple_words, combined):
+	"""
+	Checks if the word (or words) informed by the user in the word frequency functionality is valid.
+	
+	Args:
 
+		param1 word (string): the word (or multiple words) that the user wants to search for.
+		param2 multiple_words (string): indicates if the user is searching for a single words or multiple words.
+		param3 combined (string): indicates if the user wants the combined frequency of the words.
 
-def call_appropriated_word_search_method(tableid, word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex):
+	Returns: 
+		
+		An error message to be displayed to the user, if any restriction is broken.
+	"""
+	if ';' in word and not combined and not multiple_words:
+		return "Semicolons are valid only for Multiple/Combined word filters."
+	if '!' in word or ':' in word or ',' in word or '.' in word or '&' in word or ')' in word or '(' in word or '/' in word or '\\' in word or '*' in word or '%' in word or '#' in word or '|' in word or '=' in word or '~' in word or 'º' in word or 'ª' in word:
+		return "Special characters are not allowed in the word search."
+	if combined and multiple_words:
+		return "Cannot use both Multiple/Combined word filters at the same time, one must be chosen."
+	if ' ' in word or '\t' in word or '\n' in word:
+		return "Word search cannot contain spaces (or tabs, or line breaks). If you want to search for multiple words, mark the 'Multiple word search?' option and separate words by semicolon (e.g., read;this)"
+	if '"' in word or '`' in word:
+		return "Quotes are not allowed in the word search."
+	if word.count("'") % 2 != 0:
+		return "Please use double 's for escaping words that contain apostrophes (e.g., d''acord instead of d'acord)."
+
+	return ''
+
+def check_collocation_search_restrictions(word):
+	"""
+	Checks if the word informed by the user in the collocation functionality is valid.
+	
+	Args:
+
+		param1 word (string): the word that the user wants to search for.
+
+	Returns: 
+		
+		An error message to be displayed to the user, if any restriction is broken.
+	"""
+	if ';' in word:
+		return "Semicolons are not valid characters in the collocation functionality"
+	if ' ' in word or '\t' in word or '\n' in word:
+		return "Word search cannot contain spaces (or tabs, or line breaks). If you want to search for multiple words, mark the 'Multiple word search?' option and separate words by semicolon (e.g., read;this)"
+	if '"' in word or '`' in word:
+		return "Quotes are not allowed in the word search."
+	if '!' in word or ':' in word or ',' in word or '.' in word or '&' in word or ')' in word or '(' in word or '/' in word or '\\' in word or '*' in word or '%' in word or '#' in word or '|' in word or '=' in word or '~' in word or 'º' in word or 'ª' in word:
+		return "Special characters are not allowed in the word search."
+	if word.count("'") % 2 != 0:
+		return "Please use double 's for escaping words that contain apostrophes (e.g., d''acord instead of d'acord)."
+
+	return ''
+
+def check_questionnaire_filters(language_country, year, study):
+	"""
+	Checks if at least two of the language/country, study or year filters were used to retrieve a questionnaire.
+
+	Returns: 
+		
+		An error message to be displayed to the user, if the restriction is broken.
+	"""
+	filters = [value for value in [language_country, year, study] if value and value != 'No filter']
+	if len(filters) < 2:
+		return "It is necessary to use at least two filters from the following: language/country, study or year."
+
+	return ''
+
+
+
+@cached_result
+def call_appropriated_word_search_method(tableid, word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex, page=None):
 	"""
 	Calls the appropriated word search type, depending if the search is item type dependent and if user wants a case sensitive search or not.
 	
@@ -170,6 +272,7 @@ def call_appropriated_word_search_method(tableid, word, case_sensitive, partial,
 		param8 multiple_words (string): indicates if the user is searching for a single words or multiple words.
 		param9 displaytagged (string): indicates if the user wants the results to include Part-of-Speech and Named Entity Recognition annotations or not.
 		param10 regex (string): indicates if the user is doing a regex based search.
+		param11 page (Page): the page of results to retrieve (see queries.py), or None to retrieve all results.
 
 	Returns: 
 
@@ -177,21 +280,333 @@ def call_appropriated_word_search_method(tableid, word, case_sensitive, partial,
 	"""
 	if tableid == '':
 		if case_sensitive:
-			df = case_sensitive_search_item_type_independent(word, language_country, year,  study, multiple_words, displaytagged, regex)
+			df = case_sensitive_search_item_type_independent(word, language_country, year,  study, multiple_words, displaytagged, regex, page)
 		else:
-			df = case_insensitive_search_item_type_independent(word, language_country, year, study, multiple_words, partial, displaytagged, regex)
+			df = case_insensitive_search_item_type_independent(word, language_country, year, study, multiple_words, partial, displaytagged, regex, page)
 	elif tableid == 'alignment':
 		source_word = word[0]
 		target_word = word[1]
-		df = alignment_search(source_word, target_word, language_country, year, study, multiple_words, partial, case_sensitive, displaytagged, regex)
+		df = alignment_search(source_word, target_word, language_country, year, study, multiple_words, partial, case_sensitive, displaytagged, regex, page)
 	else:
 		if case_sensitive:
-			df = generic_case_sensitive_search(tableid, word, language_country, year,  study, multiple_words, displaytagged, regex)
+			df = generic_case_sensitive_search(tableid, word, language_country, year,  study, multiple_words, displaytagged, regex, page)
 		else:
-			df = generic_case_insensitive_search(tableid, word, language_country, year, study, multiple_words, partial, displaytagged, regex)
+			df = generic_case_insensitive_search(tableid, word, language_country, year, study, multiple_words, partial, displaytagged, regex, page)
 	
 	return df
 
+def build_word_search_query(tableid, word, case_sensitive, partial, language_country, year,  study, multiple_words, displaytagged, regex):
+	"""
+	Builds the query of the appropriated word search type, without executing it (see call_appropriated_word_search_method()).
+	The arguments are the same, except for the page.
+
+	Returns: 
+
+		A tuple with the query (SearchQuery) and the labels of its columns (list of strings).
+	"""
+	if tableid == '':
+		if case_sensitive:
+			return build_case_sensitive_search_item_type_independent_query(word, language_country, year,  study, multiple_words, displaytagged, regex)
+		else:
+			return build_case_insensitive_search_item_type_independent_query(word, language_country, year, study, multiple_words, partial, displaytagged, regex)
+	elif tableid == 'alignment':
+		source_word = word[0]
+		target_word = word[1]
+		return build_alignment_search_query(source_word, target_word, language_country, year, study, multiple_words, partial, case_sensitive, displaytagged, regex)
+	else:
+		if case_sensitive:
+			return build_generic_case_sensitive_search_query(tableid, word, language_country, year,  study, multiple_words, displaytagged, regex)
+		else:
+			return build_generic_case_insensitive_search_query(tableid, word, language_country, year, study, multiple_words, partial, displaytagged, regex)
+
+def rows_to_tsv(rows):
+	"""
+	Formats rows as lines of a tab separated file, quoted as pandas' to_csv() does.
+
+	Args:
+		param1 rows (list): the rows (sequences of values) to be formatted.
+
+	Returns: 
+
+		The lines, encoded in UTF-8 (bytes).
+	"""
+	output = io.StringIO()
+	writer = csv.writer(output, delimiter='\t', lineterminator='\n')
+	writer.writerows(rows)
+
+	return output.getvalue().encode('utf-8')
+
+def normalize_segment(text):
+	"""
+	Normalizes a text segment for the deduplication of alignment pairs: Unicode NFC, no leading, trailing nor repeated whitespace.
+	"""
+	if not text:
+		return ''
+	return unicodedata.normalize('NFC', ' '.join(text.split()))
+
+def get_surveyid(survey_itemid):
+	"""
+	Gets the id of the survey of a survey item (e.g. ESS_R01_2002_CAT_ES for ESS_R01_2002_CAT_ES_1).
+	"""
+	if not survey_itemid:
+		return ''
+	return survey_itemid.rsplit('_', 1)[0]
+
+def get_alignment_pair_key(row, source_text, target_text):
+	"""
+	Gets the hash of the normalized source and target texts of an alignment row, which identifies its pair.
+	"""
+	key = normalize_segment(row[source_text])+'\x00'+normalize_segment(row[target_text])
+	return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+def count_alignment_pairs(batches, source_text, target_text, target_survey_itemid):
+	"""
+	First pass of the deduplication of alignment rows (see dedupe_alignment_rows()): counts the occurrences of each
+	pair of normalized source and target texts, and the surveys where it occurs. Only the hash of each pair is kept,
+	not its texts.
+
+	Args:
+		param1 batches (iterable): lists of alignment rows.
+		param2 source_text (int): position of the source text in the rows.
+		param3 target_text (int): position of the target text in the rows.
+		param4 target_survey_itemid (int): position of the target segment id in the rows.
+
+	Returns: 
+
+		A dictionary mapping the hash of each pair to its number of occurrences and the ids of its surveys (in order of
+		occurrence, as the keys of a dictionary).
+	"""
+	pairs = {}
+	for rows in batches:
+		for row in rows:
+			key = get_alignment_pair_key(row, source_text, target_text)
+			pair = pairs.get(key)
+			if pair is None:
+				pairs[key] = [1, {get_surveyid(row[target_survey_itemid]): None}]
+			else:
+				pair[0] += 1
+				pair[1][get_surveyid(row[target_survey_itemid])] = None
+
+	return pairs
+
+def dedupe_alignment_rows(batches, source_text, target_text, pairs, batch_size):
+	"""
+	Second pass of the deduplication of alignment rows: collapses the rows whose normalized source and target texts
+	are identical. The first row of each pair (with its segment ids) is written as soon as it is read, and the following
+	ones are skipped. Pairs are identified by the hash of their normalized texts, so the memory used depends on the
+	number of distinct pairs, not on the number of rows nor on the length of the texts.
+
+	Args:
+		param1 batches (iterable): lists of alignment rows, the same ones that were counted.
+		param2 source_text (int): position of the source text in the rows.
+		param3 target_text (int): position of the target text in the rows.
+		param4 pairs (dict): the occurrences and surveys of each pair (see count_alignment_pairs()), consumed by this pass.
+		param5 batch_size (int): the number of rows of the batches produced.
+
+	Returns: 
+
+		A generator of lists of rows, in the order of their first occurrence, followed by the number of occurrences 
+		of the pair and the ids of the surveys where it occurs (comma separated).
+	"""
+	first_rows = []
+	for rows in batches:
+		for row in rows:
+			pair = pairs.pop(get_alignment_pair_key(row, source_text, target_text), None)
+			if pair is None:
+				continue
+			first_rows.append(tuple(row)+(pair[0], ', '.join(pair[1])))
+			if len(first_rows) == batch_size:
+				yield first_rows
+				first_rows = []
+	if first_rows:
+		yield first_rows
+
+def stream_export(query, write, filename, content_type, dedupe=None):
+	"""
+	Streams an export of the results of a query. The rows are read from a server-side cursor in batches of EXPORT_BATCH_SIZE rows
+	and written to the response as soon as they are read, so the memory used does not depend on the size of the export.
+	The first batch is read before answering, so an empty export can still be reported to the user. The response body is
+	generated after the view returns, so it keeps the request context (see flask.stream_with_context()).
+	Deduplicated alignment exports read the query twice, in the same REPEATABLE READ transaction (see open_snapshot_connection()),
+	so both passes see the same rows: the pairs are counted first (see count_alignment_pairs()), and then written
+	(see dedupe_alignment_rows()). The first pass reads the whole export before answering, so no byte is sent until it ends.
+
+	Args:
+		param1 query (SearchQuery): the query of the export.
+		param2 write (function): receives the batches of rows (lists) and yields the chunks of the file (bytes).
+		param3 filename (string): the name of the downloaded file.
+		param4 content_type (string): the content type of the file.
+		param5 dedupe (tuple): for alignment exports, the positions of the source text, the target text and the target segment id
+		in the rows, to collapse the identical source/target pairs, adding their number of occurrences and their surveys.
+
+	Returns: 
+		
+		A streamed attachment response, or None if the query has no results.
+	"""
+	batch_size = app.config['EXPORT_BATCH_SIZE']
+	connection = None
+	first_batch = None
+	try:
+		if dedupe:
+			connection = open_snapshot_connection()
+			pairs = count_alignment_pairs(stream_query(query, batch_size, connection), *dedupe)
+			batches = dedupe_alignment_rows(stream_query(query, batch_size, connection), dedupe[0], dedupe[1], pairs, batch_size)
+		else:
+			batches = stream_query(query, batch_size)
+		first_batch = next(batches, None)
+	finally:
+		if first_batch is None and connection is not None:
+			connection.close()
+	if first_batch is None:
+		return None
+
+	def generate():
+		try:
+			for chunk in write(itertools.chain([first_batch], batches)):
+				yield chunk
+		finally:
+			batches.close()
+			if connection is not None:
+				connection.close()
+
+	resp = app.response_class(stream_with_context(generate()))
+	resp.headers["Content-Disposition"] = "attachment; filename="+filename
+	resp.headers["Content-Type"] = content_type
+
+	return resp
+
+def get_alignment_pair_columns(labels):
+	"""
+	Gets the positions of the source text, the target text and the target segment id in the rows of an alignment export,
+	used to deduplicate its pairs (see stream_export()).
+	"""
+	return labels.index('Source Text'), labels.index('Target Text'), labels.index('target_survey_itemid')
+
+def get_results_writer(export_format, labels, dedupe=False):
+	"""
+	Gets the function that writes the batches of rows of a query as a file in the requested format (see stream_export()).
+
+	Args:
+		param1 export_format (string): 'tsv', 'parquet', 'arrow' or 'feather' (see get_export_format()).
+		param2 labels (list): the labels (strings) of the columns of the query, used as the header of the file.
+		param3 dedupe (boolean): for deduplicated alignment exports, adds the number of occurrences and the surveys of each pair
+		to the columns. The rows must already be deduplicated (see dedupe_alignment_rows()).
+
+	Returns: 
+		
+		A tuple with the function that writes the file, its content type and its extension.
+	"""
+	columns = labels
+	if dedupe:
+		columns = labels+['Occurrences', 'Surveys']
+
+	def write(batches):
+		if export_format == 'tsv':
+			return itertools.chain([rows_to_tsv([columns])], (rows_to_tsv(rows) for rows in batches))
+		return iter_columnar(batches, columns, export_format)
+
+	if export_format == 'tsv':
+		return write, "text/csv", ".tsv"
+	content_type, extension = EXPORT_FORMATS[export_format]
+	return write, content_type, extension
+
+def stream_results_to_csv(query, labels, filename='results.tsv', dedupe=False):
+	"""
+	Streaming version of results_to_csv() (see stream_export()).
+
+	Args:
+		param1 query (SearchQuery): the query of the search (see build_word_search_query()).
+		param2 labels (list): the labels (strings) of the columns of the query, used as the header of the file.
+		param3 filename (string): the name of the downloaded file.
+		param4 dedupe (boolean): for alignment exports, collapses the identical source/target pairs (see stream_export()),
+		adding the number of occurrences and the surveys of each pair.
+
+	Returns: 
+		
+		A streamed attachment response (text/csv type), or None if the search has no results.
+	"""
+	write, content_type, extension = get_results_writer('tsv', labels, dedupe)
+
+	return stream_export(query, write, filename, content_type, get_alignment_pair_columns(labels) if dedupe else None)
+
+def get_export_format(form):
+	"""
+	Gets the file format of a download, from the 'format' field of the submitted form: 'tsv' (default), 'parquet', 'arrow' or 'feather'.
+	If pyarrow is not installed, the columnar formats fall back to TSV.
+
+	Args:
+		param1 form (dict): the submitted form (or query arguments).
+
+	Returns: 
+
+		The export format (string).
+	"""
+	export_format = form.get('format') or 'tsv'
+	if export_format not in EXPORT_FORMATS:
+		return 'tsv'
+	if not columnar_formats_available():
+		flash("Parquet and Arrow downloads are not available, the results were downloaded as TSV.", "warning")
+		return 'tsv'
+	return export_format
+
+def stream_results_export(export_format, query, labels, dedupe=False):
+	"""
+	Streams the results of a query in the requested file format (see stream_results_to_csv() and columnar.iter_columnar()).
+
+	Args:
+		param1 export_format (string): 'tsv', 'parquet', 'arrow' or 'feather' (see get_export_format()).
+		param2 query (SearchQuery): the query of the search.
+		param3 labels (list): the labels (strings) of the columns of the query.
+		param4 dedupe (boolean): for alignment exports, collapses the identical source/target pairs (see stream_export()).
+
+	Returns: 
+		
+		A streamed attachment response, or None if the search has no results.
+	"""
+	write, content_type, extension = get_results_writer(export_format, labels, dedupe)
+
+	return stream_export(query, write, "results"+extension, content_type, get_alignment_pair_columns(labels) if dedupe else None)
+
+def results_export(df, export_format):
+	"""
+	Outputs the results of a search, already computed as a dataframe, in the requested file format.
+
+	Args:
+		param1 df (dataframe): a pandas dataframe containing the results of the search query.
+		param2 export_format (string): 'tsv', 'parquet', 'arrow' or 'feather' (see get_export_format()).
+
+	Returns: 
+		
+		An attachment response.
+	"""
+	if export_format == 'tsv':
+		return results_to_csv(df)
+
+	data, content_type, extension = get_dataframe_export(df, export_format)
+	resp = make_response(data)
+	resp.headers["Content-Disposition"] = "attachment; filename=results"+extension
+	resp.headers["Content-Type"] = content_type
+
+	return resp
+
+def get_dataframe_export(df, export_format):
+	"""
+	Writes the results of a search, already computed as a dataframe, as a file in the requested format.
+
+	Args:
+		param1 df (dataframe): a pandas dataframe containing the results of the search query.
+		param2 export_format (string): 'tsv', 'parquet', 'arrow' or 'feather' (see get_export_format()).
+
+	Returns: 
+		
+		A tuple with the file (bytes), its content type and its extension.
+	"""
+	if export_format == 'tsv':
+		return df.to_csv(sep='\t', encoding='utf-8-sig', index=False).encode('utf-8'), "text/csv", ".tsv"
+
+	content_type, extension = EXPORT_FORMATS[export_format]
+	return dataframe_to_columnar(df, export_format), content_type, extension
+
 def results_to_csv(df):
 	"""
 	Outputs the results derived from the search query as CSV file with tab separators.
@@ -210,6 +625,47 @@ def results_to_csv(df):
 
 	return resp
 
+def get_page(form):
+	"""
+	Gets the page of results requested in a search form. The cursor, direction and page size are sent back by the
+	navigation buttons of the results page (display_table.html), together with the original search fields.
+
+	Args:
+		param1 form (dict): the submitted form.
+
+	Returns: 
+
+		The requested page (Page).
+	"""
+	try:
+		size = int(form.get('page_size') or app.config['PAGE_SIZE'])
+	except (ValueError, TypeError):
+		size = app.config['PAGE_SIZE']
+	size = max(1, min(size, app.config['MAX_PAGE_SIZE']))
+
+	return Page(form.get('cursor') or None, form.get('direction') or 'next', size)
+
+def render_results_page(df, maintitle, title):
+	"""
+	Renders a page of results, with the navigation buttons to the previous and next pages. 
+	The total number of results is also sent in the X-Total-Count header.
+	
+	Args:
+		param1 df (dataframe): a pandas dataframe containing a page of results of the search query.
+		param2 maintitle (string): the title of the page.
+		param3 title (string): the title shown above the results.
+
+	Returns: 
+		
+		The response with the rendered page.
+	"""
+	page = df.attrs.get('page')
+	resp = make_response(render_template('display_table.html', maintitle=maintitle, table=df.to_html(), title=title, page=page))
+	if page:
+		resp.headers["X-Total-Count"] = str(page['total'])
+
+	return resp
+
 def hash_password(password): 
 	"""
 	Hashes the password informed by the user, so it is not visible in the users table.
@@ -255,46 +711,6 @@ def get_item_name_intersection(dataframes):
 	intersection_item_names = set.intersection(*unique_item_names)
 	return sorted(intersection_item_names)
 
-def label_item_order(row):
-	return int(row['survey_itemid'].split('_')[-1])
-
-def manipulate_results_dataframe(dataframes):
-	updated_dfs = []
-
-	unique_item_names = []
-	for df in dataframes:
-		item_names = df.item_name.unique()
-		item_names = [x.lower() for x in item_names]
-		unique_item_names.append(set(item_names))
-
-	intersection_item_names = set.intersection(*unique_item_names)
-	intersection_item_names = sorted(intersection_item_names)
-
-	dfs = []
-	for item_name in intersection_item_names:
-
-		for i, df in enumerate(dataframes):
-			df_by_item_name= df[df['item_name'].str.lower()==item_name.lower()]
-			fn = lambda row: label_item_order(row)
-			col = df_by_item_name.apply(fn, axis=1)
-			df_by_item_name = df_by_item_name.assign(item_order=col.values)
-			df_by_item_name = df_by_item_name.sort_values(by='item_order')
-			del df_by_item_name['item_order']
-
-			if i==0:
-				df_partial = df_by_item_name
-			else:
-				df_partial =  pd.concat([df_partial.reset_index(drop=True), df_by_item_name.reset_index(drop=True)], axis = 1)
-
-
-		
-		dfs.append(df_partial)
-
-	result = pd.concat(dfs)
-
-
-	return result
-
 def define_export_name(language_country, language, study, year):
 	"""
 	Defines the name of the export, based on the filters that the user applied.
@@ -321,4 +737,11 @@ def define_export_name(language_country, language, study, year):
 		if year != 'No filter':
 			name = name +'_'+year
 
+	else:
+		name = 'MCSQ'
+		if study != 'No filter':
+			name = name +'_'+study
+		if year != 'No filter':
+			name = name +'_'+year
+
 	return name
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""
+Benchmark of the side by side alignment of compared questionnaires (comparison.manipulate_results_dataframe())
+against the loop based implementation it replaced.
+
+Synthetic questionnaires are generated as they are returned by the compare searches (survey_itemid, Text, item_name
+and item_type columns): every questionnaire has the same items, with some items missing, some with extra segments and
+some item names in a different case, and the rows come in no particular order. Both implementations are timed and
+their outputs are checked to be identical.
+
+Usage:
+	python benchmarks/compare_alignment.py --languages 8 --items 5000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from MCSQ_interface.comparison import manipulate_results_dataframe
+
+COUNTRY_LANGUAGES = ['ENG_GB', 'CAT_ES', 'SPA_ES', 'FRE_FR', 'GER_DE', 'POR_PT', 'RUS_RU', 'CZE_CZ', 'NOR_NO', 'ENG_IE']
+
+ITEM_TYPES = ['INTRODUCTION', 'INSTRUCTION', 'REQUEST', 'RESPONSE']
+
+
+def legacy_manipulate_results_dataframe(dataframes):
+	"""
+	The implementation replaced by comparison.manipulate_results_dataframe(), used as reference.
+	"""
+	unique_item_names = []
+	for df in dataframes:
+		item_names = df.item_name.unique()
+		item_names = [x.lower() for x in item_names]
+		unique_item_names.append(set(item_names))
+
+	intersection_item_names = set.intersection(*unique_item_names)
+	intersection_item_names = sorted(intersection_item_names)
+
+	dfs = []
+	for item_name in intersection_item_names:
+		for i, df in enumerate(dataframes):
+			df_by_item_name = df[df['item_name'].str.lower()==item_name.lower()]
+			col = df_by_item_name.apply(lambda row: int(row['survey_itemid'].split('_')[-1]), axis=1)
+			df_by_item_name = df_by_item_name.assign(item_order=col.values)
+			df_by_item_name = df_by_item_name.sort_values(by='item_order')
+			del df_by_item_name['item_order']
+
+			if i==0:
+				df_partial = df_by_item_name
+			else:
+				df_partial = pd.concat([df_partial.reset_index(drop=True), df_by_item_name.reset_index(drop=True)], axis = 1)
+
+		dfs.append(df_partial)
+
+	return pd.concat(dfs)
+
+
+def generate_questionnaires(languages, items, seed):
+	"""
+	Generates one dataframe per language. Items have 1 to 4 segments; each language drops about 2% of the items,
+	adds an extra segment to about 5% of them and lowercases about 10% of the item names.
+	"""
+	generator = random.Random(seed)
+	segments_by_item = [generator.randint(1, 4) for _ in range(items)]
+
+	dataframes = []
+	for country_language in COUNTRY_LANGUAGES[:languages]:
+		rows = []
+		order = 0
+		for item, segments in enumerate(segments_by_item):
+			if generator.random() < 0.02:
+				continue
+			if generator.random() < 0.05:
+				segments = segments+1
+			item_name = 'Q'+str(item)
+			if generator.random() < 0.1:
+				item_name = item_name.lower()
+			for segment in range(segments):
+				order += 1
+				rows.append({'survey_itemid': 'ESS_R09_2018_'+country_language+'_'+str(order),
+				'Text': 'Segment '+str(segment)+' of item '+str(item)+' in '+country_language,
+				'item_name': item_name, 'item_type': ITEM_TYPES[segment % len(ITEM_TYPES)]})
+		generator.shuffle(rows)
+		dataframes.append(pd.DataFrame.from_dict(rows))
+
+	return dataframes
+
+
+def time_function(function, dataframes, repeat):
+	"""
+	Runs an implementation several times and returns its last result and the median time in seconds.
+	"""
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		result = function(dataframes)
+		times.append(time.perf_counter() - start)
+
+	return result, statistics.median(times)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--languages', type=int, default=8, help='number of compared questionnaires (at most '+str(len(COUNTRY_LANGUAGES))+')')
+	parser.add_argument('--items', type=int, default=5000, help='number of items per questionnaire')
+	parser.add_argument('--repeat', type=int, default=3, help='runs per implementation, the median is reported')
+	parser.add_argument('--seed', type=int, default=1)
+	args = parser.parse_args()
+
+	dataframes = generate_questionnaires(min(args.languages, len(COUNTRY_LANGUAGES)), args.items, args.seed)
+	print('Aligning '+str(len(dataframes))+' questionnaires with '+str(sum(len(df) for df in dataframes))+' segments')
+
+	legacy, legacy_time = time_function(legacy_manipulate_results_dataframe, dataframes, args.repeat)
+	vectorized, vectorized_time = time_function(manipulate_results_dataframe, dataframes, args.repeat)
+
+	pd.testing.assert_frame_equal(vectorized, legacy)
+	print('Outputs are identical ('+str(len(vectorized))+' rows)')
+	print('{:<12} {:>10}'.format('', 'seconds'))
+	print('{:<12} {:>10.3f}'.format('loop', legacy_time))
+	print('{:<12} {:>10.3f}'.format('vectorized', vectorized_time))
+	print('speedup: {:.1f}x'.format(legacy_time/vectorized_time))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,89 @@
+"""
+Benchmark of the collocations computed from the n-gram count indexes (ngrams.merge_ngram_counts() and get_top_ngrams())
+against the NLTK collocation finders (ngrams.find_collocations()), which were used for every request before.
+
+A synthetic tokenized corpus is generated as it is stored in the token store (arrays of token ids per survey item,
+with a Zipf-like token distribution), split into questionnaires, and indexed with ngrams.build_ngram_index().
+For each query word, the survey items containing it are selected in all the questionnaires and the top bigrams and
+trigrams are computed both ways. The median latency of each is reported, and the collocations are checked to be identical.
+The time of the search query that finds the survey items is not included, as it is the same for both.
+
+Usage:
+	python benchmarks/ngram_collocations.py --items 1000000 --questionnaires 40
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from MCSQ_interface.ngrams import NGRAM_SIZES, build_ngram_index, count_ngrams, merge_ngram_counts, get_top_ngrams, find_collocations
+
+
+def generate_corpus(items, questionnaires, vocabulary_size, seed):
+	"""
+	Generates the questionnaires, as lists of (survey_itemid, token ids) of 4 to 30 tokens.
+	"""
+	generator = np.random.default_rng(seed)
+	corpus = []
+	for q in range(questionnaires):
+		n = items // questionnaires
+		lengths = generator.integers(4, 31, n)
+		tokens = np.minimum(generator.zipf(1.3, int(lengths.sum())), vocabulary_size)
+		documents = np.split(tokens, np.cumsum(lengths)[:-1])
+		corpus.append([('SYN_R01_2020_Q'+str(q)+'_'+str(i+1), document.tolist()) for i, document in enumerate(documents)])
+	return corpus
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--items', type=int, default=1000000, help='number of survey items')
+	parser.add_argument('--questionnaires', type=int, default=40, help='number of questionnaires the items are split into')
+	parser.add_argument('--vocabulary', type=int, default=50000, help='number of distinct tokens')
+	parser.add_argument('--words', type=int, nargs='+', default=[20, 100, 1000], help='token ids of the query words (lower is more frequent)')
+	parser.add_argument('--n-collocations', type=int, default=10)
+	parser.add_argument('--repeat', type=int, default=5, help='runs per query, the median is reported')
+	parser.add_argument('--seed', type=int, default=1)
+	args = parser.parse_args()
+
+	print('Generating '+str(args.items)+' survey items...')
+	corpus = generate_corpus(args.items, args.questionnaires, args.vocabulary, args.seed)
+	start = time.perf_counter()
+	indexes = [build_ngram_index([x[0] for x in questionnaire], [x[1] for x in questionnaire]) for questionnaire in corpus]
+	print('Indexed in {:.1f} s'.format(time.perf_counter()-start))
+
+	words = {tokenid: 'w'+str(tokenid) for tokenid in range(args.vocabulary+1)}
+	decode = lambda documents: [[words[tokenid] for tokenid in document] for document in documents]
+
+	print('{:<8} {:<8} {:>10} {:>12} {:>12}'.format('word', 'measure', 'items', 'nltk (ms)', 'index (ms)'))
+	for word in args.words:
+		selected = [[x for x in questionnaire if word in x[1]] for questionnaire in corpus]
+		rows = [np.searchsorted(index['survey_itemids'], np.array([x[0] for x in items], dtype=str)) for index, items in zip(indexes, selected)]
+		documents = [x[1] for items in selected for x in items]
+
+		for measure, size in NGRAM_SIZES.items():
+			nltk_times = []
+			for _ in range(args.repeat):
+				start = time.perf_counter()
+				expected = find_collocations(decode(documents), measure, args.n_collocations)
+				nltk_times.append((time.perf_counter()-start)*1000)
+
+			index_times = []
+			for _ in range(args.repeat):
+				start = time.perf_counter()
+				counted = [count_ngrams(index, r, size) for index, r in zip(indexes, rows) if len(r)]
+				keys, counts = merge_ngram_counts(counted, args.n_collocations)
+				collocations = get_top_ngrams(keys, counts, args.n_collocations, size, decode)
+				index_times.append((time.perf_counter()-start)*1000)
+
+			assert collocations == expected, (word, measure, collocations, expected)
+			print('{:<8} {:<8} {:>10} {:>12.1f} {:>12.1f}'.format('w'+str(word), measure, len(documents),
+				statistics.median(nltk_times), statistics.median(index_times)))
+
+	print('Collocations are identical.')
+
+
+if __name__ == '__main__':
+	main()
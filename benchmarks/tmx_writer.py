@@ -0,0 +1,105 @@
+"""
+Benchmark of the streaming TMX writer (tmx.iterTMX()) against the ElementTree based writer it replaced.
+
+A synthetic translation memory with one million aligned segments is generated in batches, as they are read from
+the server-side cursor by /createtmx, and written by both implementations. The time and peak Python memory of each
+writer are reported, and the outputs are checked to be byte for byte identical.
+
+Usage:
+	python benchmarks/tmx_writer.py --segments 1000000 --batch-size 5000
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import time
+import tracemalloc
+from xml.etree import ElementTree as ET
+from xml.etree.ElementTree import Element, SubElement
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from MCSQ_interface.tmx import iterTMX
+
+SOURCE_TEXTS = ['How satisfied are you with the present state of the economy in [country]?',
+'Please use this card to answer.', 'Would you say that most people can be trusted, or that you can\'t be too careful?',
+'Extremely dissatisfied', 'Extremely satisfied', '(Don\'t know)', 'Health & social care <services>', '']
+
+TARGET_TEXTS = ['¿En qué medida está usted satisfecho con la situación actual de la economía en España?',
+'Utilice esta tarjeta para responder.', 'Насколько вы удовлетворены нынешним состоянием экономики в России?',
+'Extrêmement insatisfait', 'Äußerst zufrieden', '(Não sabe)', 'Salut i serveis socials <serveis>', '']
+
+
+def generate_batches(segments, batch_size, seed):
+	"""
+	Generates the aligned segments in batches of rows with the source text, source id, target text and target id.
+	"""
+	generator = random.Random(seed)
+	for start in range(0, segments, batch_size):
+		rows = []
+		for i in range(start, min(start+batch_size, segments)):
+			rows.append((generator.choice(SOURCE_TEXTS), 'ESS_R09_2018_ENG_SOURCE_'+str(i),
+			generator.choice(TARGET_TEXTS), 'ESS_R09_2018_SPA_ES_'+str(i)))
+		yield rows
+
+
+def write_elementtree(batches, srclang, targetlang):
+	"""
+	The previous implementation of createTMX(): builds the whole tree, then serializes it.
+	"""
+	root = Element('tmx')
+	root.set('version', '1.4')
+	header = SubElement(root, 'header')
+	for name, value in [('creationtool', ''), ('creationtoolversion', ''), ('segtype', 'phrase'), ('o-tmf', ''),
+	('adminlang', 'en'), ('srclang', srclang), ('datatype', 'PlainText'), ('o-encoding', 'UTF-8')]:
+		header.set(name, value)
+	body = SubElement(root, 'body')
+	for rows in batches:
+		for row in rows:
+			tu = SubElement(body, 'tu')
+			for lang, text, segment_id in [(srclang, row[0], row[1]), (targetlang, row[2], row[3])]:
+				tuv = SubElement(tu, 'tuv')
+				tuv.set('xml:lang', lang)
+				seg = SubElement(tuv, 'seg')
+				seg.text = text
+				seg.set('id', segment_id if text else '')
+
+	yield ET.tostring(root)
+
+
+def run(name, writer, args):
+	"""
+	Runs a writer over the synthetic memory, hashing the output as it is produced (as a client would consume it).
+	"""
+	digest = hashlib.sha256()
+	size = 0
+	tracemalloc.start()
+	start = time.perf_counter()
+	for chunk in writer(generate_batches(args.segments, args.batch_size, args.seed), 'en', 'spa'):
+		digest.update(chunk)
+		size += len(chunk)
+	elapsed = time.perf_counter() - start
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+
+	print(f"{name:<14} {elapsed:>9.2f} s {size/elapsed/1024/1024:>9.1f} MB/s {peak/1024/1024:>10.1f} MB peak")
+	return digest.hexdigest()
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--segments', type=int, default=1000000)
+	parser.add_argument('--batch-size', type=int, default=5000)
+	parser.add_argument('--seed', type=int, default=2020)
+	parser.add_argument('--skip-elementtree', action='store_true', help='only run the streaming writer')
+	args = parser.parse_args()
+
+	print(f"{args.segments} segments, batches of {args.batch_size}")
+	streaming = run('streaming', iterTMX, args)
+	if not args.skip_elementtree:
+		elementtree = run('elementtree', write_elementtree, args)
+		print('identical output' if streaming == elementtree else 'OUTPUTS DIFFER')
+
+
+if __name__ == '__main__':
+	main()
@@ -20,3 +20,40 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False
     SQLALCHEMY_RECORD_QUERIES = False
+    # Search result cache
+    RESULT_CACHE_MAX_BYTES = 256*1024*1024
+    RESULT_CACHE_TTL = 3600
+    RESULT_CACHE_VERSION_CHECK_INTERVAL = 30
+    # Metadata cache (filtering options, surveys and modules)
+    METADATA_REFRESH_INTERVAL = 60
+    # Pagination of the results pages
+    PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+    # Streaming exports (rows read from the server-side cursor at a time)
+    EXPORT_BATCH_SIZE = 5000
+    # Precomputed export artifacts (flask build-export-artifacts)
+    EXPORT_ARTIFACT_DIR = os.getenv('EXPORT_ARTIFACT_DIR', join(dirname(__file__), 'export_artifacts'))
+    EXPORT_ARTIFACT_COMPRESSION_LEVEL = 6
+    # Precomputed item matrices for the whole questionnaire comparisons (flask build-item-matrices)
+    ITEM_MATRIX_DIR = os.getenv('ITEM_MATRIX_DIR', join(dirname(__file__), 'item_matrices'))
+    # Precomputed n-gram count indexes for the collocations (flask build-ngram-indexes)
+    NGRAM_INDEX_DIR = os.getenv('NGRAM_INDEX_DIR', join(dirname(__file__), 'ngram_indexes'))
+    # Negotiated compression (gzip, zstd) of the downloads and results pages
+    RESPONSE_COMPRESSION = True
+    RESPONSE_COMPRESSION_GZIP_LEVEL = 6
+    RESPONSE_COMPRESSION_ZSTD_LEVEL = 3
+    RESPONSE_COMPRESSION_MIN_SIZE = 1024
+    # JSON API (/api/v1) bearer tokens, also used to sign the password reset tokens
+    JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', os.getenv('SECRET_KEY'))
+    API_TOKEN_EXPIRES_HOURS = 24
+    # Batch searches (/api/v1/batch)
+    BATCH_MAX_SEARCHES = 200
+    BATCH_MAX_WORKERS = 4
+    BATCH_QUERY_TIMEOUT = 30
+    # Background jobs (whole questionnaire comparisons, big downloads and collocations).
+    # JOB_MAX_WORKERS is the size of the worker pool of each web process, not of the whole server
+    JOB_MAX_WORKERS = 2
+    JOB_RESULT_DIR = os.getenv('JOB_RESULT_DIR', join(dirname(__file__), 'job_results'))
+    JOB_RESULT_TTL = 24*3600
+    JOB_STALE_AFTER = 6*3600
+    JOB_PYTHON_EXECUTABLE = os.getenv('JOB_PYTHON_EXECUTABLE')